@@ -1,14 +1,21 @@
+import os
 import sys
 import time
+import json
 import pickle
 import argparse
 from PySide6.QtWidgets import QApplication
 
-from src.collect_events import collect_events
-from src.utils import get_contract, check_data_exists
+from src.collect_events import collect_events, collect_pool_snapshot
+from src.utils import get_contract
+from src.event_store import EventStore
+from src.exact_math import MAX_UINT256
+from src.sweep import run_shards, run_sweep, walk_forward, write_results
 
 from src.gui import MainWindow
+from src.backtest import Backtest
 from src.strategy import Strategy
+from src.live_feed import LiveFeed
 from src.provider import Provider
 from src.protocol_state import ProtocolState
 from src.position_manager import PositionManager
@@ -63,6 +70,65 @@ def main():
         help="Specify the last block to be used for backtesting."
     )
 
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=4,
+        help="Specify the number of concurrent requests used to collect the data."
+    )
+
+    parser.add_argument(
+        "--confirmations",
+        type=int,
+        default=2,
+        help="Specify the number of blocks on top of a block before its events are used live (default: 2)."
+    )
+
+    parser.add_argument(
+        "--urgency",
+        type=str,
+        choices=["low", "normal", "high"],
+        default="normal",
+        help="Specify the urgency of the transactions, sets the priority fee from the fees paid in the recent blocks (default: normal)."
+    )
+
+    parser.add_argument(
+        "--approve_unlimited",
+        action="store_true",
+        help="Approve the router and the position manager once for an unlimited amount of the tokens instead of every swap and mint."
+    )
+
+    parser.add_argument(
+        "--sweep",
+        type=str,
+        help="Backtest every combination of the strategy parameters in the given JSON file ({name: [values]}) and save a results table."
+    )
+
+    parser.add_argument(
+        "--processes",
+        type=int,
+        help="Specify the number of processes used for a sweep (default: all cores)."
+    )
+
+    parser.add_argument(
+        "--shards",
+        type=int,
+        default=1,
+        help="Split the blocks of a sweep into this many shards that are backtested in parallel."
+    )
+
+    parser.add_argument(
+        "--warmup_blocks",
+        type=int,
+        help="Specify the number of blocks replayed before every shard to fill the history of the strategy (default: its lookback)."
+    )
+
+    parser.add_argument(
+        "--walk_forward",
+        action="store_true",
+        help="Evaluate the best configuration of every shard on the next shard."
+    )
+
     parser.add_argument(
         "--save_performance",
         type=str,
@@ -71,29 +137,75 @@ def main():
 
     args = parser.parse_args()
 
+    if args.sweep and not args.backtest:
+        parser.error("--sweep requires --backtest.")
+
+    if args.walk_forward and (not args.sweep or args.shards < 2):
+        parser.error("--walk_forward requires --sweep and at least 2 --shards.")
+
     if args.backtest:
         if args.from_block is None or args.to_block is None:
             parser.error("--backtest requires --from_block and --to_block.")
         
         print("Running in backtest mode")
 
-        data_exists = check_data_exists(int(args.from_block), int(args.to_block), args.pool_address)
-
-        if not data_exists:
+        # only the block ranges that are not in the event store yet are collected
+        if not EventStore(f"data/{args.pool_address}").covers(int(args.from_block), int(args.to_block)):
             print("Collecting data...")
-            collect_events(get_contract("POOL", args.pool_address), int(args.from_block), int(args.to_block))
+            collect_events(get_contract("POOL", args.pool_address), int(args.from_block), int(args.to_block), max_workers=args.workers)
+
+        # pool state right before the first block -> replayed locally from the events
+        pool_snapshot = f"data/{args.pool_address}/snapshot_{int(args.from_block) - 1}.json"
+
+        if not os.path.isfile(pool_snapshot):
+            print("Collecting pool snapshot...")
+            collect_pool_snapshot(get_contract("POOL", args.pool_address), int(args.from_block) - 1)
     else:
         print("Running in normal mode")
+
+        pool_snapshot = None
+
+    if args.sweep:
+
+        with open(args.sweep) as f:
+            grid = json.load(f)
+
+        provider_kwargs = {"pool_address": args.pool_address, "network": args.network, "backtest": True, "event_store": f"data/{args.pool_address}", "pool_snapshot": pool_snapshot, "from_block": int(args.from_block), "to_block": int(args.to_block)}
+
+        results_path = (args.save_performance or f"sweep_{args.from_block}_{args.to_block}") + ".csv"
+
+        if args.walk_forward:
+            results = walk_forward(run_shards(provider_kwargs, grid, args.shards, args.warmup_blocks, max_workers=args.processes))
+            write_results(results, results_path, sort_by=None)
+
+            print(f"Saved the walk-forward results of {len(results)} shards to {results_path}")
+            return
+
+        results = run_sweep(provider_kwargs, grid, args.shards, args.warmup_blocks, max_workers=args.processes)
+        write_results(results, results_path)
+
+        print(f"Saved the results of {len(results)} configurations to {results_path}")
+        return
     
-    provider = Provider(args.pool_address, args.network, sim=args.simulate, backtest=args.backtest, swap_data=f"data/{args.pool_address}/Swap.csv", mint_data=f"data/{args.pool_address}/Mint.csv", burn_data=f"data/{args.pool_address}/Burn.csv")
-    state = ProtocolState(provider)
+    provider = Provider(args.pool_address, args.network, sim=args.simulate, backtest=args.backtest, event_store=f"data/{args.pool_address}", pool_snapshot=pool_snapshot, call_cache=f"data/{args.pool_address}/call_cache.sqlite" if args.backtest else None, from_block=int(args.from_block) if args.backtest else None, to_block=int(args.to_block) if args.backtest else None, fee_urgency=args.urgency, approval_ceiling=MAX_UINT256 if args.approve_unlimited else None)
+    state = ProtocolState(provider, confirmations=args.confirmations)
     position_manager = PositionManager(provider, state)
     strategy = Strategy(provider, state, position_manager)
 
-    state.start()
-    strategy.start()
+    if args.backtest:
+        backtest = Backtest(provider, state, strategy)
+    else:
+        # pushes the new events into the state as they are mined
+        feed = LiveFeed(provider, state)
 
     if args.gui:
+
+        if args.backtest:
+            backtest.start()
+        else:
+            feed.start()
+            strategy.start()
+
         app = QApplication(sys.argv)
 
         window = MainWindow(provider, state, position_manager, backtest=args.backtest)
@@ -103,8 +215,11 @@ def main():
 
         exit_code = app.exec()
 
-        strategy.stop()
-        state.stop()
+        if args.backtest:
+            backtest.stop()
+        else:
+            strategy.stop()
+            feed.stop()
 
         if args.save_performance:
             with open(args.save_performance + ".pkl", "wb") as f:
@@ -112,20 +227,19 @@ def main():
 
         sys.exit(exit_code)
 
-    else:
-        while True:
+    elif args.backtest:
 
-            if args.backtest and state.current_block == -1:
+        backtest.run()
 
-                state.stop()
-                strategy.stop()
-
-                if args.save_performance:
-                    with open(args.save_performance + ".pkl", "wb") as f:
-                        pickle.dump(position_manager.performance, f)
+        if args.save_performance:
+            with open(args.save_performance + ".pkl", "wb") as f:
+                pickle.dump(position_manager.performance, f)
 
-                break
+    else:
+        feed.start()
+        strategy.start()
 
+        while True:
             time.sleep(20)
 
 if __name__ == "__main__":
@@ -0,0 +1,158 @@
+import logging
+import threading
+from typing import Optional
+
+from web3 import Web3
+
+from .transaction_manager import TransactionManager, PendingTransaction
+
+APPROVAL_TOPIC = Web3.to_hex(Web3.keccak(text="Approval(address,address,uint256)"))
+
+
+class AllowanceManager:
+
+    """
+    Known ERC20 allowances of the account per (token, spender)
+
+    An allowance is read from the node the first time it is needed and then kept up to date
+    locally: an approval sets it as soon as it is sent (transactions are mined in nonce order),
+    every use subtracts the amount the following transaction may spend and Approval events of
+    the owner in our receipts set it once no other transaction of ours is pending. A failed
+    approval drops the allowance, it is read again the next time.
+
+    An approval sets the allowance to max(amount, ceiling): with a large ceiling a token is
+    approved once and later swaps and mints need neither a call nor an approval transaction.
+    """
+
+    def __init__(self, transactions: TransactionManager, owner, ceiling=None):
+
+        """
+        :param transactions: transaction manager of the owner
+        :param owner: address of the account
+        :param ceiling: allowance to approve at least, only the required amount by default
+        """
+
+        self.transactions = transactions
+        self.owner = owner
+        self.ceiling = ceiling
+
+        # (token address, spender) -> allowance (a lower bound while transactions are pending)
+        self.allowances = {}
+
+        self.lock = threading.Lock()
+
+        self.transactions.receipt_listeners.append(self.update_from_receipt)
+
+        self.logger = logging.getLogger('logger3')
+
+    def allowance(self, contract, spender) -> int:
+
+        key = (contract.address, spender)
+
+        with self.lock:
+            if key in self.allowances:
+                return self.allowances[key]
+
+        allowance = contract.functions.allowance(self.owner, spender).call()
+
+        with self.lock:
+            return self.allowances.setdefault(key, allowance)
+
+    def known(self, token, spender) -> Optional[int]:
+
+        """
+        Allowance of the token (address) for the spender if it is known, without a call
+        """
+
+        with self.lock:
+            return self.allowances.get((token, spender))
+
+    def set_many(self, allowances) -> None:
+
+        """
+        Set allowances read elsewhere, e.g. by a multicall
+
+        :param allowances: (token address, spender) -> allowance
+        """
+
+        with self.lock:
+            self.allowances.update(allowances)
+
+    def ensure(self, contract, spender, amount) -> Optional[PendingTransaction]:
+
+        """
+        Make sure the spender can spend amount of the token in the next transaction
+
+        :return: the pending approval, None if the allowance is already sufficient
+        """
+
+        key = (contract.address, spender)
+        amount = int(amount)
+
+        if self.allowance(contract, spender) >= amount:
+            with self.lock:
+                self.allowances[key] -= amount
+
+            return None
+
+        value = max(amount, int(self.ceiling or 0))
+
+        self.logger.info(f"Approving {value} of {contract.address} for {spender}")
+        approval = self.transactions.submit(contract.functions.approve(spender, value))
+
+        with self.lock:
+            self.allowances[key] = value - amount
+
+        approval.future.add_done_callback(lambda future: self._check_approval(key, future))
+
+        return approval
+
+    def update_from_receipt(self, receipt, transaction=None) -> None:
+
+        """
+        Set the allowances from the Approval events of the owner in a receipt
+        """
+
+        # with pending transactions the event may not include their spending yet
+        if self.transactions.pending:
+            return
+
+        owner = "0x" + self.owner[2:].lower().rjust(64, "0")
+
+        for log in receipt["logs"]:
+            topics = [_to_hex(topic) for topic in log["topics"]]
+
+            if len(topics) != 3 or topics[0] != APPROVAL_TOPIC or topics[1] != owner:
+                continue
+
+            key = (Web3.to_checksum_address(log["address"]), Web3.to_checksum_address("0x" + topics[2][-40:]))
+
+            with self.lock:
+                self.allowances[key] = int.from_bytes(_to_bytes(log["data"]), "big")
+
+    def invalidate(self, contract=None, spender=None) -> None:
+
+        """
+        Forget known allowances (all by default), e.g. after approvals sent from elsewhere
+        """
+
+        with self.lock:
+            self.allowances = {key: allowance for key, allowance in self.allowances.items() if (contract is not None and key[0] != contract.address) or (spender is not None and key[1] != spender)}
+
+    def _check_approval(self, key, future) -> None:
+
+        # reverted or not mined
+        if future.exception() is None:
+            return
+
+        self.logger.info(f"Approval of {key[0]} for {key[1]} failed")
+
+        with self.lock:
+            self.allowances.pop(key, None)
+
+
+def _to_hex(value) -> str:
+    return value.lower() if isinstance(value, str) else Web3.to_hex(value)
+
+def _to_bytes(value) -> bytes:
+    return bytes.fromhex(value[2:]) if isinstance(value, str) else bytes(value)
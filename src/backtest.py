@@ -0,0 +1,80 @@
+import os
+import logging
+import threading
+
+from .provider import Provider
+from .strategy import Strategy
+from .protocol_state import ProtocolState
+
+
+class Backtest:
+
+    """
+    Synchronous backtest driver
+
+    Steps the provider and the protocol state in lockstep, one block at a time and without any
+    sleeps. Every block is ingested exactly once and the state dispatches its events and the
+    block to the strategy, so the result only depends on the replayed data.
+
+    Blocks before trade_from_block are a warm-up: their events are dispatched (history of the
+    strategy) but on_block is not called.
+    """
+
+    def __init__(self, provider: Provider, state: ProtocolState, strategy: Strategy, trade_from_block=None):
+
+        if not provider.backtest:
+            raise ValueError("Backtest driver requires a provider in backtest mode")
+
+        self.provider = provider
+        self.state = state
+        self.strategy = strategy
+
+        self.state.dispatcher.trade_from_block = trade_from_block
+
+        self.running = False
+        self.thread = threading.Thread(target=self.run)
+
+        self.logger = logging.getLogger('logger4')
+        self.logger.setLevel(logging.INFO)
+        # the loggers are shared by all instances, e.g. the backtests of a sweep
+        if not self.logger.handlers:
+            os.makedirs(os.path.dirname('src/logs/backtest.log'), exist_ok=True)
+            handler = logging.FileHandler('src/logs/backtest.log')
+            formatter = logging.Formatter('[%(asctime)s] %(levelname)s: %(message)s')
+            handler.setFormatter(formatter)
+            self.logger.addHandler(handler)
+
+    def run(self) -> None:
+
+        self.running = True
+
+        # the strategy is driven by the events of the state
+        self.strategy.start()
+
+        last_block = self.provider.get_current_block()
+        self.logger.info(f"Starting backtest at block {last_block}")
+
+        while self.running:
+
+            current_block = self.provider.get_current_block()
+
+            # no more data to replay
+            if current_block == -1:
+                break
+
+            self.state.update(last_block, current_block, sync=True)
+            last_block = current_block
+
+        self.strategy.stop()
+
+        self.state.current_block = -1
+        self.running = False
+
+        self.logger.info(f"Finished backtest at block {last_block}")
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.thread.join()
@@ -0,0 +1,68 @@
+class BaseStrategy:
+
+    """
+    Base class of the strategies, driven by the EventDispatcher of the protocol state
+
+    The hooks are called in the thread that ingests the events (the collect thread of the state
+    live and in simulation, the Backtest driver in backtesting mode), after the state has been
+    updated, and exactly once per event. Override the hooks the strategy needs, the others are
+    never called.
+
+    Event rows are in the column layout of the collected events, see event_store.COLUMNS.
+    """
+
+    def __init__(self, provider, state, position_manager):
+
+        self.provider = provider
+        self.state = state
+        self.position_manager = position_manager
+
+    def on_block(self, block) -> None:
+
+        """
+        Called once for every new block of the state, after its events; open and close positions here
+
+        Not called before the first tick is known and during the warm-up of a backtest.
+
+        :param block: current block
+        """
+
+    def on_swap(self, event) -> None:
+
+        """
+        Called for every Swap event, in the order of the events on chain
+        """
+
+    def on_mint(self, event) -> None:
+
+        """
+        Called for every Mint event, in the order of the events on chain
+        """
+
+    def on_burn(self, event) -> None:
+
+        """
+        Called for every Burn event, in the order of the events on chain
+        """
+
+    def on_position_closed(self, index, performance) -> None:
+
+        """
+        Called when the position manager closed a position
+
+        :param index: index of the position in position_manager.positions
+        :param performance: entry of the position in position_manager.performance, None if the
+            position was discarded
+        """
+
+    def start(self) -> None:
+
+        """
+        Subscribe to the events of the state
+        """
+
+        self.state.dispatcher.subscribe(self)
+
+    def stop(self) -> None:
+
+        self.state.dispatcher.unsubscribe(self)
@@ -0,0 +1,124 @@
+import numpy as np
+
+from .ring_buffer import RingBuffer
+
+# Column layout of the swap events
+SWAP_BLOCK_INDEX = 0
+SWAP_TICK_INDEX = 1
+SWAP_AMOUNT0_INDEX = 4
+SWAP_AMOUNT1_INDEX = 5
+
+
+class BlockBars:
+
+    """
+    OHLC bars of the pool tick and the swapped volume per bucket of `resolution` blocks
+
+    The bars are updated incrementally from the swap events as they arrive. Only buckets that
+    contain at least one swap get a bar, the most recent bar stays open until a swap of a later
+    bucket arrives.
+    """
+
+    BLOCK_INDEX = 0     # first block of the bucket
+    OPEN_INDEX = 1
+    HIGH_INDEX = 2
+    LOW_INDEX = 3
+    CLOSE_INDEX = 4
+    VOLUME0_INDEX = 5   # sum of the absolute token0 amounts
+    VOLUME1_INDEX = 6   # sum of the absolute token1 amounts
+    SWAPS_INDEX = 7     # number of swaps
+
+    COLUMNS = 8
+
+    def __init__(self, resolution, capacity=5000):
+
+        self.resolution = resolution
+        self.buffer = RingBuffer(capacity, self.COLUMNS)
+
+    def __len__(self):
+        return len(self.buffer)
+
+    def update(self, swap_events) -> None:
+
+        """
+        Add swap events (sorted by block) to the bars
+
+        :param swap_events: rows in the column layout of the collected swap events
+        """
+
+        if len(swap_events) == 0:
+            return
+
+        swap_events = np.asarray(swap_events, dtype=np.float64)
+
+        buckets = swap_events[:, SWAP_BLOCK_INDEX] // self.resolution * self.resolution
+        ticks = swap_events[:, SWAP_TICK_INDEX]
+        volume0 = np.abs(swap_events[:, SWAP_AMOUNT0_INDEX])
+        volume1 = np.abs(swap_events[:, SWAP_AMOUNT1_INDEX])
+
+        # first row of every bucket
+        starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+        ends = np.r_[starts[1:], len(buckets)] - 1
+
+        bars = np.empty((len(starts), self.COLUMNS))
+        bars[:, self.BLOCK_INDEX] = buckets[starts]
+        bars[:, self.OPEN_INDEX] = ticks[starts]
+        bars[:, self.HIGH_INDEX] = np.maximum.reduceat(ticks, starts)
+        bars[:, self.LOW_INDEX] = np.minimum.reduceat(ticks, starts)
+        bars[:, self.CLOSE_INDEX] = ticks[ends]
+        bars[:, self.VOLUME0_INDEX] = np.add.reduceat(volume0, starts)
+        bars[:, self.VOLUME1_INDEX] = np.add.reduceat(volume1, starts)
+        bars[:, self.SWAPS_INDEX] = ends - starts + 1
+
+        # merge the first bucket into the open bar
+        if len(self.buffer) > 0 and self.buffer[-1][self.BLOCK_INDEX] == bars[0, self.BLOCK_INDEX]:
+            open_bar = self.buffer[-1].copy()
+
+            open_bar[self.HIGH_INDEX] = max(open_bar[self.HIGH_INDEX], bars[0, self.HIGH_INDEX])
+            open_bar[self.LOW_INDEX] = min(open_bar[self.LOW_INDEX], bars[0, self.LOW_INDEX])
+            open_bar[self.CLOSE_INDEX] = bars[0, self.CLOSE_INDEX]
+            open_bar[self.VOLUME0_INDEX] += bars[0, self.VOLUME0_INDEX]
+            open_bar[self.VOLUME1_INDEX] += bars[0, self.VOLUME1_INDEX]
+            open_bar[self.SWAPS_INDEX] += bars[0, self.SWAPS_INDEX]
+
+            self.buffer.replace_last(open_bar)
+            bars = bars[1:]
+
+        self.buffer.extend(bars)
+
+    def rollback(self, block, swap_events) -> None:
+
+        """
+        Remove the swaps of the blocks from `block` on
+
+        :param swap_events: the remaining swap events, the ones of the bucket of the block are
+            added to its bar again
+        """
+
+        bucket = block // self.resolution * self.resolution
+
+        self.buffer.truncate(int(np.count_nonzero(self.buffer.view()[:, self.BLOCK_INDEX] >= bucket)))
+
+        swap_events = np.asarray(swap_events, dtype=np.float64)
+        if len(swap_events) > 0:
+            self.update(swap_events[swap_events[:, SWAP_BLOCK_INDEX] >= bucket])
+
+    def view(self, n=None) -> np.ndarray:
+
+        """
+        Zero-copy view of the last n bars, see RingBuffer.view
+        """
+
+        return self.buffer.view(n)
+
+    def snapshot(self, n=None) -> np.ndarray:
+
+        return self.buffer.snapshot(n)
+
+    def close(self, n=None) -> np.ndarray:
+
+        return self.view(n)[:, self.CLOSE_INDEX]
+
+    def volume(self, n=None) -> np.ndarray:
+
+        return self.view(n)[:, self.VOLUME1_INDEX]
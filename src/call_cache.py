@@ -0,0 +1,99 @@
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+
+
+class CallCache:
+
+    """
+    Cache of contract reads at a fixed block
+
+    Reads at a mined block never change, so they are keyed by (contract, method, args, block).
+    The most recent entries are kept in an in-memory LRU, all entries are optionally persisted in
+    an SQLite database so that repeated backtests over the same range do not hit the node again.
+    Values have to be JSON serializable (ints, bools, strings and lists of them).
+    """
+
+    def __init__(self, max_size=100000, path=None):
+
+        self.max_size = max_size
+        self.entries = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+        self.lock = threading.Lock()
+
+        self.db = None
+        if path:
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute("CREATE TABLE IF NOT EXISTS calls (key TEXT PRIMARY KEY, value TEXT)")
+            self.db.commit()
+
+    @staticmethod
+    def key(function, block_number) -> str:
+
+        """
+        Key of a web3 contract function call at a block
+        """
+
+        return json.dumps([function.address, function.fn_name, list(function.args), int(block_number)])
+
+    def get(self, key):
+
+        """
+        Cached value or None
+        """
+
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+
+            if self.db is not None:
+                row = self.db.execute("SELECT value FROM calls WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    value = json.loads(row[0])
+                    self._insert(key, value)
+                    self.hits += 1
+                    return value
+
+            self.misses += 1
+
+        return None
+
+    def put(self, key, value) -> None:
+
+        self.put_many([(key, value)])
+
+    def put_many(self, items) -> None:
+
+        """
+        Store (key, value) pairs, None values (failed calls) are not cached
+        """
+
+        items = [(key, value) for key, value in items if value is not None]
+
+        with self.lock:
+            for key, value in items:
+                self._insert(key, value)
+
+            if self.db is not None and items:
+                self.db.executemany("INSERT OR REPLACE INTO calls (key, value) VALUES (?, ?)", [(key, json.dumps(value)) for key, value in items])
+                self.db.commit()
+
+    def _insert(self, key, value) -> None:
+
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def close(self) -> None:
+
+        if self.db is not None:
+            self.db.close()
+            self.db = None
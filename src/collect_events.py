@@ -3,33 +3,250 @@ import json
 import math
 import time
 from web3 import Web3
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 
 from src.utils import get_contract
+from src.multicall import Multicall
+from src.event_store import EventStore, event_to_row
+from src.pool_replay import save_snapshot
 
-def collect_events(contract, from_block, to_block, events=["Swap", "Mint", "Burn"]):
+# substrings of the errors nodes return when a getLogs range contains too many results
+TOO_MANY_RESULTS_ERRORS = (
+    "more than",
+    "too many",
+    "too large",
+    "limit exceeded",
+    "response size",
+    "block range",
+    "range is too",
+    "timeout",
+)
+
+def collect_events(contract, from_block, to_block, events=["Swap", "Mint", "Burn"], max_workers=4, window=2000, min_window=10, max_window=100000, fast_response=1.0, retries=5, backfill_rows=100000):
+
+    """
+    Collect the pool events between from_block and to_block (inclusive) into the event store
+
+    Only the block ranges missing from the catalog of the store are fetched. Windows of blocks
+    are fetched concurrently with a single eth_getLogs call for all event types. The window is
+    halved when the node reports too many results and doubled when it answers fast. Windows are
+    committed to the store in block order together with their coverage, so an interrupted run
+    continues right after the last committed window. Windows before already stored events have
+    to be merged in and are committed in chunks of about backfill_rows rows instead.
+
+    :param contract: pool contract
+    :param from_block: first block to collect
+    :param to_block: last block to collect
+    :param events: event types to collect
+    :param max_workers: maximum number of concurrent getLogs requests
+    :param window: initial number of blocks per request
+    :param min_window: window size below which "too many results" errors are not split any further
+    :param max_window: upper bound of the window size
+    :param fast_response: response time in seconds below which the window is doubled
+    :param retries: number of retries of a failing window
+    :param backfill_rows: number of rows after which the windows of a backfilled range are merged into the store
+    """
+
+    store = EventStore(f"data/{contract.address}")
+
+    topics = {event_topic(contract, event_name): event_name for event_name in events}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+
+        for first_block, last_block in store.missing_ranges(from_block, to_block, events):
+
+            # ranges before already stored events are merged in, every merge rewrites the stored columns
+            backfill = any(store.last_block(event_name) is not None and store.last_block(event_name) >= first_block for event_name in events)
+
+            # rows of the windows from chunk[0] on that are not merged in yet
+            chunk = [first_block, {event_name: [] for event_name in events}]
+
+            def commit(start, end, event_rows):
+
+                print(f"{end}/{to_block}")
+
+                if not backfill:
+                    store.append({event_name: event_rows.get(event_name, []) for event_name in events}, covered=(start, end))
+                    return
+
+                for event_name in events:
+                    chunk[1][event_name] += event_rows.get(event_name, [])
+
+                if sum(len(rows) for rows in chunk[1].values()) >= backfill_rows or end == last_block:
+                    store.append(chunk[1], covered=(chunk[0], end))
+                    chunk[:] = [end + 1, {event_name: [] for event_name in events}]
+
+            window = _collect_range(executor, max_workers, contract, topics, first_block, last_block, commit, window, min_window, max_window, fast_response, retries)
+
+def _collect_range(executor, max_workers, contract, topics, first_block, last_block, commit, window, min_window, max_window, fast_response, retries) -> int:
+
+    window = max(min(window, last_block - first_block + 1), 1)
+
+    # start block of a window -> (last block, rows) of the windows that can not be committed yet
+    fetched = {}
+    pending = {}
+
+    next_block = first_block
+    commit_block = first_block
+
+    def submit(start, end, attempt=0, delay=0):
+        future = executor.submit(_fetch_window, contract, topics, start, end, delay)
+        pending[future] = (start, end, attempt)
+
+    while commit_block <= last_block:
+
+        while len(pending) < max_workers and next_block <= last_block:
+            end = min(next_block + window - 1, last_block)
+            submit(next_block, end)
+            next_block = end + 1
+
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+
+        for future in done:
+            start, end, attempt = pending.pop(future)
+
+            try:
+                event_rows, duration = future.result()
+            except Exception as e:
+                if _is_too_many_results(e) and end - start + 1 > min_window:
+                    # split the failed window and continue with smaller ones
+                    middle = (start + end) // 2
+                    submit(start, middle)
+                    submit(middle + 1, end)
+                    window = max((end - start + 1) // 2, min_window)
+                elif attempt < retries:
+                    submit(start, end, attempt + 1, delay=2 ** attempt)
+                else:
+                    for future in pending:
+                        future.cancel()
+                    raise
+                continue
+
+            fetched[start] = (end, event_rows)
+
+            if duration < fast_response:
+                window = min(window * 2, max_window)
+
+        # commit the contiguous windows in block order
+        while commit_block in fetched:
+            end, event_rows = fetched.pop(commit_block)
+            commit(commit_block, end, event_rows)
+            commit_block = end + 1
+
+    return window
+
+def event_topic(contract, event_name) -> str:
+
+    # keccak of the canonical event signature
+    event_abi = next(abi for abi in contract.abi if abi["type"] == "event" and abi["name"] == event_name)
+    signature = f"{event_name}({','.join(abi_input['type'] for abi_input in event_abi['inputs'])})"
+
+    return _topic_hex(Web3.keccak(text=signature))
+
+def _fetch_window(contract, topics, start, end, delay=0):
+
+    if delay > 0:
+        time.sleep(delay)
+
+    started = time.time()
+
+    logs = contract.w3.eth.get_logs({
+        "address": contract.address,
+        "fromBlock": start,
+        "toBlock": end,
+        "topics": [list(topics)],
+    })
+
+    duration = time.time() - started
+
+    event_rows = {event_name: [] for event_name in topics.values()}
+    for log in logs:
+        event_name = topics[_topic_hex(log["topics"][0])]
+        event = contract.events[event_name]().process_log(log)
+        event_rows[event_name].append(event_to_row(event_name, event))
+
+    return event_rows, duration
+
+def _topic_hex(topic) -> str:
+
+    topic = topic if isinstance(topic, str) else topic.hex()
+    return topic if topic.startswith("0x") else "0x" + topic
+
+def _is_too_many_results(error) -> bool:
+
+    message = str(error).lower()
+    return any(pattern in message for pattern in TOO_MANY_RESULTS_ERRORS)
+
+def collect_pool_snapshot(contract, block, word_range=16):
+
+    """
+    Save the state of the pool at the given block as starting point for the local replay
+
+    :param contract: pool contract
+    :param block: block of the snapshot
+    :param word_range: number of tick bitmap words (256 tick spacings each) to fetch on either side of the current tick
+    :return: path of the snapshot file
+    """
 
     # check if data folder exists
     if not os.path.exists(f"data/{contract.address}"):
         os.makedirs(f"data/{contract.address}")
 
-    increment = min(2000, to_block - from_block)
-    for i in range(from_block, to_block, increment):
+    multicall = Multicall()
+    functions = contract.functions
+
+    slot0, liquidity, fee_growth_global_0_x128, fee_growth_global_1_x128 = multicall.aggregate([functions.slot0(), functions.liquidity(), functions.feeGrowthGlobal0X128(), functions.feeGrowthGlobal1X128()], block_identifier=block)
+
+    fee, tick_spacing, token0, token1 = multicall.aggregate([functions.fee(), functions.tickSpacing(), functions.token0(), functions.token1()])
+
+    token0_contract = get_contract("token0", token0)
+    token1_contract = get_contract("token1", token1)
+
+    token0_symbol, token1_symbol, token0_decimals, token1_decimals = multicall.aggregate([token0_contract.functions.symbol(), token1_contract.functions.symbol(), token0_contract.functions.decimals(), token1_contract.functions.decimals()])
+
+    # find the initialized ticks around the current tick using the tick bitmap
+    current_word = (slot0[1] // tick_spacing) >> 8
+    word_positions = range(max(current_word - word_range, -2**15), min(current_word + word_range, 2**15 - 1) + 1)
+
+    bitmaps = multicall.aggregate([functions.tickBitmap(word_position) for word_position in word_positions], block_identifier=block)
 
-        print(f"{i}/{to_block}")
+    initialized_ticks = []
+    for word_position, bitmap in zip(word_positions, bitmaps):
+        for bit in range(256):
+            if bitmap >> bit & 1:
+                initialized_ticks.append(((word_position << 8) + bit) * tick_spacing)
 
-        for event_name in events:
+    tick_states = multicall.aggregate([functions.ticks(tick) for tick in initialized_ticks], block_identifier=block)
+    ticks = {str(tick): tick_state[:4] for tick, tick_state in zip(initialized_ticks, tick_states)}
 
-            event_filter = contract.events[event_name].create_filter(fromBlock=i, toBlock=i+increment)
+    snapshot = {
+        "block": block,
+        "pool": {
+            "address": contract.address,
+            "fee": fee,
+            "tick_spacing": tick_spacing,
+            "token0": token0,
+            "token1": token1,
+            "token0_symbol": token0_symbol,
+            "token1_symbol": token1_symbol,
+            "token0_decimals": token0_decimals,
+            "token1_decimals": token1_decimals,
+        },
+        "sqrt_price_x96": slot0[0],
+        "tick": slot0[1],
+        "fee_protocol": slot0[5],
+        "liquidity": liquidity,
+        "fee_growth_global_0_x128": fee_growth_global_0_x128,
+        "fee_growth_global_1_x128": fee_growth_global_1_x128,
+        "ticks": ticks,
+        # ticks of the fetched bitmap words, the replay raises outside of them
+        "tick_range": [(word_positions[0] << 8) * tick_spacing, ((word_positions[-1] << 8) + 255) * tick_spacing],
+    }
 
-            # get all events that match the filter
-            event_data = event_filter.get_all_entries()
+    path = f"data/{contract.address}/snapshot_{block}.json"
+    save_snapshot(snapshot, path)
 
-            for event in event_data:
-                with open(f"data/{contract.address}/{event_name}.csv", "a") as f:
-                    if event_name == "Swap":
-                        f.writelines(f"{event.blockNumber}, {event.args['tick']}, {event.args['liquidity']}, {event.args['sqrtPriceX96']}, {event.args['amount0']}, {event.args['amount1']}\n")
-                    else:
-                        f.writelines(f"{event.blockNumber}, {event.args['tickLower']}, {event.args['tickUpper']}, {event.args['amount0']}, {event.args['amount1']}\n")
+    return path
 
 
 if __name__ == "__main__":
@@ -5,6 +5,7 @@ addresses = {
     "mainnet" : {
         "NFT_POSITION_MANAGER": "0xC36442b4a4522E871399CD717aBDD847Ab11FE88",
         "UNISWAP_ROUTER": "0xE592427A0AEce92De3Edee1F18E0157C05861564",
+        "MULTICALL": "0xcA11bde05977b3631167028862bE2a173976CA11",
         "WETH": "0xC02aaA39b223FE8D0A0e5C4F27eAD9083C756Cc2",
     },
 
@@ -12,6 +13,7 @@ addresses = {
     "goerli" : {
         "NFT_POSITION_MANAGER": "0xC36442b4a4522E871399CD717aBDD847Ab11FE88",
         "UNISWAP_ROUTER": "0xE592427A0AEce92De3Edee1F18E0157C05861564",
+        "MULTICALL": "0xcA11bde05977b3631167028862bE2a173976CA11",
         "WETH": "0xB4FBF271143F4FBf7B91A5ded31805e42b2208d6",
     },
 
@@ -19,6 +21,7 @@ addresses = {
     "optimism" : {
         "NFT_POSITION_MANAGER": "0xC36442b4a4522E871399CD717aBDD847Ab11FE88",
         "UNISWAP_ROUTER": "0xE592427A0AEce92De3Edee1F18E0157C05861564",
+        "MULTICALL": "0xcA11bde05977b3631167028862bE2a173976CA11",
         "WETH": "0x4200000000000000000000000000000000000006",
     }
 }
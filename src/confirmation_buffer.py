@@ -0,0 +1,202 @@
+import threading
+from typing import List, Optional, Tuple
+
+from web3 import Web3
+
+# (block number, event type, row) of the buffered events
+EVENT_BLOCK = 0
+EVENT_TYPE = 1
+EVENT_ROW = 2
+
+# Column of the log index, the last column of all event types
+LOG_INDEX = -1
+
+
+class ConfirmationBuffer:
+
+    """
+    Live events of the blocks that do not have enough confirmations yet
+
+    The events are keyed by (block hash, log index), so a log that is received twice (e.g. over
+    the websocket and from a catch-up request) is only kept once. A log flagged as removed, a
+    block hash that differs from the known one at the same height or a new set of logs for a
+    block range (polling) replace the events of the reorganized blocks.
+
+    Events are handed out once the head is `confirmations` blocks past their block. Up to then a
+    reorganization only changes the buffer, never the protocol state.
+
+    The keys and block hashes of the last `recheck` confirmed blocks are kept, so a poll of these
+    blocks or a new hash at their height still detects a reorganization deeper than the
+    confirmations. The state then rolls back to the block before it.
+    """
+
+    def __init__(self, decode_log, confirmations=0, recheck=None):
+
+        """
+        :param decode_log: raw log -> (event type, row), e.g. Provider.decode_log
+        :param confirmations: blocks on top of a block before its events are confirmed
+        :param recheck: confirmed blocks that are checked again, confirmations by default
+        """
+
+        self.decode_log = decode_log
+        self.confirmations = confirmations
+        self.recheck = confirmations if recheck is None else recheck
+
+        # (block hash, log index) -> (block number, event type, row)
+        self.events = {}
+
+        # (block hash, log index) -> block number of the confirmed events of the last recheck blocks
+        self.confirmed = {}
+
+        # block number -> hash of the block the buffered or confirmed events belong to
+        self.block_hashes = {}
+
+        # first block whose logs are all known, nothing before it is compared
+        self.first_block = None
+
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.events)
+
+    def add(self, logs) -> Optional[int]:
+
+        """
+        Add raw logs of the pool, logs flagged as removed are taken out again
+
+        :return: lowest block that was reorganized, None if there was no reorganization
+        """
+
+        reorganized = None
+
+        with self.lock:
+            if logs and self.first_block is None:
+                self.first_block = min(int(log["blockNumber"]) for log in logs)
+
+            for log in logs:
+                block, key = int(log["blockNumber"]), (_to_hex(log["blockHash"]), int(log["logIndex"]))
+
+                if log.get("removed"):
+                    self.events.pop(key, None)
+                    self.confirmed.pop(key, None)
+                    reorganized = _lowest(reorganized, block)
+                    continue
+
+                if key in self.events or key in self.confirmed:
+                    continue
+
+                reorganized = _lowest(reorganized, self._observe_block(block, key[0]))
+
+                type, row = self.decode_log(log)
+                self.events[key] = (block, type, row)
+
+        return reorganized
+
+    def add_head(self, block, block_hash) -> Optional[int]:
+
+        """
+        Record the hash of a new head, a different hash at a known height is a reorganization
+
+        :return: the block if it was reorganized, None otherwise
+        """
+
+        with self.lock:
+            return self._observe_block(int(block), _to_hex(block_hash))
+
+    def replace(self, first_block, last_block, logs) -> Optional[int]:
+
+        """
+        Set all logs of the blocks [first_block, last_block], e.g. of a poll of that range
+
+        The range may include confirmed blocks: their logs are compared with the confirmed events
+        and are handed out again by the next pop_confirmed (the state skips them unless it rolled
+        back).
+
+        :return: lowest block whose events changed, None if they are the same as before
+        """
+
+        with self.lock:
+            if self.first_block is None:
+                self.first_block = first_block
+
+            # blocks before the first known one are not compared
+            first_block = max(first_block, self.first_block)
+
+            before = {key: event[EVENT_BLOCK] for key, event in self.events.items() if first_block <= event[EVENT_BLOCK] <= last_block}
+            before.update({key: block for key, block in self.confirmed.items() if first_block <= block <= last_block})
+
+            self._discard(lambda block: first_block <= block <= last_block)
+
+        self.add([log for log in logs if not log.get("removed") and first_block <= int(log["blockNumber"]) <= last_block])
+
+        with self.lock:
+            after = {key: event[EVENT_BLOCK] for key, event in self.events.items() if first_block <= event[EVENT_BLOCK] <= last_block}
+
+        changed = [block for key, block in before.items() if key not in after] + [block for key, block in after.items() if key not in before]
+
+        return min(changed) if changed else None
+
+    def pop_confirmed(self, head) -> Tuple[int, List, List, List]:
+
+        """
+        Take the events that are confirmed at the given head out of the buffer
+
+        :return: last confirmed block and the rows of the confirmed Swap, Mint and Burn events,
+            sorted by block and log index
+        """
+
+        confirmed_block = int(head) - self.confirmations
+
+        with self.lock:
+            confirmed = sorted((event for event in self.events.values() if event[EVENT_BLOCK] <= confirmed_block), key=lambda event: (event[EVENT_BLOCK], event[EVENT_ROW][LOG_INDEX]))
+
+            self.confirmed.update({key: event[EVENT_BLOCK] for key, event in self.events.items() if event[EVENT_BLOCK] <= confirmed_block})
+            self.events = {key: event for key, event in self.events.items() if event[EVENT_BLOCK] > confirmed_block}
+
+            # only the last recheck confirmed blocks are compared again
+            oldest_block = confirmed_block - self.recheck
+            self.confirmed = {key: block for key, block in self.confirmed.items() if block > oldest_block}
+            self.block_hashes = {block: block_hash for block, block_hash in self.block_hashes.items() if block > oldest_block}
+
+            if self.first_block is not None:
+                self.first_block = max(self.first_block, oldest_block + 1)
+
+        events = {"Swap": [], "Mint": [], "Burn": []}
+        for event in confirmed:
+            events[event[EVENT_TYPE]].append(event[EVENT_ROW])
+
+        return confirmed_block, events["Swap"], events["Mint"], events["Burn"]
+
+    def _observe_block(self, block, block_hash) -> Optional[int]:
+
+        known = self.block_hashes.get(block)
+        self.block_hashes[block] = block_hash
+
+        if known is None or known == block_hash:
+            return None
+
+        # the known block and all blocks built on it are not part of the chain anymore
+        self._discard(lambda number: number >= block, keep_hash=block)
+
+        return block
+
+    def _discard(self, blocks, keep_hash=None) -> None:
+
+        self.events = {key: event for key, event in self.events.items() if not blocks(event[EVENT_BLOCK])}
+        self.confirmed = {key: block for key, block in self.confirmed.items() if not blocks(block)}
+        self.block_hashes = {block: block_hash for block, block_hash in self.block_hashes.items() if block == keep_hash or not blocks(block)}
+
+
+def _to_hex(value) -> str:
+
+    # hashes are bytes in formatted logs and hex strings in raw ones
+    return value.lower() if isinstance(value, str) else Web3.to_hex(value)
+
+def _lowest(block, other) -> Optional[int]:
+
+    if block is None:
+        return other
+    if other is None:
+        return block
+
+    return min(block, other)
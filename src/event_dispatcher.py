@@ -0,0 +1,105 @@
+import threading
+
+from .base_strategy import BaseStrategy
+
+HOOKS = ("on_block", "on_swap", "on_mint", "on_burn", "on_position_closed")
+
+# Column of the log index, the last column of all event types
+LOG_INDEX = -1
+
+
+class EventDispatcher:
+
+    """
+    Delivers the events ingested by the protocol state to the subscribed strategies
+
+    The same dispatcher drives the strategies live, in simulation and in backtesting mode: the
+    protocol state dispatches every batch of ingested events once, the position manager every
+    closed position. Subscribers only get the hooks they override, so hooks a strategy does not
+    need cost nothing per event.
+
+    Blocks before trade_from_block are a warm-up: the events are delivered so that strategies can
+    build their history, but on_block is not called.
+    """
+
+    def __init__(self, trade_from_block=None):
+
+        self.trade_from_block = trade_from_block
+
+        # hook name -> bound methods of the subscribers that override it
+        self.handlers = {hook: [] for hook in HOOKS}
+        self.subscribers = []
+
+        self.lock = threading.Lock()
+
+    def subscribe(self, subscriber) -> None:
+
+        with self.lock:
+            if subscriber in self.subscribers:
+                return
+
+            self.subscribers.append(subscriber)
+            self._update_handlers()
+
+    def unsubscribe(self, subscriber) -> None:
+
+        with self.lock:
+            if subscriber not in self.subscribers:
+                return
+
+            self.subscribers.remove(subscriber)
+            self._update_handlers()
+
+    def dispatch_events(self, swap_events, mint_events, burn_events) -> None:
+
+        """
+        Deliver the events of a batch in the order they happened on chain (block, log index)
+        """
+
+        handlers = self.handlers
+
+        batches = [(events, handlers[hook]) for events, hook in ((swap_events, "on_swap"), (mint_events, "on_mint"), (burn_events, "on_burn")) if handlers[hook] and len(events) > 0]
+
+        # only one event type -> already in order
+        if len(batches) == 1:
+            events, hook_handlers = batches[0]
+            for event in events:
+                for handler in hook_handlers:
+                    handler(event)
+            return
+
+        ordered = sorted(((event[0], event[LOG_INDEX], i, event) for i, (events, _) in enumerate(batches) for event in events), key=lambda entry: entry[:3])
+
+        for _, _, i, event in ordered:
+            for handler in batches[i][1]:
+                handler(event)
+
+    def dispatch_block(self, block) -> None:
+
+        if self.trade_from_block is not None and block < self.trade_from_block:
+            return
+
+        for handler in self.handlers["on_block"]:
+            handler(block)
+
+    def dispatch_position_closed(self, index, performance) -> None:
+
+        for handler in self.handlers["on_position_closed"]:
+            handler(index, performance)
+
+    def _update_handlers(self) -> None:
+
+        handlers = {hook: [] for hook in HOOKS}
+
+        for subscriber in self.subscribers:
+            for hook in HOOKS:
+                method = getattr(subscriber, hook, None)
+
+                # not overridden -> no-op of the base class
+                if method is None or getattr(type(subscriber), hook, None) is getattr(BaseStrategy, hook):
+                    continue
+
+                handlers[hook].append(method)
+
+        # replaced as a whole, dispatching never sees a partially updated table
+        self.handlers = handlers
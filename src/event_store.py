@@ -0,0 +1,364 @@
+import os
+import json
+import numpy as np
+from typing import Dict, List, Tuple
+
+# (column name, number of 64 bit limbs, signed) in the column order of the collected events
+SWAP_COLUMNS = [
+    ("block", 1, True),
+    ("tick", 1, True),
+    ("liquidity", 2, False),        # uint128
+    ("sqrt_price_x96", 3, False),   # uint160
+    ("amount0", 4, True),           # int256
+    ("amount1", 4, True),           # int256
+    ("log_index", 1, True),
+]
+
+LIQUIDITY_COLUMNS = [
+    ("block", 1, True),
+    ("tick_lower", 1, True),
+    ("tick_upper", 1, True),
+    ("amount0", 4, False),          # uint256
+    ("amount1", 4, False),          # uint256
+    ("amount", 2, False),           # uint128
+    ("log_index", 1, True),
+]
+
+COLUMNS = {
+    "Swap": SWAP_COLUMNS,
+    "Mint": LIQUIDITY_COLUMNS,
+    "Burn": LIQUIDITY_COLUMNS,
+}
+
+FLOAT_VIEW = "float_view"
+
+
+def event_to_row(event_name, event) -> List[int]:
+
+    # decoded web3 event -> row in the column order of the event type
+    if event_name == "Swap":
+        return [event.blockNumber, event.args['tick'], event.args['liquidity'], event.args['sqrtPriceX96'], event.args['amount0'], event.args['amount1'], event.logIndex]
+    else:
+        return [event.blockNumber, event.args['tickLower'], event.args['tickUpper'], event.args['amount0'], event.args['amount1'], event.args['amount'], event.logIndex]
+
+
+def _merge_ranges(ranges) -> List[List[int]]:
+
+    # sorted, disjoint ranges, adjacent ones are joined
+    merged = []
+    for first, last in sorted(ranges):
+        if merged and first <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], last)
+        else:
+            merged.append([first, last])
+
+    return merged
+
+
+def load_exact_events(path) -> List[List[int]]:
+
+    # np.loadtxt parses to float which is not exact for the large integer columns
+    with open(path) as f:
+        return [[int(value) for value in line.split(",")] for line in f if line.strip()]
+
+
+class EventStore:
+
+    """
+    Columnar binary storage of the collected pool events
+
+    Every column of an event type is a raw little-endian file in data/<pool>/<event>/ that is
+    only ever appended to. Integers wider than 64 bits are split into 64 bit limbs (least
+    significant first, two's complement if signed) so that no precision is lost. In addition a
+    float64 matrix with the same layout as the collected events is stored, which backtests can
+    memory map without any parsing or conversion.
+
+    The number of valid rows is recorded in meta.json which is replaced atomically after the
+    columns are written, so an interrupted append never leaves partial rows behind. meta.json
+    also holds the catalog of the block ranges that were collected for each event type, so
+    coverage queries are answered without touching the data.
+    """
+
+    def __init__(self, path):
+
+        self.path = path
+
+        os.makedirs(path, exist_ok=True)
+        for event in COLUMNS:
+            os.makedirs(os.path.join(path, event), exist_ok=True)
+
+        self.meta = self._load_meta()
+
+    def _load_meta(self) -> dict:
+
+        meta_path = os.path.join(self.path, "meta.json")
+
+        if os.path.isfile(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+        else:
+            meta = {"rows": {event: 0 for event in COLUMNS}}
+
+        meta.setdefault("coverage", {event: [] for event in COLUMNS})
+
+        return meta
+
+    def _save_meta(self) -> None:
+
+        meta_path = os.path.join(self.path, "meta.json")
+
+        with open(meta_path + ".tmp", "w") as f:
+            json.dump(self.meta, f)
+        os.replace(meta_path + ".tmp", meta_path)
+
+    def _column_path(self, event, column) -> str:
+        return os.path.join(self.path, event, f"{column}.bin")
+
+    def rows(self, event) -> int:
+        return self.meta["rows"][event]
+
+    def coverage(self, event) -> List[List[int]]:
+
+        """
+        Sorted, disjoint block ranges [first, last] whose events of the given type are stored
+        """
+
+        return self.meta["coverage"][event]
+
+    def missing(self, event, from_block, to_block) -> List[Tuple[int, int]]:
+
+        """
+        Block ranges between from_block and to_block (inclusive) that are not covered yet
+        """
+
+        missing = []
+        next_block = from_block
+
+        for first, last in self.coverage(event):
+            if last < next_block:
+                continue
+            if first > to_block:
+                break
+            if first > next_block:
+                missing.append((next_block, first - 1))
+            next_block = max(next_block, last + 1)
+
+        if next_block <= to_block:
+            missing.append((next_block, to_block))
+
+        return missing
+
+    def missing_ranges(self, from_block, to_block, events=COLUMNS) -> List[Tuple[int, int]]:
+
+        """
+        Block ranges between from_block and to_block that are missing for any of the event types
+        """
+
+        ranges = sorted(missing_range for event in events for missing_range in self.missing(event, from_block, to_block))
+
+        return [tuple(missing_range) for missing_range in _merge_ranges(ranges)]
+
+    def covers(self, from_block, to_block, events=COLUMNS) -> bool:
+        return len(self.missing_ranges(from_block, to_block, events)) == 0
+
+    def last_block(self, event):
+
+        if self.rows(event) == 0:
+            return None
+
+        return int(self.column(event, "block")[-1])
+
+    def append(self, events: Dict[str, List[List[int]]], covered=None) -> None:
+
+        """
+        Append events to the store
+
+        Rows that do not come after the stored ones are merged in, so the store stays sorted by
+        (block, log index) without duplicates.
+
+        :param events: event type -> rows of exact integers in the column order of the event type
+        :param covered: block range (first, last) that was fully collected for the given event types
+        """
+
+        for event, rows in events.items():
+
+            last_block = self.last_block(event)
+
+            if last_block is not None and len(rows) > 0 and min(int(row[0]) for row in rows) <= last_block:
+                self._merge(event, rows)
+                continue
+
+            columns = COLUMNS[event]
+            size = self.rows(event)
+
+            for index, (column, limbs, signed) in enumerate(columns):
+                data = _to_column(rows, index, limbs, signed).tobytes()
+                self._append_column(self._column_path(event, column), data, size * 8 * limbs)
+
+            float_view = _to_float_view(rows, len(columns))
+            self._append_column(self._column_path(event, FLOAT_VIEW), float_view.tobytes(), size * 8 * len(columns))
+
+            self.meta["rows"][event] += len(rows)
+
+        if covered is not None:
+            for event in events:
+                self.meta["coverage"][event] = _merge_ranges(self.coverage(event) + [list(covered)])
+
+        self._save_meta()
+
+    def _merge(self, event, rows) -> None:
+
+        columns = COLUMNS[event]
+
+        # stored and new rows in the column layout, the new ones last
+        merged = {column: np.concatenate([self.column(event, column), _to_column(rows, index, limbs, signed)]) for index, (column, limbs, signed) in enumerate(columns)}
+        float_view = np.concatenate([self.float_view(event), _to_float_view(rows, len(columns))])
+
+        # (block, log index) identifies an event: the stable sort keeps the new row of a key last
+        # and it replaces the stored one
+        order = np.lexsort((merged["log_index"], merged["block"]))
+        blocks, log_indices = merged["block"][order], merged["log_index"][order]
+        order = order[np.append((blocks[1:] != blocks[:-1]) | (log_indices[1:] != log_indices[:-1]), True)]
+
+        # invalidate the event type while the columns are swapped, an interrupted merge then only
+        # means that the event type has to be collected again
+        coverage = self.coverage(event)
+        self.meta["rows"][event] = 0
+        self.meta["coverage"][event] = []
+        self._save_meta()
+
+        for column, _, _ in columns:
+            self._replace_column(self._column_path(event, column), np.ascontiguousarray(merged[column][order]).tobytes())
+
+        self._replace_column(self._column_path(event, FLOAT_VIEW), np.ascontiguousarray(float_view[order]).tobytes())
+
+        self.meta["rows"][event] = len(order)
+        self.meta["coverage"][event] = coverage
+
+    def _replace_column(self, path, data) -> None:
+
+        with open(path + ".tmp", "wb") as f:
+            f.write(data)
+        os.replace(path + ".tmp", path)
+
+    def _append_column(self, path, data, valid_size) -> None:
+
+        with open(path, "ab") as f:
+            # drop anything written by an interrupted append
+            if f.tell() != valid_size:
+                f.truncate(valid_size)
+            f.write(data)
+
+    def column(self, event, column) -> np.ndarray:
+
+        """
+        Memory mapped raw column, int64 for single limb columns and (rows, limbs) uint64 otherwise
+        """
+
+        limbs = {name: limbs for name, limbs, _ in COLUMNS[event]}[column]
+        dtype = "<i8" if limbs == 1 else "<u8"
+        shape = (self.rows(event),) if limbs == 1 else (self.rows(event), limbs)
+
+        return self._map(self._column_path(event, column), dtype, shape)
+
+    def float_view(self, event) -> np.ndarray:
+
+        """
+        Memory mapped float64 matrix with the same layout as the collected events
+        """
+
+        return self._map(self._column_path(event, FLOAT_VIEW), "<f8", (self.rows(event), len(COLUMNS[event])))
+
+    def _map(self, path, dtype, shape) -> np.ndarray:
+
+        if shape[0] == 0:
+            return np.empty(shape, dtype=dtype)
+
+        return np.memmap(path, dtype=dtype, mode="r", shape=shape)
+
+    def exact(self, event, column, start=0, stop=None) -> List[int]:
+
+        """
+        Exact integer values of a column
+        """
+
+        return self.exact_at(event, column, slice(start, stop))
+
+    def exact_at(self, event, column, rows) -> List[int]:
+
+        """
+        Exact integer values of a column at the given rows (slice or array of indices)
+        """
+
+        limbs, signed = {name: (limbs, signed) for name, limbs, signed in COLUMNS[event]}[column]
+
+        data = self.column(event, column)[rows]
+        if limbs == 1:
+            return data.tolist()
+
+        width = 8 * limbs
+        raw = np.ascontiguousarray(data).tobytes()
+        return [int.from_bytes(raw[i:i + width], "little", signed=signed) for i in range(0, len(raw), width)]
+
+    def exact_rows(self, event) -> "ExactRows":
+        return ExactRows(self, event)
+
+    def import_csv(self, event, path) -> None:
+
+        """
+        Import events collected in the former CSV format
+        """
+
+        self.append({event: load_exact_events(path)})
+
+
+class ExactRows:
+
+    """
+    Lazy sequence of the rows of an event type as exact integers
+    """
+
+    def __init__(self, store: EventStore, event):
+
+        self.store = store
+        self.event = event
+
+        self.columns = [column for column, _, _ in COLUMNS[event]]
+
+        self.blocks = store.column(event, "block")
+        self.log_indices = store.column(event, "log_index")
+
+    def __len__(self):
+        return self.store.rows(self.event)
+
+    def __getitem__(self, index) -> List[int]:
+        return self.take([index])[0]
+
+    def take(self, indices) -> List[List[int]]:
+
+        """
+        Rows at the given indices, read column by column
+        """
+
+        indices = np.asarray(indices, dtype=np.int64)
+
+        return [list(row) for row in zip(*[self.store.exact_at(self.event, column, indices) for column in self.columns])]
+
+
+def take_rows(events, rows) -> List[List[int]]:
+
+    # stores read the rows column by column, plain lists of rows are indexed
+    return events.take(rows) if hasattr(events, "take") else [events[row] for row in rows]
+
+def _to_column(rows, index, limbs, signed) -> np.ndarray:
+
+    # exact values of a column -> the stored layout, int64 or (rows, limbs) uint64
+    data = b"".join(int(row[index]).to_bytes(8 * limbs, "little", signed=signed) for row in rows)
+
+    if limbs == 1:
+        return np.frombuffer(data, dtype="<i8")
+
+    return np.frombuffer(data, dtype="<u8").reshape(-1, limbs)
+
+def _to_float_view(rows, columns) -> np.ndarray:
+    return np.array([[float(value) for value in row] for row in rows], dtype="<f8").reshape(-1, columns)
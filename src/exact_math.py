@@ -0,0 +1,403 @@
+import math
+import numpy as np
+from typing import Tuple
+from bisect import bisect_left, bisect_right
+
+# Exact integer port of Uniswap v3's TickMath, SqrtPriceMath and SwapMath libraries.
+# All values are Python ints, results match the contracts bit-for-bit.
+
+MIN_TICK = -887272
+MAX_TICK = 887272
+
+MIN_SQRT_RATIO = 4295128739
+MAX_SQRT_RATIO = 1461446703485210103287273052203988822378723970342
+
+Q96 = 1 << 96
+Q128 = 1 << 128
+
+MAX_UINT160 = (1 << 160) - 1
+MAX_UINT256 = (1 << 256) - 1
+
+FEE_PIPS_DENOMINATOR = 10**6
+
+# ratio multipliers for every bit of the absolute tick: sqrt(1.0001)^(-2^i) in Q128.128
+SQRT_RATIO_MAGIC_CONSTANTS = [
+    (0x2, 0xfff97272373d413259a46990580e213a),
+    (0x4, 0xfff2e50f5f656932ef12357cf3c7fdcc),
+    (0x8, 0xffe5caca7e10e4e61c3624eaa0941cd0),
+    (0x10, 0xffcb9843d60f6159c9db58835c926644),
+    (0x20, 0xff973b41fa98c081472e6896dfb254c0),
+    (0x40, 0xff2ea16466c96a3843ec78b326b52861),
+    (0x80, 0xfe5dee046a99a2a811c461f1969c3053),
+    (0x100, 0xfcbe86c7900a88aedcffc83b479aa3a4),
+    (0x200, 0xf987a7253ac413176f2b074cf7815e54),
+    (0x400, 0xf3392b0822b70005940c7a398e4b70f3),
+    (0x800, 0xe7159475a2c29b7443b29c7fa6e889d9),
+    (0x1000, 0xd097f3bdfd2022b8845ad8f792aa5825),
+    (0x2000, 0xa9f746462d870fdf8a65dc1f90e061e5),
+    (0x4000, 0x70d869a156d2a1b890bb3df62baf32f7),
+    (0x8000, 0x31be135f97d08fd981231505542fcfa6),
+    (0x10000, 0x9aa508b5b7a84e1c677de54f3e99bc9),
+    (0x20000, 0x5d6af8dedb81196699c329225ee604),
+    (0x40000, 0x2216e584f5fa1ea926041bedfe98),
+    (0x80000, 0x48a170391f7dc42444e8fa2),
+]
+
+
+def mul_div(a, b, denominator):
+    return a * b // denominator
+
+def mul_div_rounding_up(a, b, denominator):
+    return -(-(a * b) // denominator)
+
+def div_rounding_up(a, b):
+    return -(-a // b)
+
+
+def get_sqrt_ratio_at_tick(tick) -> int:
+
+    tick = int(tick)
+    abs_tick = abs(tick)
+
+    if abs_tick > MAX_TICK:
+        raise ValueError(f"Tick {tick} out of range")
+
+    ratio = 0xfffcb933bd6fad37aa2d162d1a594001 if abs_tick & 0x1 else 0x100000000000000000000000000000000
+    for bit, magic in SQRT_RATIO_MAGIC_CONSTANTS:
+        if abs_tick & bit:
+            ratio = (ratio * magic) >> 128
+
+    if tick > 0:
+        ratio = MAX_UINT256 // ratio
+
+    # Q128.128 -> Q64.96, rounding up
+    return (ratio >> 32) + (0 if ratio % (1 << 32) == 0 else 1)
+
+def get_tick_at_sqrt_ratio(sqrt_price_x96) -> int:
+
+    """
+    Greatest tick whose sqrt ratio is less than or equal to sqrt_price_x96
+    """
+
+    sqrt_price_x96 = int(sqrt_price_x96)
+
+    if sqrt_price_x96 < MIN_SQRT_RATIO or sqrt_price_x96 >= MAX_SQRT_RATIO:
+        raise ValueError(f"Sqrt price {sqrt_price_x96} out of range")
+
+    # the float estimate is off by at most one tick, correct it with exact comparisons
+    tick = math.floor(2 * math.log(sqrt_price_x96 / Q96) / math.log(1.0001))
+    tick = min(max(tick, MIN_TICK), MAX_TICK - 1)
+
+    while tick > MIN_TICK and get_sqrt_ratio_at_tick(tick) > sqrt_price_x96:
+        tick -= 1
+    while tick < MAX_TICK - 1 and get_sqrt_ratio_at_tick(tick + 1) <= sqrt_price_x96:
+        tick += 1
+
+    return tick
+
+
+def get_next_sqrt_price_from_amount0_rounding_up(sqrt_price_x96, liquidity, amount, add) -> int:
+
+    if amount == 0:
+        return sqrt_price_x96
+
+    numerator1 = liquidity << 96
+    product = amount * sqrt_price_x96
+
+    if add:
+        # the contract falls back to a less precise formula if the product overflows
+        if product <= MAX_UINT256 and numerator1 + product <= MAX_UINT256:
+            return mul_div_rounding_up(numerator1, sqrt_price_x96, numerator1 + product)
+
+        return div_rounding_up(numerator1, numerator1 // sqrt_price_x96 + amount)
+    else:
+        if product > MAX_UINT256 or numerator1 <= product:
+            raise ValueError("Not enough liquidity")
+
+        return mul_div_rounding_up(numerator1, sqrt_price_x96, numerator1 - product)
+
+def get_next_sqrt_price_from_amount1_rounding_down(sqrt_price_x96, liquidity, amount, add) -> int:
+
+    if add:
+        return sqrt_price_x96 + (amount << 96) // liquidity
+    else:
+        quotient = div_rounding_up(amount << 96, liquidity)
+
+        if sqrt_price_x96 <= quotient:
+            raise ValueError("Not enough liquidity")
+
+        return sqrt_price_x96 - quotient
+
+def get_next_sqrt_price_from_input(sqrt_price_x96, liquidity, amount_in, zero_for_one) -> int:
+
+    if zero_for_one:
+        return get_next_sqrt_price_from_amount0_rounding_up(sqrt_price_x96, liquidity, amount_in, True)
+    else:
+        return get_next_sqrt_price_from_amount1_rounding_down(sqrt_price_x96, liquidity, amount_in, True)
+
+def get_next_sqrt_price_from_output(sqrt_price_x96, liquidity, amount_out, zero_for_one) -> int:
+
+    if zero_for_one:
+        return get_next_sqrt_price_from_amount1_rounding_down(sqrt_price_x96, liquidity, amount_out, False)
+    else:
+        return get_next_sqrt_price_from_amount0_rounding_up(sqrt_price_x96, liquidity, amount_out, False)
+
+def get_amount0_delta(sqrt_ratio_a_x96, sqrt_ratio_b_x96, liquidity, round_up) -> int:
+
+    if sqrt_ratio_a_x96 > sqrt_ratio_b_x96:
+        sqrt_ratio_a_x96, sqrt_ratio_b_x96 = sqrt_ratio_b_x96, sqrt_ratio_a_x96
+
+    numerator1 = liquidity << 96
+    numerator2 = sqrt_ratio_b_x96 - sqrt_ratio_a_x96
+
+    if round_up:
+        return div_rounding_up(mul_div_rounding_up(numerator1, numerator2, sqrt_ratio_b_x96), sqrt_ratio_a_x96)
+    else:
+        return mul_div(numerator1, numerator2, sqrt_ratio_b_x96) // sqrt_ratio_a_x96
+
+def get_amount1_delta(sqrt_ratio_a_x96, sqrt_ratio_b_x96, liquidity, round_up) -> int:
+
+    if sqrt_ratio_a_x96 > sqrt_ratio_b_x96:
+        sqrt_ratio_a_x96, sqrt_ratio_b_x96 = sqrt_ratio_b_x96, sqrt_ratio_a_x96
+
+    if round_up:
+        return mul_div_rounding_up(liquidity, sqrt_ratio_b_x96 - sqrt_ratio_a_x96, Q96)
+    else:
+        return mul_div(liquidity, sqrt_ratio_b_x96 - sqrt_ratio_a_x96, Q96)
+
+
+def get_liquidity_for_amount0(sqrt_ratio_a_x96, sqrt_ratio_b_x96, amount0) -> int:
+
+    if sqrt_ratio_a_x96 > sqrt_ratio_b_x96:
+        sqrt_ratio_a_x96, sqrt_ratio_b_x96 = sqrt_ratio_b_x96, sqrt_ratio_a_x96
+
+    intermediate = mul_div(sqrt_ratio_a_x96, sqrt_ratio_b_x96, Q96)
+
+    return mul_div(amount0, intermediate, sqrt_ratio_b_x96 - sqrt_ratio_a_x96)
+
+def get_liquidity_for_amount1(sqrt_ratio_a_x96, sqrt_ratio_b_x96, amount1) -> int:
+
+    if sqrt_ratio_a_x96 > sqrt_ratio_b_x96:
+        sqrt_ratio_a_x96, sqrt_ratio_b_x96 = sqrt_ratio_b_x96, sqrt_ratio_a_x96
+
+    return mul_div(amount1, Q96, sqrt_ratio_b_x96 - sqrt_ratio_a_x96)
+
+def get_liquidity_for_amounts(sqrt_ratio_x96, sqrt_ratio_a_x96, sqrt_ratio_b_x96, amount0, amount1) -> int:
+
+    """
+    Maximum liquidity for the given amounts, as computed by the position manager on mint
+    """
+
+    if sqrt_ratio_a_x96 > sqrt_ratio_b_x96:
+        sqrt_ratio_a_x96, sqrt_ratio_b_x96 = sqrt_ratio_b_x96, sqrt_ratio_a_x96
+
+    if sqrt_ratio_x96 <= sqrt_ratio_a_x96:
+        return get_liquidity_for_amount0(sqrt_ratio_a_x96, sqrt_ratio_b_x96, amount0)
+    elif sqrt_ratio_x96 < sqrt_ratio_b_x96:
+        liquidity0 = get_liquidity_for_amount0(sqrt_ratio_x96, sqrt_ratio_b_x96, amount0)
+        liquidity1 = get_liquidity_for_amount1(sqrt_ratio_a_x96, sqrt_ratio_x96, amount1)
+
+        return min(liquidity0, liquidity1)
+    else:
+        return get_liquidity_for_amount1(sqrt_ratio_a_x96, sqrt_ratio_b_x96, amount1)
+
+def get_amounts_for_liquidity(sqrt_ratio_x96, sqrt_ratio_a_x96, sqrt_ratio_b_x96, liquidity, round_up=False) -> Tuple[int, int]:
+
+    """
+    Token amounts of a position, rounded up like the pool does on mint if round_up is set and
+    rounded down (value of the position, amounts on burn) otherwise
+    """
+
+    if sqrt_ratio_a_x96 > sqrt_ratio_b_x96:
+        sqrt_ratio_a_x96, sqrt_ratio_b_x96 = sqrt_ratio_b_x96, sqrt_ratio_a_x96
+
+    if sqrt_ratio_x96 <= sqrt_ratio_a_x96:
+        return get_amount0_delta(sqrt_ratio_a_x96, sqrt_ratio_b_x96, liquidity, round_up), 0
+    elif sqrt_ratio_x96 < sqrt_ratio_b_x96:
+        return get_amount0_delta(sqrt_ratio_x96, sqrt_ratio_b_x96, liquidity, round_up), get_amount1_delta(sqrt_ratio_a_x96, sqrt_ratio_x96, liquidity, round_up)
+    else:
+        return 0, get_amount1_delta(sqrt_ratio_a_x96, sqrt_ratio_b_x96, liquidity, round_up)
+
+
+# Batched variants over NumPy object arrays of Python ints. The arithmetic is still exact, the
+# loops over the bits and branches run once per batch instead of once per value.
+
+def to_object_array(values) -> np.ndarray:
+
+    values = np.asarray(values)
+
+    if values.dtype.kind == "f":
+        raise ValueError("Exact math requires integer values")
+
+    return values.astype(object)
+
+def get_sqrt_ratio_at_tick_batch(ticks) -> np.ndarray:
+
+    ticks = np.asarray(ticks, dtype=np.int64)
+    abs_ticks = np.abs(ticks)
+
+    if np.any(abs_ticks > MAX_TICK):
+        raise ValueError("Tick out of range")
+
+    ratio = np.full(ticks.shape, 0x100000000000000000000000000000000, dtype=object)
+    ratio[abs_ticks & 0x1 != 0] = 0xfffcb933bd6fad37aa2d162d1a594001
+
+    for bit, magic in SQRT_RATIO_MAGIC_CONSTANTS:
+        mask = abs_ticks & bit != 0
+        ratio[mask] = (ratio[mask] * magic) >> 128
+
+    positive = ticks > 0
+    ratio[positive] = MAX_UINT256 // ratio[positive]
+
+    return (ratio >> 32) + (ratio % (1 << 32) != 0).astype(object)
+
+def get_tick_at_sqrt_ratio_batch(sqrt_prices_x96) -> np.ndarray:
+
+    sqrt_prices_x96 = to_object_array(sqrt_prices_x96)
+
+    if np.any(sqrt_prices_x96 < MIN_SQRT_RATIO) or np.any(sqrt_prices_x96 >= MAX_SQRT_RATIO):
+        raise ValueError("Sqrt price out of range")
+
+    ticks = np.floor(2 * np.log(sqrt_prices_x96.astype(np.float64) / Q96) / math.log(1.0001)).astype(np.int64)
+    ticks = np.clip(ticks, MIN_TICK, MAX_TICK - 1)
+
+    # correct the float estimate with exact comparisons
+    while True:
+        too_high = (get_sqrt_ratio_at_tick_batch(ticks) > sqrt_prices_x96) & (ticks > MIN_TICK)
+        too_low = (get_sqrt_ratio_at_tick_batch(np.minimum(ticks + 1, MAX_TICK)) <= sqrt_prices_x96) & (ticks < MAX_TICK - 1)
+
+        if not np.any(too_high) and not np.any(too_low):
+            return ticks
+
+        ticks = ticks - too_high + too_low
+
+def get_amount0_delta_batch(sqrt_ratios_a_x96, sqrt_ratios_b_x96, liquidities, round_up) -> np.ndarray:
+
+    sqrt_ratios_a_x96, sqrt_ratios_b_x96 = to_object_array(sqrt_ratios_a_x96), to_object_array(sqrt_ratios_b_x96)
+    sqrt_ratios_a_x96, sqrt_ratios_b_x96 = np.minimum(sqrt_ratios_a_x96, sqrt_ratios_b_x96), np.maximum(sqrt_ratios_a_x96, sqrt_ratios_b_x96)
+
+    numerator1 = to_object_array(liquidities) << 96
+    numerator2 = sqrt_ratios_b_x96 - sqrt_ratios_a_x96
+
+    if round_up:
+        return -(-(-(-(numerator1 * numerator2) // sqrt_ratios_b_x96)) // sqrt_ratios_a_x96)
+    else:
+        return numerator1 * numerator2 // sqrt_ratios_b_x96 // sqrt_ratios_a_x96
+
+def get_amount1_delta_batch(sqrt_ratios_a_x96, sqrt_ratios_b_x96, liquidities, round_up) -> np.ndarray:
+
+    sqrt_ratios_a_x96, sqrt_ratios_b_x96 = to_object_array(sqrt_ratios_a_x96), to_object_array(sqrt_ratios_b_x96)
+    sqrt_ratios_a_x96, sqrt_ratios_b_x96 = np.minimum(sqrt_ratios_a_x96, sqrt_ratios_b_x96), np.maximum(sqrt_ratios_a_x96, sqrt_ratios_b_x96)
+
+    product = to_object_array(liquidities) * (sqrt_ratios_b_x96 - sqrt_ratios_a_x96)
+
+    if round_up:
+        return -(-product // Q96)
+    else:
+        return product // Q96
+
+def get_amounts_for_liquidity_batch(sqrt_ratios_x96, sqrt_ratios_a_x96, sqrt_ratios_b_x96, liquidities, round_up=False) -> Tuple[np.ndarray, np.ndarray]:
+
+    """
+    Batched get_amounts_for_liquidity, the arguments are broadcast against each other
+    """
+
+    sqrt_ratios_x96, sqrt_ratios_a_x96, sqrt_ratios_b_x96, liquidities = np.broadcast_arrays(to_object_array(sqrt_ratios_x96), to_object_array(sqrt_ratios_a_x96), to_object_array(sqrt_ratios_b_x96), to_object_array(liquidities))
+    sqrt_ratios_a_x96, sqrt_ratios_b_x96 = np.minimum(sqrt_ratios_a_x96, sqrt_ratios_b_x96), np.maximum(sqrt_ratios_a_x96, sqrt_ratios_b_x96)
+
+    # clamping the price to the range expresses the three cases of the scalar version
+    clamped = np.minimum(np.maximum(sqrt_ratios_x96, sqrt_ratios_a_x96), sqrt_ratios_b_x96)
+
+    amounts0 = get_amount0_delta_batch(clamped, sqrt_ratios_b_x96, liquidities, round_up)
+    amounts1 = get_amount1_delta_batch(sqrt_ratios_a_x96, clamped, liquidities, round_up)
+
+    return amounts0, amounts1
+
+
+def compute_swap_step(sqrt_ratio_current_x96, sqrt_ratio_target_x96, liquidity, amount_remaining, fee_pips) -> Tuple[int, int, int, int]:
+
+    """
+    Result of swapping within a single tick range
+
+    :param amount_remaining: positive for exact input, negative for exact output
+    :return: (next sqrt price, amount in, amount out, fee amount)
+    """
+
+    zero_for_one = sqrt_ratio_current_x96 >= sqrt_ratio_target_x96
+    exact_in = amount_remaining >= 0
+
+    if exact_in:
+        amount_remaining_less_fee = mul_div(amount_remaining, FEE_PIPS_DENOMINATOR - fee_pips, FEE_PIPS_DENOMINATOR)
+        if zero_for_one:
+            amount_in = get_amount0_delta(sqrt_ratio_target_x96, sqrt_ratio_current_x96, liquidity, True)
+        else:
+            amount_in = get_amount1_delta(sqrt_ratio_current_x96, sqrt_ratio_target_x96, liquidity, True)
+
+        if amount_remaining_less_fee >= amount_in:
+            sqrt_ratio_next_x96 = sqrt_ratio_target_x96
+        else:
+            sqrt_ratio_next_x96 = get_next_sqrt_price_from_input(sqrt_ratio_current_x96, liquidity, amount_remaining_less_fee, zero_for_one)
+    else:
+        if zero_for_one:
+            amount_out = get_amount1_delta(sqrt_ratio_target_x96, sqrt_ratio_current_x96, liquidity, False)
+        else:
+            amount_out = get_amount0_delta(sqrt_ratio_current_x96, sqrt_ratio_target_x96, liquidity, False)
+
+        if -amount_remaining >= amount_out:
+            sqrt_ratio_next_x96 = sqrt_ratio_target_x96
+        else:
+            sqrt_ratio_next_x96 = get_next_sqrt_price_from_output(sqrt_ratio_current_x96, liquidity, -amount_remaining, zero_for_one)
+
+    reached_target = sqrt_ratio_target_x96 == sqrt_ratio_next_x96
+
+    if zero_for_one:
+        if not (reached_target and exact_in):
+            amount_in = get_amount0_delta(sqrt_ratio_next_x96, sqrt_ratio_current_x96, liquidity, True)
+        if not (reached_target and not exact_in):
+            amount_out = get_amount1_delta(sqrt_ratio_next_x96, sqrt_ratio_current_x96, liquidity, False)
+    else:
+        if not (reached_target and exact_in):
+            amount_in = get_amount1_delta(sqrt_ratio_current_x96, sqrt_ratio_next_x96, liquidity, True)
+        if not (reached_target and not exact_in):
+            amount_out = get_amount0_delta(sqrt_ratio_current_x96, sqrt_ratio_next_x96, liquidity, False)
+
+    # cap the output amount to not exceed the remaining output amount
+    if not exact_in and amount_out > -amount_remaining:
+        amount_out = -amount_remaining
+
+    if exact_in and sqrt_ratio_next_x96 != sqrt_ratio_target_x96:
+        # we didn't reach the target, so take the remainder of the maximum input as fee
+        fee_amount = amount_remaining - amount_in
+    else:
+        fee_amount = mul_div_rounding_up(amount_in, fee_pips, FEE_PIPS_DENOMINATOR - fee_pips)
+
+    return sqrt_ratio_next_x96, amount_in, amount_out, fee_amount
+
+
+def next_initialized_tick_within_one_word(initialized_ticks, tick, tick_spacing, lte) -> Tuple[int, bool]:
+
+    """
+    Port of TickBitmap.nextInitializedTickWithinOneWord on a sorted sequence of initialized ticks
+
+    :param initialized_ticks: sorted sequence supporting bisection (list or numpy array)
+    :param lte: search to the left (less than or equal) of the tick
+    :return: (next tick, whether it is initialized)
+    """
+
+    compressed = tick // tick_spacing
+
+    if lte:
+        word_start = (compressed >> 8) << 8
+        # largest initialized tick in [word_start, compressed]
+        index = bisect_right(initialized_ticks, compressed * tick_spacing) - 1
+        if index >= 0 and initialized_ticks[index] >= word_start * tick_spacing:
+            return int(initialized_ticks[index]), True
+        return word_start * tick_spacing, False
+    else:
+        compressed += 1
+        word_end = ((compressed >> 8) << 8) + 255
+        # smallest initialized tick in [compressed, word_end]
+        index = bisect_left(initialized_ticks, compressed * tick_spacing)
+        if index < len(initialized_ticks) and initialized_ticks[index] <= word_end * tick_spacing:
+            return int(initialized_ticks[index]), True
+        return word_end * tick_spacing, False
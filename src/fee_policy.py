@@ -0,0 +1,172 @@
+import math
+import time
+import logging
+from statistics import median
+from typing import Optional, Tuple
+
+from web3.exceptions import Web3Exception
+
+# percentile of the priority fees paid in the recent blocks for every urgency
+URGENCY_PERCENTILES = {
+    "low": 10,
+    "normal": 50,
+    "high": 90,
+}
+
+# gas limits of the calls whose gas has neither been estimated nor used yet, by function name
+DEFAULT_GAS_LIMITS = {
+    "approve": 100000,
+    "deposit": 100000,
+    "exactInputSingle": 500000,
+    "mint": 500000,
+    "multicall": 800000,
+}
+
+
+class FeePolicy:
+
+    """
+    Gas limits and EIP-1559 fees of the transactions of the account
+
+    The gas limit is the estimate of the node plus gas_margin. The priority fee is the median
+    over the last `blocks` blocks of the priority fee paid at the percentile of the urgency
+    (eth_feeHistory), the max fee covers base_fee_multiplier times the base fee of the next
+    block on top of it. The fee history is read at most once every max_age seconds.
+
+    A call can only be estimated at the latest block, not behind transactions of the account that
+    are still pending (e.g. a mint behind its approval would revert). The gas limits of these are
+    taken from the highest estimate or gas used (plus the margin) of earlier calls of the same
+    type, see gas_key, and from DEFAULT_GAS_LIMITS until there is one.
+    """
+
+    def __init__(self, w3, urgency="normal", blocks=10, gas_margin=0.2, base_fee_multiplier=2, min_priority_fee=10**6, max_age=12):
+
+        if urgency not in URGENCY_PERCENTILES:
+            raise ValueError(f"Unknown urgency {urgency}, use one of {', '.join(URGENCY_PERCENTILES)}")
+
+        self.w3 = w3
+        self.urgency = urgency
+
+        self.blocks = blocks
+        self.gas_margin = gas_margin
+        self.base_fee_multiplier = base_fee_multiplier
+        self.min_priority_fee = min_priority_fee
+        self.max_age = max_age
+
+        # (time of the request, fee history)
+        self.history = None
+
+        # gas_key -> gas limit learned from estimates and receipts
+        self.gas_limits = {}
+
+        self.logger = logging.getLogger('logger3')
+
+    def fees(self, urgency=None) -> dict:
+
+        """
+        Fee parameters of a transaction
+
+        :param urgency: low, normal or high, the urgency of the policy by default
+        :return: maxFeePerGas and maxPriorityFeePerGas
+        """
+
+        urgency = urgency or self.urgency
+        if urgency not in URGENCY_PERCENTILES:
+            raise ValueError(f"Unknown urgency {urgency}, use one of {', '.join(URGENCY_PERCENTILES)}")
+
+        history = self._fee_history()
+
+        # the last base fee is the one of the next block
+        base_fee = history["baseFeePerGas"][-1]
+
+        column = list(URGENCY_PERCENTILES).index(urgency)
+        rewards = [reward[column] for reward in history["reward"]]
+
+        priority_fee = max(int(median(rewards)) if rewards else 0, self.min_priority_fee)
+
+        return {
+            "maxFeePerGas": int(base_fee * self.base_fee_multiplier) + priority_fee,
+            "maxPriorityFeePerGas": priority_fee,
+        }
+
+    def estimate_gas(self, function, params, fallback=None) -> int:
+
+        """
+        Gas limit of a contract call, the estimate of the node plus the margin
+
+        :param function: contract function, e.g. contract.functions.approve(spender, amount)
+        :param params: transaction parameters of the estimate (from, value)
+        :param fallback: gas limit if the call cannot be estimated (it would revert at the latest
+            block) and no call of its type has been seen yet
+        """
+
+        try:
+            gas = math.ceil(function.estimate_gas(params) * (1 + self.gas_margin))
+        except (Web3Exception, ValueError) as e:
+            gas = self.gas_limit(function, fallback)
+            if gas is None:
+                raise
+
+            self.logger.info(f"Could not estimate gas ({e}), using {gas}")
+            return gas
+
+        self._learn(gas_key(function), gas)
+
+        return gas
+
+    def gas_limit(self, function, fallback=None) -> Optional[int]:
+
+        """
+        Gas limit of a call that cannot be estimated, e.g. behind pending transactions
+
+        :return: the learned limit of its type, else fallback, else the default of the function
+        """
+
+        gas = self.gas_limits.get(gas_key(function))
+        if gas is not None:
+            return gas
+
+        return fallback if fallback is not None else DEFAULT_GAS_LIMITS.get(function.fn_name)
+
+    def record_gas_used(self, key, gas_used) -> None:
+
+        """
+        Learn the gas limit of a call type from the gas a mined call used
+        """
+
+        self._learn(key, math.ceil(gas_used * (1 + self.gas_margin)))
+
+    def _learn(self, key, gas) -> None:
+
+        # the highest one, the gas of e.g. a swap depends on the crossed ticks
+        self.gas_limits[key] = max(self.gas_limits.get(key, 0), gas)
+
+    def _fee_history(self) -> dict:
+
+        if self.history is None or time.monotonic() - self.history[0] > self.max_age:
+            self.history = (time.monotonic(), self.w3.eth.fee_history(self.blocks, "latest", list(URGENCY_PERCENTILES.values())))
+
+        return self.history[1]
+
+
+def gas_key(function) -> Tuple:
+
+    """
+    Type of a contract call whose gas is learned, multicalls are told apart by the calls they batch
+    """
+
+    if function.fn_name == "multicall" and function.args:
+        return (function.fn_name,) + tuple(_selector(call) for call in function.args[0])
+
+    return (function.fn_name,)
+
+def _selector(call) -> str:
+    return call[:10].lower() if isinstance(call, str) else "0x" + bytes(call[:4]).hex()
+
+def gas_cost(receipt) -> int:
+
+    """
+    Realized cost of a mined transaction in wei
+    """
+
+    return receipt["gasUsed"] * receipt["effectiveGasPrice"]
@@ -4,11 +4,12 @@ from PySide6.QtGui import QPainter, QBrush, QFont
 from PySide6.QtCharts import QChart, QChartView, QLineSeries, QBarSeries, QBarSet, QValueAxis, QCategoryAxis
 from PySide6.QtWidgets import QApplication, QMainWindow, QWidget, QVBoxLayout, QGridLayout, QGraphicsTextItem, QTableWidget, QTableWidgetItem, QHeaderView, QLabel
 
-from .utils import get_contract, get_provider, get_volume_in_last_blocks, get_value_locked_for_tick_range
+from .utils import get_volume_in_last_blocks, get_value_locked_for_tick_range
 
 from .strategy import Strategy
 from .provider import Provider
 from .position import Position
+from .position_book import PositionBook
 from .protocol_state import ProtocolState
 from .position_manager import PositionManager
 
@@ -191,7 +192,7 @@ class MainWindow(QMainWindow):
 
         current_block = self.state.current_block
         current_tick = self.state.current_tick
-        tick_states = self.state.tick_states
+        tick_index = self.state.tick_index
         liquidity = self.state.current_liquidity
 
         if current_tick == None:
@@ -220,8 +221,18 @@ class MainWindow(QMainWindow):
         self.open_positions_table.setRowCount(0)
         self.closed_positions_table.setRowCount(0)
         
+        # value all open positions at once
+        open_positions_index = list(self.position_manager.open_positions_index)
+        position_book = PositionBook.from_positions([self.position_manager.positions[index] for index in open_positions_index])
+
+        values_hold = position_book.value_hold(current_tick) / 10**self.token1_decimals
+        values_position = position_book.value_position(current_tick) / 10**self.token1_decimals
+
+        amounts_x = position_book.amount_x(current_tick) / 10**self.token0_decimals
+        amounts_y = position_book.amount_y(current_tick) / 10**self.token1_decimals
+
         # Populate the table with open positions
-        for index in self.position_manager.open_positions_index:
+        for i, index in enumerate(open_positions_index):
 
             position = self.position_manager.positions[index]
             meta_data = self.position_manager.positions_meta_data[index]
@@ -229,13 +240,13 @@ class MainWindow(QMainWindow):
             lower_tick = position.lower_tick
             upper_tick = position.upper_tick
 
-            value_hold = position.value_hold(current_tick) / 10**self.token1_decimals
-            value_position = position.value_position(current_tick) / 10**self.token1_decimals
+            value_hold = values_hold[i]
+            value_position = values_position[i]
 
             diff = value_position - value_hold
 
-            amount_x = position.amount_x(current_tick) / 10**self.token0_decimals
-            amount_y = position.amount_y(current_tick) / 10**self.token1_decimals
+            amount_x = amounts_x[i]
+            amount_y = amounts_y[i]
 
             self.lower_tick_line.replace([QPointF(meta_data["block"], lower_tick), QPointF(current_block, lower_tick)])
             self.upper_tick_line.replace([QPointF(meta_data["block"], upper_tick), QPointF(current_block, upper_tick)])
@@ -305,7 +316,7 @@ class MainWindow(QMainWindow):
             self.closed_positions_table.setItem(row_position, 3, performance_item)
 
         # Get value locked in the ticks around the current tick
-        value_in_ticks, ticks = get_value_locked_for_tick_range(current_tick, liquidity, tick_states, tick_spacing=self.tick_spacing, token_decimals=self.token1_decimals)
+        value_in_ticks, ticks = get_value_locked_for_tick_range(current_tick, liquidity, tick_index, tick_spacing=self.tick_spacing, token_decimals=self.token1_decimals)
         if ticks != []:
             tick_categories = [str(int(t // self.tick_spacing * self.tick_spacing)) for t in ticks[::-1]]
             tick_heights = value_in_ticks[::-1]
@@ -324,7 +335,7 @@ class MainWindow(QMainWindow):
             tick_axis_y.setLabelsAngle(270)
 
         # Get the volumes in the last 12 blocks
-        volume_data, interval_data = get_volume_in_last_blocks(self.state.swap_data, token_decimals=self.token1_decimals, number_volume=300//12)
+        volume_data, interval_data = get_volume_in_last_blocks(self.state.swap_data.snapshot(), token_decimals=self.token1_decimals, number_volume=300//12)
         volume_categories = [str(x) for x, y in interval_data[::-1]]
         volume_heights = volume_data[::-1]
 
@@ -360,27 +371,33 @@ class MainWindow(QMainWindow):
         return
 
 if __name__ == '__main__':
+
+    from .live_feed import LiveFeed
+
+    # python -m src.gui <pool address> <network>, backtests are started with run.py --backtest --gui
+    pool_address, network = sys.argv[1:3]
+
     app = QApplication(sys.argv)
 
-    contract = get_contract()
-    node = get_provider()
-    
-    provider = Provider(node, contract, backtest=False, swap_data="data/Swap.csv", mint_data="data/Mint.csv", burn_data="data/Burn.csv")
+    provider = Provider(pool_address, network, sim=True)
     state = ProtocolState(provider)
     position_manager = PositionManager(provider, state)
     strategy = Strategy(provider, state, position_manager)
 
-    state.start()
+    # pushes the new events into the state as they are mined
+    feed = LiveFeed(provider, state)
+
+    feed.start()
     strategy.start()
 
-    window = MainWindow(state, position_manager, backtest=True)
-    window.setWindowTitle("UniSwap v3 USDC-ETH Interface")
+    window = MainWindow(provider, state, position_manager)
+    window.setWindowTitle(f"UniSwap v3 {provider.token0_symbol}-{provider.token1_symbol} Interface")
     window.setGeometry(100, 100, 800, 600)
     window.show()
 
     exit_code = app.exec()
 
     strategy.stop()
-    state.stop()
+    feed.stop()
 
     sys.exit(exit_code)
@@ -0,0 +1,186 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+
+from web3 import AsyncWeb3, WebSocketProvider
+
+from .provider import Provider, EVENT_TOPICS
+from .protocol_state import ProtocolState
+from .utils import get_env_variable
+
+
+class LiveFeed:
+
+    """
+    Pushes the events of the pool into the protocol state as soon as they are mined
+
+    Subscribes over a websocket (WS_PROVIDER_URL) to newHeads and to the logs of the pool with
+    the Swap, Mint and Burn topics. The heads and logs are passed to the confirmation buffer of
+    the state as they arrive. Once the next head arrives or no log arrived for settle_time
+    seconds after a head, the state ingests the events that are confirmed at that head and
+    dispatches them to the strategies.
+
+    Without a websocket, or while it is down, the state is polled over HTTP every poll_interval
+    seconds with a single eth_getLogs for all three event types. Failed polls are retried with
+    an exponential backoff up to max_backoff seconds, the websocket is retried every
+    retry_websocket seconds. Blocks mined in between are caught up, so no block is missed.
+    """
+
+    def __init__(self, provider: Provider, state: ProtocolState, ws_url=None, poll_interval=12, max_backoff=120, settle_time=0.25, retry_websocket=300):
+
+        if provider.backtest:
+            raise ValueError("Live feed requires a provider in live or simulation mode")
+
+        self.provider = provider
+        self.state = state
+
+        self.ws_url = ws_url or get_env_variable("WS_PROVIDER_URL")
+
+        self.poll_interval = poll_interval
+        self.max_backoff = max_backoff
+        self.settle_time = settle_time
+        self.retry_websocket = retry_websocket
+
+        # latest head whose events have not been confirmed yet
+        self.pending_head = None
+
+        self.running = False
+        self.thread = threading.Thread(target=self._run_loop, daemon=True)
+
+        self.logger = logging.getLogger('logger5')
+        self.logger.setLevel(logging.INFO)
+        # the loggers are shared by all instances
+        if not self.logger.handlers:
+            os.makedirs(os.path.dirname('src/logs/live_feed.log'), exist_ok=True)
+            handler = logging.FileHandler('src/logs/live_feed.log')
+            formatter = logging.Formatter('[%(asctime)s] %(levelname)s: %(message)s')
+            handler.setFormatter(formatter)
+            self.logger.addHandler(handler)
+
+    def _run_loop(self) -> None:
+        asyncio.run(self._run())
+
+    async def _run(self) -> None:
+
+        while self.running:
+
+            if self.ws_url:
+                try:
+                    await self._subscribe()
+                except Exception as e:
+                    self.logger.warning(f"Websocket subscription failed ({e}), polling over HTTP")
+
+            # polls until the websocket is retried, or for good without a websocket
+            await self._poll(time.monotonic() + self.retry_websocket if self.ws_url else None)
+
+    async def _subscribe(self) -> None:
+
+        async with AsyncWeb3(WebSocketProvider(self.ws_url)) as w3:
+
+            heads = await w3.eth.subscribe("newHeads")
+            await w3.eth.subscribe("logs", {"address": self.provider.pool_contract.address, "topics": [list(EVENT_TOPICS)]})
+
+            self.logger.info("Subscribed to the heads and the logs of the pool")
+
+            # blocks mined before the subscriptions
+            await self._catch_up(await w3.eth.block_number)
+
+            messages = asyncio.Queue()
+            reader = asyncio.create_task(self._read(w3, messages))
+
+            try:
+                while self.running:
+
+                    try:
+                        message = await asyncio.wait_for(messages.get(), timeout=self.settle_time if self.pending_head is not None else 1)
+                    except asyncio.TimeoutError:
+                        # no more logs of the pending head
+                        if self.pending_head is not None:
+                            await self._flush(self.pending_head)
+                        continue
+
+                    # connection lost
+                    if isinstance(message, Exception):
+                        raise message
+
+                    result = message["result"]
+
+                    if message["subscription"] == heads:
+                        block = int(result["number"], 16) if isinstance(result["number"], str) else int(result["number"])
+
+                        # the previous head is complete
+                        if self.pending_head is not None and block > self.pending_head:
+                            await self._flush(self.pending_head)
+
+                        await asyncio.to_thread(self.state.receive_head, block, result["hash"])
+
+                        self.pending_head = block if self.pending_head is None else max(self.pending_head, block)
+
+                    else:
+                        # logs flagged as removed roll back the reorganized blocks
+                        await asyncio.to_thread(self.state.receive_logs, [result])
+            finally:
+                reader.cancel()
+
+    async def _read(self, w3, messages) -> None:
+
+        try:
+            async for message in w3.socket.process_subscriptions():
+                await messages.put(message)
+        except Exception as e:
+            await messages.put(e)
+
+    async def _poll(self, until=None) -> None:
+
+        backoff = self.poll_interval
+
+        while self.running and (until is None or time.monotonic() < until):
+
+            try:
+                await self._catch_up(await asyncio.to_thread(self.provider.get_current_block))
+                backoff = self.poll_interval
+            except Exception as e:
+                backoff = min(2 * backoff, self.max_backoff)
+                self.logger.warning(f"Polling failed ({e}), retrying in {backoff} s")
+
+            await self._sleep(backoff)
+
+    async def _sleep(self, seconds) -> None:
+
+        # wakes up every second to notice a stop
+        end = time.monotonic() + seconds
+        while self.running and time.monotonic() < end:
+            await asyncio.sleep(min(1, end - time.monotonic()))
+
+    async def _catch_up(self, head) -> None:
+
+        # nothing ingested yet -> start at the head like the polling of the state
+        if self.state.current_block is None:
+            self.state.current_block = head
+            return
+
+        if head <= self.state.current_block:
+            return
+
+        # the strategies may send transactions -> not in the event loop
+        await asyncio.to_thread(self.state.sync, head)
+
+    async def _flush(self, head) -> None:
+
+        """
+        Ingest the received events that are confirmed at the head
+        """
+
+        self.pending_head = None
+
+        await asyncio.to_thread(self.state.confirm, head)
+
+    def start(self):
+        self.running = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.thread.join()
@@ -0,0 +1,62 @@
+from typing import List
+from eth_abi import decode
+
+from .utils import get_contract
+
+# deployed at the same address on all supported networks
+MULTICALL3_ADDRESS = "0xcA11bde05977b3631167028862bE2a173976CA11"
+
+
+class Multicall:
+
+    """
+    Batches contract reads into Multicall3 aggregate3 calls, i.e. a single eth_call per batch
+
+    Calls are web3 contract function objects, e.g. pool_contract.functions.ticks(tick). The
+    results have the same form as the ones of .call(): the value for functions with a single
+    output and a list otherwise. Calls that revert return None.
+    """
+
+    def __init__(self, address=MULTICALL3_ADDRESS, test=False, max_calls=500):
+
+        self.contract = get_contract("MULTICALL", address, test=test)
+        self.max_calls = max_calls
+
+    def aggregate(self, calls, block_identifier="latest") -> List:
+
+        """
+        Execute the calls at the given block
+
+        :param calls: contract function objects
+        :param block_identifier: block number or tag
+        :return: decoded results in the order of the calls
+        """
+
+        results = []
+        for i in range(0, len(calls), self.max_calls):
+            chunk = calls[i:i + self.max_calls]
+
+            encoded = [(call.address, True, encode_call(call)) for call in chunk]
+            return_data = self.contract.functions.aggregate3(encoded).call(block_identifier=block_identifier)
+
+            results += [decode_result(call, data) if success else None for call, (success, data) in zip(chunk, return_data)]
+
+        return results
+
+
+def encode_call(call) -> bytes:
+
+    return bytes.fromhex(call._encode_transaction_data()[2:])
+
+def decode_result(call, data):
+
+    values = decode([_abi_type(output) for output in call.abi["outputs"]], data)
+
+    return values[0] if len(values) == 1 else list(values)
+
+def _abi_type(output) -> str:
+
+    if output["type"].startswith("tuple"):
+        return f"({','.join(_abi_type(component) for component in output['components'])}){output['type'][5:]}"
+
+    return output["type"]
@@ -0,0 +1,306 @@
+import json
+import numpy as np
+from typing import List, Union
+
+from .tick_index import TickIndex
+from .event_store import take_rows
+from .swap_simulation import swap_steps, simulate_swap
+from .exact_math import Q128, MIN_SQRT_RATIO, MAX_SQRT_RATIO, MAX_UINT256, mul_div
+
+# Column layout of the collected events
+BLOCK_INDEX = 0
+SWAP_TICK_INDEX = 1
+SWAP_LIQUIDITY_INDEX = 2
+SWAP_SQRT_PRICE_INDEX = 3
+SWAP_AMOUNT0_INDEX = 4
+SWAP_AMOUNT1_INDEX = 5
+SWAP_LOG_INDEX = 6
+
+TICK_LOWER_INDEX = 1
+TICK_UPPER_INDEX = 2
+LIQUIDITY_AMOUNT_INDEX = 5
+LOG_INDEX = 6
+
+
+class SnapshotRangeError(ValueError):
+
+    """
+    The replay needs ticks outside the window of ticks known from the snapshot
+    """
+
+
+class PoolReplayer:
+
+    """
+    Local replica of a Uniswap v3 pool rebuilt from its collected events
+
+    Starting from a snapshot of the pool (slot0, liquidity, fee growth and the initialized ticks)
+    the Swap, Mint and Burn events are applied in (block, logIndex) order. Swaps are re-simulated
+    tick by tick like the pool contract does to accumulate the fee growth and to flip the fee
+    growth outside of the crossed ticks; price, tick and liquidity are then taken from the event.
+
+    A snapshot may only hold the initialized ticks of a window around its tick (tick_range). A
+    swap that leaves the window and a tick state read outside of it raise a SnapshotRangeError
+    instead of replaying against unknown ticks. Mints and burns outside of it only change the
+    liquidity. Flash fees are not covered.
+    """
+
+    SWAP = 0
+    MINT = 1
+    BURN = 2
+
+    # events read from the sources at once
+    BATCH_SIZE = 4096
+
+    def __init__(self, snapshot: dict, swap_events=(), mint_events=(), burn_events=()):
+
+        self.block = int(snapshot["block"])
+
+        self.fee = int(snapshot["pool"]["fee"])
+        self.tick_spacing = int(snapshot["pool"]["tick_spacing"])
+
+        self.sqrt_price_x96 = int(snapshot["sqrt_price_x96"])
+        self.tick = int(snapshot["tick"])
+        self.fee_protocol = int(snapshot["fee_protocol"])
+        self.liquidity = int(snapshot["liquidity"])
+
+        self.fee_growth_global_0_x128 = int(snapshot["fee_growth_global_0_x128"])
+        self.fee_growth_global_1_x128 = int(snapshot["fee_growth_global_1_x128"])
+
+        # initialized ticks with [liquidityGross, liquidityNet, feeGrowthOutside0X128, feeGrowthOutside1X128]
+        # the ticks of a snapshot without a tick range are all initialized ticks of the pool
+        tick_range = snapshot.get("tick_range")
+        self.tick_index = TickIndex(self.tick_spacing, snapshot["ticks"], loaded_range=tuple(tick_range) if tick_range else None)
+
+        self.snapshot_pool = snapshot["pool"]
+
+        # merge the events in (block, logIndex) order, skip the ones already contained in the snapshot
+        self.event_sources = (swap_events, mint_events, burn_events)
+
+        blocks, log_indices, kinds, rows = [], [], [], []
+        for kind, events in ((self.SWAP, swap_events), (self.MINT, mint_events), (self.BURN, burn_events)):
+            event_blocks, event_log_indices = _block_and_log_index(events)
+
+            blocks.append(event_blocks)
+            log_indices.append(event_log_indices)
+            kinds.append(np.full(len(event_blocks), kind))
+            rows.append(np.arange(len(event_blocks)))
+
+        blocks, log_indices, kinds, rows = np.concatenate(blocks), np.concatenate(log_indices), np.concatenate(kinds), np.concatenate(rows)
+
+        order = np.lexsort((log_indices, blocks))
+        order = order[blocks[order] > self.block]
+
+        self.event_blocks = blocks[order]
+        self.event_kinds = kinds[order]
+        self.event_rows = rows[order]
+
+        self.event_pointer = 0
+
+    @classmethod
+    def from_file(cls, path, swap_events=(), mint_events=(), burn_events=()) -> "PoolReplayer":
+
+        return cls(load_snapshot(path), swap_events, mint_events, burn_events)
+
+    def to_snapshot(self) -> dict:
+
+        return {
+            "block": self.block,
+            "pool": self.snapshot_pool,
+            "sqrt_price_x96": self.sqrt_price_x96,
+            "tick": self.tick,
+            "fee_protocol": self.fee_protocol,
+            "liquidity": self.liquidity,
+            "fee_growth_global_0_x128": self.fee_growth_global_0_x128,
+            "fee_growth_global_1_x128": self.fee_growth_global_1_x128,
+            "ticks": {str(tick): tick_state for tick, tick_state in self.tick_index.to_dict().items()},
+            "tick_range": list(self.tick_index.loaded_range) if self.tick_index.loaded_range is not None else None,
+        }
+
+    def advance_to(self, block) -> "PoolReplayer":
+
+        """
+        Apply all events up to and including the given block
+        """
+
+        block = int(block)
+
+        if block < self.block:
+            raise ValueError(f"Pool state already replayed up to block {self.block}, cannot go back to block {block}")
+
+        last_event = int(np.searchsorted(self.event_blocks, block, side="right"))
+
+        while self.event_pointer < last_event:
+            batch_end = min(last_event, self.event_pointer + self.BATCH_SIZE)
+
+            kinds = self.event_kinds[self.event_pointer:batch_end]
+            events = self._read_events(kinds, self.event_rows[self.event_pointer:batch_end])
+
+            for kind, event in zip(kinds, events):
+                if kind == self.SWAP:
+                    self.apply_swap(int(event[SWAP_AMOUNT0_INDEX]), int(event[SWAP_AMOUNT1_INDEX]), int(event[SWAP_SQRT_PRICE_INDEX]), int(event[SWAP_LIQUIDITY_INDEX]), int(event[SWAP_TICK_INDEX]))
+                elif kind == self.MINT:
+                    self.apply_mint(int(event[TICK_LOWER_INDEX]), int(event[TICK_UPPER_INDEX]), int(event[LIQUIDITY_AMOUNT_INDEX]))
+                elif kind == self.BURN:
+                    self.apply_burn(int(event[TICK_LOWER_INDEX]), int(event[TICK_UPPER_INDEX]), int(event[LIQUIDITY_AMOUNT_INDEX]))
+
+            self.event_pointer = batch_end
+
+        self.block = block
+
+        return self
+
+    def _read_events(self, kinds, rows) -> List:
+
+        """
+        Rows of a batch of events, read per event type with one slice of each column of a store
+        """
+
+        events = [None] * len(kinds)
+
+        for kind, source in enumerate(self.event_sources):
+            positions = np.flatnonzero(kinds == kind)
+            if len(positions) == 0:
+                continue
+
+            for position, event in zip(positions, take_rows(source, rows[positions])):
+                events[position] = event
+
+        return events
+
+    def apply_swap(self, amount0, amount1, sqrt_price_x96, liquidity, tick) -> None:
+
+        zero_for_one = amount0 > 0
+        amount_remaining = amount0 if zero_for_one else amount1
+
+        fee_protocol = self.fee_protocol % 16 if zero_for_one else self.fee_protocol >> 4
+        fee_growth_global_x128 = self.fee_growth_global_0_x128 if zero_for_one else self.fee_growth_global_1_x128
+
+        current_sqrt_price_x96 = self.sqrt_price_x96
+        current_tick = self.tick
+        current_liquidity = self.liquidity
+
+        # all crossed ticks are between the current and the final tick
+        if not self.tick_index.covers(min(current_tick, tick), max(current_tick, tick)):
+            raise SnapshotRangeError(f"Swap from tick {current_tick} to {tick} leaves the ticks {self.tick_index.loaded_range} of the snapshot -> collect the snapshot with a larger word range")
+
+        # the final price of the event bounds the swap, so the simulation follows the same path
+        sqrt_price_limit_x96 = min(max(sqrt_price_x96, MIN_SQRT_RATIO), MAX_SQRT_RATIO)
+
+        if amount_remaining > 0 and current_sqrt_price_x96 == sqrt_price_limit_x96 and current_liquidity > 0:
+            # price did not move -> the whole input is taken as fee
+            fee_amount = amount_remaining
+            if fee_protocol > 0:
+                fee_amount -= fee_amount // fee_protocol
+            fee_growth_global_x128 = (fee_growth_global_x128 + mul_div(fee_amount, Q128, current_liquidity)) % (MAX_UINT256 + 1)
+
+        # the input amount of the event, replayed as an exact input swap
+        for step in swap_steps(self.tick_index, current_sqrt_price_x96, current_tick, current_liquidity, self.fee, max(amount_remaining, 0), zero_for_one, sqrt_price_limit_x96):
+
+            fee_amount = step["fee_amount"]
+
+            if fee_protocol > 0:
+                fee_amount -= fee_amount // fee_protocol
+
+            if step["liquidity"] > 0:
+                fee_growth_global_x128 = (fee_growth_global_x128 + mul_div(fee_amount, Q128, step["liquidity"])) % (MAX_UINT256 + 1)
+
+            if step["crossed"] is not None:
+                if zero_for_one:
+                    self.tick_index.cross(step["crossed"], fee_growth_global_x128, self.fee_growth_global_1_x128)
+                else:
+                    self.tick_index.cross(step["crossed"], self.fee_growth_global_0_x128, fee_growth_global_x128)
+
+        if zero_for_one:
+            self.fee_growth_global_0_x128 = fee_growth_global_x128
+        else:
+            self.fee_growth_global_1_x128 = fee_growth_global_x128
+
+        # the event is the source of truth for the resulting price
+        self.sqrt_price_x96 = sqrt_price_x96
+        self.tick = tick
+        self.liquidity = liquidity
+
+    def simulate_swap(self, amount_specified, zero_for_one, sqrt_price_limit_x96=None) -> dict:
+
+        """
+        Outcome of a swap at the current state of the pool, see swap_simulation.simulate_swap
+        """
+
+        return simulate_swap(self.tick_index, self.sqrt_price_x96, self.tick, self.liquidity, self.fee, amount_specified, zero_for_one, sqrt_price_limit_x96)
+
+    def apply_mint(self, tick_lower, tick_upper, amount) -> None:
+
+        self._modify_position(tick_lower, tick_upper, amount)
+
+    def apply_burn(self, tick_lower, tick_upper, amount) -> None:
+
+        self._modify_position(tick_lower, tick_upper, -amount)
+
+    def _modify_position(self, tick_lower, tick_upper, liquidity_delta) -> None:
+
+        if liquidity_delta == 0:
+            return
+
+        # the states of ticks outside the snapshot are unknown, a swap that reaches them raises
+        for tick, upper in ((tick_lower, False), (tick_upper, True)):
+            if self.tick_index.covers(tick, tick):
+                self.tick_index.update(tick, liquidity_delta, upper, self.tick, self.fee_growth_global_0_x128, self.fee_growth_global_1_x128)
+
+        if self.tick >= tick_lower and self.tick < tick_upper:
+            self.liquidity += liquidity_delta
+
+    @property
+    def ticks(self) -> dict:
+        return self.tick_index.to_dict()
+
+    @property
+    def initialized_ticks(self):
+        return self.tick_index.ticks
+
+    def slot0(self) -> List[int]:
+        return [self.sqrt_price_x96, self.tick]
+
+    def get_tick_state(self, tick) -> List[Union[int, bool]]:
+
+        """
+        Same layout as the pool's ticks() getter, the oracle values are not tracked
+
+        :raises SnapshotRangeError: if the tick is outside the ticks of the snapshot
+        """
+
+        if not self.tick_index.covers(tick, tick):
+            raise SnapshotRangeError(f"Tick {tick} is outside the ticks {self.tick_index.loaded_range} of the snapshot")
+
+        tick_state = self.tick_index.get(tick)
+
+        if tick_state is None:
+            return [0, 0, 0, 0, 0, 0, 0, False]
+
+        return tick_state + [0, 0, 0, True]
+
+
+def _block_and_log_index(events):
+
+    # stores expose the columns directly, plain lists of rows are converted
+    if hasattr(events, "blocks"):
+        return np.asarray(events.blocks, dtype=np.int64), np.asarray(events.log_indices, dtype=np.int64)
+
+    for event in events:
+        if len(event) <= LOG_INDEX:
+            raise ValueError("Event data does not contain the log index -> please collect the data again")
+
+    blocks = np.array([int(event[BLOCK_INDEX]) for event in events], dtype=np.int64)
+    log_indices = np.array([int(event[LOG_INDEX]) for event in events], dtype=np.int64)
+
+    return blocks, log_indices
+
+def load_snapshot(path) -> dict:
+
+    with open(path) as f:
+        return json.load(f)
+
+def save_snapshot(snapshot, path) -> None:
+
+    with open(path, "w") as f:
+        json.dump(snapshot, f)
@@ -1,11 +1,12 @@
 import math
 import numpy as np
 
-from .uniwap_math import tick_to_sqrt_price, tick_to_price
+from .tick_table import get_tick_table
+from .exact_math import get_amounts_for_liquidity
 
 class Position:
 
-    def __init__(self, init, lower, upper, liquidity, fee_growth_inside_0_last, fee_growth_inside_1_last) -> None:
+    def __init__(self, init, lower, upper, liquidity, fee_growth_inside_0_last, fee_growth_inside_1_last, tick_spacing=1) -> None:
 
         self.init_tick = init
 
@@ -19,6 +20,9 @@ class Position:
 
         self.token_id = None
 
+        # prices of the ticks of the pool, the range ticks are multiples of the spacing
+        self.tick_table = get_tick_table(tick_spacing)
+
     def __str__(self):
 
         return f"Lower Tick: {self.lower_tick}, Init Tick: {self.init_tick}, Upper Tick: {self.upper_tick}, Liquidity: {self.liquidity}"
@@ -29,14 +33,14 @@ class Position:
     
     def amount_x(self, current_tick, current_sqrt_price=None):
 
-        price_lower_tick = int(tick_to_sqrt_price(self.lower_tick) * 2**96)
-        price_upper_tick = int(tick_to_sqrt_price(self.upper_tick) * 2**96)
+        price_lower_tick = int(self.tick_table.sqrt_price(self.lower_tick) * 2**96)
+        price_upper_tick = int(self.tick_table.sqrt_price(self.upper_tick) * 2**96)
 
         # if the exact sqrt price is given, use it
         if current_sqrt_price:
             price_current_tick = current_sqrt_price
         else:
-            price_current_tick = int(tick_to_sqrt_price(current_tick) * 2**96)
+            price_current_tick = int(self.tick_table.sqrt_price(current_tick) * 2**96)
 
 
         if current_tick < self.lower_tick:
@@ -52,14 +56,14 @@ class Position:
     
     def amount_y(self, current_tick, current_sqrt_price=None):
 
-        price_lower_tick = int(tick_to_sqrt_price(self.lower_tick) * 2**96)
-        price_upper_tick = int(tick_to_sqrt_price(self.upper_tick) * 2**96)
+        price_lower_tick = int(self.tick_table.sqrt_price(self.lower_tick) * 2**96)
+        price_upper_tick = int(self.tick_table.sqrt_price(self.upper_tick) * 2**96)
 
         # if the exact sqrt price is given, use it
         if current_sqrt_price:
             price_current_tick = current_sqrt_price
         else:
-            price_current_tick = int(tick_to_sqrt_price(current_tick) * 2**96)
+            price_current_tick = int(self.tick_table.sqrt_price(current_tick) * 2**96)
 
         if current_tick < self.lower_tick:
             value = 0
@@ -72,14 +76,26 @@ class Position:
 
         return self.liquidity * value / 2**96
 
+    def exact_amounts(self, current_sqrt_price, round_up=False):
+
+        """
+        Exact token amounts of the position as computed by the pool
+
+        :param current_sqrt_price: current sqrt price (Q64.96) as returned by slot0
+        :param round_up: round up like the pool does on mint, round down (burn) otherwise
+        :return: amount of token0, amount of token1
+        """
+
+        return get_amounts_for_liquidity(int(current_sqrt_price), self.tick_table.sqrt_price_x96(self.lower_tick), self.tick_table.sqrt_price_x96(self.upper_tick), int(self.liquidity), round_up)
+
     # 
     #
     # @ret: value of the position in y
     def value_position(self, current_tick):
 
-        price_lower_tick = tick_to_price(self.lower_tick)
-        price_current_tick = tick_to_price(current_tick)
-        price_upper_tick = tick_to_price(self.upper_tick)
+        price_lower_tick = self.tick_table.price(self.lower_tick)
+        price_current_tick = self.tick_table.price(current_tick)
+        price_upper_tick = self.tick_table.price(self.upper_tick)
 
         if current_tick < self.lower_tick:      # y fully depleted
             value = price_current_tick * (1 / math.sqrt(price_lower_tick) - 1 / math.sqrt(price_upper_tick))
@@ -97,10 +113,10 @@ class Position:
     # @ret: value if the initial amount were simply held in y
     def value_hold(self, current_tick):
 
-        price_lower_tick = tick_to_price(self.lower_tick)
-        price_current_tick = tick_to_price(current_tick)
-        price_upper_tick = tick_to_price(self.upper_tick)
-        price_init_tick = tick_to_price(self.init_tick)
+        price_lower_tick = self.tick_table.price(self.lower_tick)
+        price_current_tick = self.tick_table.price(current_tick)
+        price_upper_tick = self.tick_table.price(self.upper_tick)
+        price_init_tick = self.tick_table.price(self.init_tick)
 
         if self.init_tick < self.lower_tick:
             value = price_current_tick * (1 / math.sqrt(price_lower_tick) - 1 / math.sqrt(price_upper_tick))
@@ -125,7 +141,7 @@ class Position:
     # @ret: accumulated fees of the position in y
     def accumulated_fees(self, current_tick, fee_growth_inside_0_present, fee_growth_inside_1_present):
 
-        accumulated_fees_0 = self.liquidity * (fee_growth_inside_0_present - self.fee_growth_inside_0_last) * tick_to_price(current_tick)
+        accumulated_fees_0 = self.liquidity * (fee_growth_inside_0_present - self.fee_growth_inside_0_last) * self.tick_table.price(current_tick)
         accumulated_fees_1 = self.liquidity * (fee_growth_inside_1_present - self.fee_growth_inside_1_last)
 
         return accumulated_fees_0, accumulated_fees_1
@@ -0,0 +1,178 @@
+import numpy as np
+from typing import List, Tuple
+
+from .position import Position
+from .tick_table import get_tick_table
+from .exact_math import get_amounts_for_liquidity_batch
+
+
+class PositionBook:
+
+    """
+    Vectorized counterpart of Position for many positions at once
+
+    The positions are stored as arrays (one entry per position). Current ticks and sqrt prices
+    are broadcast against them: pass one value per position, a single value for all positions or
+    e.g. ticks[:, None] to evaluate every position at every tick (result shape (ticks, positions)).
+    The results match the scalar methods of Position.
+    """
+
+    def __init__(self, init_ticks, lower_ticks, upper_ticks, liquidities, fee_growth_inside_0_last=0, fee_growth_inside_1_last=0, tick_spacing=1):
+
+        self.init_ticks = np.asarray(init_ticks, dtype=np.float64)
+
+        self.lower_ticks = np.asarray(lower_ticks, dtype=np.float64)
+        self.upper_ticks = np.asarray(upper_ticks, dtype=np.float64)
+
+        self.liquidities = np.asarray(liquidities, dtype=np.float64)
+
+        # liquidities above 2^53 are not exact as float, keep the integers for the exact math
+        self.exact_liquidities = np.array([int(liquidity) for liquidity in np.ravel(np.asarray(liquidities, dtype=object))], dtype=object)
+
+        self.fee_growth_inside_0_last = np.asarray(fee_growth_inside_0_last, dtype=np.float64)
+        self.fee_growth_inside_1_last = np.asarray(fee_growth_inside_1_last, dtype=np.float64)
+
+        self.tick_table = get_tick_table(tick_spacing)
+
+    @classmethod
+    def from_positions(cls, positions: List[Position]) -> "PositionBook":
+
+        return cls(
+            [position.init_tick for position in positions],
+            [position.lower_tick for position in positions],
+            [position.upper_tick for position in positions],
+            [position.liquidity for position in positions],
+            [position.fee_growth_inside_0_last for position in positions],
+            [position.fee_growth_inside_1_last for position in positions],
+            tick_spacing=positions[0].tick_table.tick_spacing if positions else 1,
+        )
+
+    def __len__(self):
+        return len(self.liquidities)
+
+    def amount_x(self, current_ticks, current_sqrt_prices=None) -> np.ndarray:
+
+        """
+        Amount of token0 held by the positions
+
+        :param current_ticks: current ticks
+        :param current_sqrt_prices: exact sqrt prices (Q64.96), derived from the ticks if not given
+        """
+
+        current_ticks = np.asarray(current_ticks, dtype=np.float64)
+
+        price_lower_tick = np.floor(self.tick_table.sqrt_prices_for(self.lower_ticks) * 2**96)
+        price_upper_tick = np.floor(self.tick_table.sqrt_prices_for(self.upper_ticks) * 2**96)
+        price_current_tick = self._sqrt_price_x96(current_ticks, current_sqrt_prices)
+
+        below = current_ticks < self.lower_ticks
+        above = current_ticks >= self.upper_ticks
+
+        value = np.where(below, (price_upper_tick - price_lower_tick) / (price_lower_tick * price_upper_tick), (price_upper_tick - price_current_tick) / (price_current_tick * price_upper_tick))
+        value = np.where(above, 0.0, value)
+
+        return self.liquidities * value * 2**96
+
+    def amount_y(self, current_ticks, current_sqrt_prices=None) -> np.ndarray:
+
+        """
+        Amount of token1 held by the positions, see amount_x
+        """
+
+        current_ticks = np.asarray(current_ticks, dtype=np.float64)
+
+        price_lower_tick = np.floor(self.tick_table.sqrt_prices_for(self.lower_ticks) * 2**96)
+        price_upper_tick = np.floor(self.tick_table.sqrt_prices_for(self.upper_ticks) * 2**96)
+        price_current_tick = self._sqrt_price_x96(current_ticks, current_sqrt_prices)
+
+        below = current_ticks < self.lower_ticks
+        above = current_ticks >= self.upper_ticks
+
+        value = np.where(above, price_upper_tick - price_lower_tick, price_current_tick - price_lower_tick)
+        value = np.where(below, 0.0, value)
+
+        return self.liquidities * value / 2**96
+
+    def exact_amounts(self, current_sqrt_prices, round_up=False) -> Tuple[np.ndarray, np.ndarray]:
+
+        """
+        Exact token amounts as computed by the pool, object arrays of Python ints
+
+        :param current_sqrt_prices: exact sqrt prices (Q64.96)
+        :param round_up: round up like the pool does on mint, round down (burn) otherwise
+        """
+
+        sqrt_ratios_lower = self.tick_table.sqrt_prices_x96_for(self.lower_ticks.astype(np.int64))
+        sqrt_ratios_upper = self.tick_table.sqrt_prices_x96_for(self.upper_ticks.astype(np.int64))
+
+        return get_amounts_for_liquidity_batch(current_sqrt_prices, sqrt_ratios_lower, sqrt_ratios_upper, self.exact_liquidities, round_up)
+
+    def value_position(self, current_ticks) -> np.ndarray:
+
+        """
+        Value of the positions in y
+        """
+
+        current_ticks = np.asarray(current_ticks, dtype=np.float64)
+
+        sqrt_price_lower_tick = np.sqrt(self.tick_table.prices_for(self.lower_ticks))
+        sqrt_price_upper_tick = np.sqrt(self.tick_table.prices_for(self.upper_ticks))
+        price_current_tick = self.tick_table.prices_for(current_ticks)
+
+        below = current_ticks < self.lower_ticks     # y fully depleted
+        above = current_ticks >= self.upper_ticks    # x fully depleted
+
+        value = 2 * np.sqrt(price_current_tick) - sqrt_price_lower_tick - price_current_tick / sqrt_price_upper_tick
+        value = np.where(below, price_current_tick * (1 / sqrt_price_lower_tick - 1 / sqrt_price_upper_tick), value)
+        value = np.where(above, sqrt_price_upper_tick - sqrt_price_lower_tick, value)
+
+        return self.liquidities * value
+
+    def value_hold(self, current_ticks) -> np.ndarray:
+
+        """
+        Value in y if the initial amounts of the positions were simply held
+        """
+
+        current_ticks = np.asarray(current_ticks, dtype=np.float64)
+
+        sqrt_price_lower_tick = np.sqrt(self.tick_table.prices_for(self.lower_ticks))
+        sqrt_price_upper_tick = np.sqrt(self.tick_table.prices_for(self.upper_ticks))
+        price_init_tick = self.tick_table.prices_for(self.init_ticks)
+        price_current_tick = self.tick_table.prices_for(current_ticks)
+
+        below = self.init_ticks < self.lower_ticks
+        above = self.init_ticks >= self.upper_ticks
+
+        value = (price_init_tick + price_current_tick) / np.sqrt(price_init_tick) - sqrt_price_lower_tick - price_current_tick / sqrt_price_upper_tick
+        value = np.where(below, price_current_tick * (1 / sqrt_price_lower_tick - 1 / sqrt_price_upper_tick), value)
+        value = np.where(above, sqrt_price_upper_tick - sqrt_price_lower_tick, value)
+
+        return self.liquidities * value
+
+    def impermanent_loss(self, current_ticks) -> np.ndarray:
+
+        value_hold = self.value_hold(current_ticks)
+
+        return (self.value_position(current_ticks) - value_hold) / value_hold
+
+    def accumulated_fees(self, current_ticks, fee_growth_inside_0_present, fee_growth_inside_1_present) -> Tuple[np.ndarray, np.ndarray]:
+
+        """
+        Accumulated fees of the positions in y
+        """
+
+        price_current_tick = self.tick_table.prices_for(np.asarray(current_ticks, dtype=np.float64))
+
+        accumulated_fees_0 = self.liquidities * (np.asarray(fee_growth_inside_0_present, dtype=np.float64) - self.fee_growth_inside_0_last) * price_current_tick
+        accumulated_fees_1 = self.liquidities * (np.asarray(fee_growth_inside_1_present, dtype=np.float64) - self.fee_growth_inside_1_last)
+
+        return accumulated_fees_0, accumulated_fees_1
+
+    def _sqrt_price_x96(self, current_ticks, current_sqrt_prices) -> np.ndarray:
+
+        # if the exact sqrt price is given, use it
+        if current_sqrt_prices is not None:
+            return np.asarray(current_sqrt_prices, dtype=np.float64)
+
+        return np.floor(self.tick_table.sqrt_prices_for(current_ticks) * 2**96)
@@ -1,12 +1,13 @@
 import os
-import math
 import logging
 
 from .position import Position
 from .provider import Provider
+from .transaction_manager import TransactionReverted
 from .protocol_state import ProtocolState
 
-from .utils import get_fee_growth_inside_last, real_reservers_to_virtal_reserves
+from .utils import get_fee_growth_inside_last
+from .exact_math import MAX_UINT256, get_sqrt_ratio_at_tick, get_liquidity_for_amounts
 
 
 class PositionManager:
@@ -25,88 +26,211 @@ class PositionManager:
 
         self.logger = logging.getLogger('logger1')
         self.logger.setLevel(logging.INFO)
-        os.makedirs(os.path.dirname('src/logs/position.log'), exist_ok=True)
-        handler = logging.FileHandler('src/logs/position.log')
-        formatter = logging.Formatter('[%(asctime)s] %(levelname)s: %(message)s')
-        handler.setFormatter(formatter)
-        self.logger.addHandler(handler)
+        # the loggers are shared by all instances, e.g. the backtests of a sweep
+        if not self.logger.handlers:
+            os.makedirs(os.path.dirname('src/logs/position.log'), exist_ok=True)
+            handler = logging.FileHandler('src/logs/position.log')
+            formatter = logging.Formatter('[%(asctime)s] %(levelname)s: %(message)s')
+            handler.setFormatter(formatter)
+            self.logger.addHandler(handler)
 
     def open_position(self, lower_tick, upper_tick, x_real=None, y_real=None) -> None:
 
         current_block = self.state.current_block
-        current_tick = self.provider.get_current_tick(current_block)
-        current_sqrt_price = self.provider.get_current_sqrt_price(current_block)
 
-        upper_tick_state = self.provider.get_tick_state(upper_tick, current_block)
-        lower_tick_state = self.provider.get_tick_state(lower_tick, current_block)
+        # all reads at the current block in one round-trip
+        pool_snapshot = self.provider.get_pool_snapshot(current_block, ticks=[upper_tick, lower_tick])
+
+        position = self._new_position(pool_snapshot, lower_tick, upper_tick, x_real, y_real)
+        if position is None:
+            return
+
+        current_sqrt_price, current_tick = pool_snapshot["slot0"][:2]
+
+        if self.provider.backtest or self.provider.sim:
+            mint_tx_receipt, gas_cost = None, 0
+        else:
+            gas_spent = self.provider.transactions.gas_spent
+
+            # rebalancing swaps are sized on the local ticks of the state
+            try:
+                mint_tx_hash, mint_tx_receipt = self.provider.mint_position(position, current_tick, current_sqrt_price, pool_snapshot["liquidity"], self.state.tick_index)
+            except TransactionReverted as e:
+                self.logger.info(f"Could not open position {lower_tick} - {upper_tick}: {e}")
+                mint_tx_receipt = None
+
+            # approvals, swap, wrap and mint
+            gas_cost = self.provider.transactions.gas_spent - gas_spent
+
+        self._opened(position, pool_snapshot, mint_tx_receipt, gas_cost)
+
+        return
+
+    def close_position(self, index) -> None:
+
+        position = self.positions[index]
+
+        current_block = self.state.current_block
+
+        pool_snapshot = self.provider.get_pool_snapshot(current_block, ticks=[position.upper_tick, position.lower_tick])
+
+        if not self._closing(index, pool_snapshot):
+            return
+
+        if not (self.provider.backtest or self.provider.sim):
+            gas_spent = self.provider.transactions.gas_spent
+
+            try:
+                burn_tx, burn_tx_receipt, collect_tx_receipt = self.provider.burn_position(position, pool_snapshot["slot0"][1])
+            except TransactionReverted as e:
+                # the position is still open
+                self.logger.info(f"Could not close position {position.lower_tick} - {position.upper_tick}: {e}")
+                self.performance.pop()
+                return
+
+            self.performance[-1]["gas_cost"] += self.provider.transactions.gas_spent - gas_spent
+
+        self._closed(index)
+
+        return
+
+    def rebalance_position(self, index, lower_tick, upper_tick, x_real=None, y_real=None) -> None:
+
+        """
+        Close a position and open one in another range
+
+        Live, both are done in one multicall of the NFT manager when no swap is needed in between.
+
+        :param index: index of the position to close
+        """
+
+        position = self.positions[index]
+
+        current_block = self.state.current_block
+
+        pool_snapshot = self.provider.get_pool_snapshot(current_block, ticks=[position.upper_tick, position.lower_tick, upper_tick, lower_tick])
+
+        new_position = self._new_position(pool_snapshot, lower_tick, upper_tick, x_real, y_real)
+
+        # keep the position if the new one cannot be opened
+        if new_position is None or not self._closing(index, pool_snapshot):
+            return
+
+        current_sqrt_price, current_tick = pool_snapshot["slot0"][:2]
+
+        if self.provider.backtest or self.provider.sim:
+            mint_tx_receipt = None
+        else:
+            gas_spent = self.provider.transactions.gas_spent
+
+            try:
+                # no receipt if the position was closed but the new one could not be minted
+                mint_tx_hash, mint_tx_receipt = self.provider.rebalance_position(position, new_position, current_tick, current_sqrt_price, pool_snapshot["liquidity"], self.state.tick_index)
+            except TransactionReverted as e:
+                # the position is still open
+                self.logger.info(f"Could not rebalance position {position.lower_tick} - {position.upper_tick}: {e}")
+                self.performance.pop()
+                return
+
+            # the rebalance is one transaction -> its cost is realized by the closed position
+            self.performance[-1]["gas_cost"] += self.provider.transactions.gas_spent - gas_spent
+
+        self._closed(index)
+        self._opened(new_position, pool_snapshot, mint_tx_receipt)
+
+        return
+
+    def _new_position(self, pool_snapshot, lower_tick, upper_tick, x_real=None, y_real=None):
+
+        current_sqrt_price, current_tick = pool_snapshot["slot0"][:2]
+
+        upper_tick_state = pool_snapshot["tick_states"][int(upper_tick)]
+        lower_tick_state = pool_snapshot["tick_states"][int(lower_tick)]
 
         if not upper_tick_state or not lower_tick_state:
             # tick not initialized -> discard position if simulation
             if self.provider.backtest:
-                return
+                return None
         
-        fee_growth_global_0, fee_growth_global_1 = self.provider.get_growth_global(current_block)
+        fee_growth_global_0, fee_growth_global_1 = pool_snapshot["growth_global"]
 
         fee_growth_inside_0_last, fee_growth_inside_1_last = get_fee_growth_inside_last(lower_tick_state, upper_tick_state, lower_tick, upper_tick, current_tick, fee_growth_global_0, fee_growth_global_1)
 
+        # exact liquidity for the given amount, the other token is whatever the range requires
+        sqrt_ratio_lower = get_sqrt_ratio_at_tick(lower_tick)
+        sqrt_ratio_upper = get_sqrt_ratio_at_tick(upper_tick)
+
         if x_real is None:
-            x_virt, y_virt, x_real = real_reservers_to_virtal_reserves(lower_tick, upper_tick, current_tick, current_sqrt_price, y_real=y_real)
+            if current_sqrt_price <= sqrt_ratio_lower:
+                self.logger.info(f"Range {lower_tick} - {upper_tick} only takes token0 at the current price")
+                return None
+            liquidity = get_liquidity_for_amounts(current_sqrt_price, sqrt_ratio_lower, sqrt_ratio_upper, MAX_UINT256, int(y_real))
         elif y_real is None:
-            x_virt, y_virt, x_real = real_reservers_to_virtal_reserves(lower_tick, upper_tick, current_tick, current_sqrt_price, x_real=x_real)
-        
-        liquidity = math.sqrt(x_virt * y_virt)
+            if current_sqrt_price >= sqrt_ratio_upper:
+                self.logger.info(f"Range {lower_tick} - {upper_tick} only takes token1 at the current price")
+                return None
+            liquidity = get_liquidity_for_amounts(current_sqrt_price, sqrt_ratio_lower, sqrt_ratio_upper, int(x_real), MAX_UINT256)
+
+        return Position(current_tick, lower_tick, upper_tick, liquidity, fee_growth_inside_0_last, fee_growth_inside_1_last, tick_spacing=self.provider.tick_spacing)
 
-        position = Position(current_tick, lower_tick, upper_tick, liquidity, fee_growth_inside_0_last, fee_growth_inside_1_last)
+    def _opened(self, position, pool_snapshot, mint_tx_receipt=None, gas_cost=0) -> None:
+
+        current_sqrt_price, current_tick = pool_snapshot["slot0"][:2]
 
         if self.provider.backtest or self.provider.sim:
 
-            actual_amount_token0 = x_real
-            actual_amount_token1 = y_real
+            # amounts the pool takes on mint
+            actual_amount_token0, actual_amount_token1 = position.exact_amounts(current_sqrt_price, round_up=True)
 
             token_id = len(self.positions) - 1
 
-            position.token_id = token_id
+        elif mint_tx_receipt is None:
+            # not enough balance or the mint reverted -> nothing to record
+            self.logger.info(f"Position not opened - Range: {position.lower_tick} - {position.upper_tick} - Gas cost: {gas_cost}")
+            return
 
         else:
+            token_id, actual_amount_token0, actual_amount_token1, liquidity = self.provider.parse_mint_receipt(mint_tx_receipt)
 
-            mint_tx_hash, mint_tx_receipt = self.provider.mint_position(position, current_tick, current_sqrt_price)
-
-            actual_amount_token0 = int.from_bytes(mint_tx_receipt["logs"][0]["data"][-32:])
-            actual_amount_token1 = int.from_bytes(mint_tx_receipt["logs"][1]["data"][-32:])
-
-            token_id = int.from_bytes(mint_tx_receipt["logs"][3]["topics"][-1], byteorder="big")
+            # less than planned if the swap before the mint returned less than the shortfall
+            position.liquidity = liquidity
 
-            position.token_id = token_id
+        position.token_id = token_id
 
-        self.logger.info(f"Opened position - TokenID: {token_id} - Range: {lower_tick} - {upper_tick}")
+        self.logger.info(f"Opened position - TokenID: {token_id} - Range: {position.lower_tick} - {position.upper_tick}")
             
         self.positions.append(position)
         self.open_positions_index.append(len(self.positions) - 1)
-        self.positions_meta_data.append({"block": current_block, "tick": current_tick, "token_id": token_id, "amount_token0": actual_amount_token0, "amount_token1": actual_amount_token1})
+        self.positions_meta_data.append({"block": self.state.current_block, "tick": current_tick, "token_id": token_id, "amount_token0": actual_amount_token0, "amount_token1": actual_amount_token1, "gas_cost": gas_cost})
 
-        return
+    def _closing(self, index, pool_snapshot) -> bool:
 
-    def close_position(self, index) -> None:
+        """
+        Record the performance of a position that is closed
+
+        :return: False if the position was discarded instead
+        """
 
         position = self.positions[index]
 
         upper_tick = position.upper_tick
         lower_tick = position.lower_tick
 
-        current_block = self.state.current_block
-        current_tick = self.provider.get_current_tick(current_block)
+        current_tick = pool_snapshot["slot0"][1]
 
-        upper_tick_state = self.provider.get_tick_state(upper_tick, current_block)
-        lower_tick_state = self.provider.get_tick_state(lower_tick, current_block)
+        upper_tick_state = pool_snapshot["tick_states"][int(upper_tick)]
+        lower_tick_state = pool_snapshot["tick_states"][int(lower_tick)]
 
         if not upper_tick_state or not lower_tick_state:
             # tick not initialized -> discard position if simulation
             if self.provider.backtest:
                 self.open_positions_index.remove(index)
                 self.logger.info(f"Discarded position: {position.lower_tick} - {position.upper_tick}")
-                return
+
+                self.state.dispatcher.dispatch_position_closed(index, None)
+                return False
             
-        fee_growth_global_0, fee_growth_global_1 = self.provider.get_growth_global(current_block)
+        fee_growth_global_0, fee_growth_global_1 = pool_snapshot["growth_global"]
 
         fee_growth_inside_0_last, fee_growth_inside_1_last = get_fee_growth_inside_last(lower_tick_state, upper_tick_state, lower_tick, upper_tick, current_tick, fee_growth_global_0, fee_growth_global_1)
 
@@ -115,18 +239,20 @@ class PositionManager:
         value_hold = position.value_hold(current_tick)
         value_position = position.value_position(current_tick)
 
-        self.performance.append({"accumulated_fees": accumulated_fees, "value_hold": value_hold, "value_position": value_position})
+        # realized gas in wei, the opening now and the closing once it is mined
+        gas_cost = self.positions_meta_data[index]["gas_cost"]
 
-        if self.provider.backtest or self.provider.sim:
-            burn_tx_receipt = None
-            collect_tx_receipt = None
-        
-        else:
-            burn_tx, burn_tx_receipt, collect_tx_receipt = self.provider.burn_position(position, current_tick)
+        self.performance.append({"accumulated_fees": accumulated_fees, "value_hold": value_hold, "value_position": value_position, "gas_cost": gas_cost})
+
+        return True
+
+    def _closed(self, index) -> None:
+
+        position = self.positions[index]
 
         self.logger.info(f"Closed position: {position.lower_tick} - {position.upper_tick}")
 
         self.open_positions_index.remove(index)
         self.closed_positions_index.append(index)
 
-        return
+        self.state.dispatcher.dispatch_position_closed(index, self.performance[-1])
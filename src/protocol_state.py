@@ -1,7 +1,14 @@
 import os
-import time
 import logging
 import threading
+import numpy as np
+
+from .ring_buffer import RingBuffer
+from .block_bars import BlockBars
+from .tick_index import TickIndex, EMPTY_RANGE
+from .event_store import COLUMNS
+from .event_dispatcher import EventDispatcher
+from .confirmation_buffer import ConfirmationBuffer
 
 class ProtocolState:
 
@@ -14,7 +21,7 @@ class ProtocolState:
 
     NUM_BLOCKS = 5
 
-    def __init__(self, provider, max_state_size=5000):
+    def __init__(self, provider, max_state_size=5000, bar_resolutions=(1, 5, 300), confirmations=0):
 
         self.provider = provider
 
@@ -22,132 +29,297 @@ class ProtocolState:
         self.current_tick = None
         self.current_liquidity = None
 
-        # Event data
-        self.swap_data = []
-        self.mint_data = []
-        self.burn_data = []
+        # Event data, the last max_state_size events of each type
+        self.swap_data = RingBuffer(max_state_size, len(COLUMNS["Swap"]))
+        self.mint_data = RingBuffer(max_state_size, len(COLUMNS["Mint"]))
+        self.burn_data = RingBuffer(max_state_size, len(COLUMNS["Burn"]))
+
+        # resolution in blocks -> bars of the tick and volume
+        self.bars = {resolution: BlockBars(resolution, max_state_size) for resolution in bar_resolutions}
+
+        # initialized ticks around the current tick, loaded once and then kept up to date from the events
+        self.tick_index = TickIndex(provider.tick_spacing, loaded_range=EMPTY_RANGE)
+        self.tick_thread = None
 
-        self.tick_states = {}
+        # ticks initialized by a mint whose fee growth outside has not been fetched yet
+        self.stale_ticks = set()
 
         self.max_state_size = max_state_size
 
-        self.collect = False
-        self.thread = threading.Thread(target=self._collect)
+        # strategies subscribe here to the ingested events
+        self.dispatcher = EventDispatcher()
+
+        # live events are only ingested once their block has enough confirmations
+        self.unconfirmed = ConfirmationBuffer(provider.decode_log, confirmations) if not provider.backtest else None
 
         self.logger = logging.getLogger('logger2')
         self.logger.setLevel(logging.INFO)
-        os.makedirs(os.path.dirname('src/logs/state.log'), exist_ok=True)
-        handler = logging.FileHandler('src/logs/state.log')
-        formatter = logging.Formatter('[%(asctime)s] %(levelname)s: %(message)s')
-        handler.setFormatter(formatter)
-        self.logger.addHandler(handler)
-
-
-    def _collect(self):
-
-        last_block = self.provider.get_current_block()
-        self.current_block = self.provider.get_current_block()
-
-        while self.collect:
-            
-            # restrict state size
-            swap_state_size = len(self.swap_data)
-            mint_state_size = len(self.mint_data)
-            burn_state_size = len(self.burn_data)
-
-            if swap_state_size > self.max_state_size:
-                self.swap_data = self.swap_data[swap_state_size-self.max_state_size:]
-            if mint_state_size > self.max_state_size:
-                self.mint_data = self.mint_data[mint_state_size-self.max_state_size:]
-            if burn_state_size > self.max_state_size:
-                self.burn_data = self.burn_data[burn_state_size-self.max_state_size:]
-            
-
-            # get the current block
-            while True:
-                self.current_block = self.provider.get_current_block()
-                if last_block != self.current_block:
-                    break
-                else:
-                    time.sleep(12)
-
-            # Swap events
-            swap_events = self.provider.get_events(last_block, self.current_block, "Swap")
-            self.swap_data += swap_events
-
-            # Mint events
-            mint_events = self.provider.get_events(last_block, self.current_block, "Mint")
-            self.mint_data += mint_events
-
-            # Burn events
-            burn_events = self.provider.get_events(last_block, self.current_block, "Burn")
-            self.burn_data += burn_events
-
-
-            # Just for logging
-            for i in range(int(last_block) + 1, int(self.current_block) + 1):
-                self.logger.info(f"#### Block: {i} ####")
-
-                for swap_event in swap_events:
-                    if swap_event[self.BLOCK_INDEX] == i:
-                        self.logger.info(f"#### Swap event: {swap_event[1]} ####")
-                for mint_event in mint_events:
-                    if mint_event[self.BLOCK_INDEX] == i:
-                        self.logger.info(f"#### Mint event: {mint_event[1]} - {mint_event[2]} ####")
-                for burn_event in burn_events:
-                    if burn_event[self.BLOCK_INDEX] == i:
-                        self.logger.info(f"#### Burn event: {burn_event[1]} - {burn_event[2]} ####")
-
-            last_block = self.current_block
-
-            if swap_events == []:
-                continue
-
-            new_burn_or_mint = burn_events != [] or mint_events != []
-            
-            # compute new liquidity and value locked if there is a new tick or a mint or burn event
-            if new_burn_or_mint or self.current_tick != self.swap_data[-1][1]:
-
-                self.current_liquidity = self.provider.get_liquidity(self.current_block)
-
-                thread = threading.Thread(target=self._get_tick_states, args=(self.swap_data[-1][1], self.current_block, new_burn_or_mint), daemon=True)
-                thread.start()
-
-            self.current_tick = self.swap_data[-1][1]
-
-            if self.provider.backtest:
-                time.sleep(0.2)
-            else:
-                time.sleep(1)
+        # the loggers are shared by all instances, e.g. the backtests of a sweep
+        if not self.logger.handlers:
+            os.makedirs(os.path.dirname('src/logs/state.log'), exist_ok=True)
+            handler = logging.FileHandler('src/logs/state.log')
+            formatter = logging.Formatter('[%(asctime)s] %(levelname)s: %(message)s')
+            handler.setFormatter(formatter)
+            self.logger.addHandler(handler)
+
+
+    def sync(self, head, sync=False) -> bool:
+
+        """
+        Poll the logs up to the head and ingest the events of the confirmed blocks
+
+        All blocks after the last ingested block are fetched again on every call, so the events
+        of reorganized blocks are replaced before they are confirmed. The last ingested blocks
+        that the buffer rechecks are fetched as well: if they changed, the state is rolled back.
+
+        :param head: current block of the chain
+        :return: True if there were confirmed swap events
+        """
 
-    def _get_tick_states(self, current_tick, block_number, get_all=False, tick_range=100) -> None:
+        first_block = self.current_block + 1 - self.unconfirmed.recheck
 
-        tick_below = int(current_tick // self.provider.tick_spacing * self.provider.tick_spacing)
+        logs = self.provider.get_pool_logs(first_block - 1, head)
+        self.receive_logs(logs, first_block, head)
 
-        if get_all or self.tick_states == {}:
-            self.tick_states = {}
-            for tick in range(tick_below - tick_range, tick_below + tick_range + self.provider.tick_spacing, self.provider.tick_spacing):
-                tick_state = self.provider.get_tick_state(tick, block_number)
-                self.tick_states[tick] = tick_state
+        return self.confirm(head, sync)
+
+    def receive_logs(self, logs, first_block=None, last_block=None) -> None:
+
+        """
+        Buffer raw logs of the pool until their blocks are confirmed
+
+        :param logs: logs of a subscription (may be flagged as removed) or of a poll
+        :param first_block: with last_block, the logs are all logs of these blocks (poll) and
+            replace the buffered ones
+        """
+
+        if first_block is None:
+            reorganized = self.unconfirmed.add(logs)
         else:
-            for tick in range(tick_below - tick_range, tick_below + tick_range + self.provider.tick_spacing, self.provider.tick_spacing):
-                if tick not in self.tick_states:
-                    tick_state = self.provider.get_tick_state(tick, block_number)
-                    self.tick_states[tick] = tick_state
+            reorganized = self.unconfirmed.replace(first_block, last_block, logs)
 
-        return
+        self._handle_reorganization(reorganized)
+
+    def receive_head(self, block, block_hash) -> None:
+
+        self._handle_reorganization(self.unconfirmed.add_head(block, block_hash))
+
+    def confirm(self, head, sync=False) -> bool:
+
+        """
+        Ingest the buffered events that are confirmed at the given head
+
+        :return: True if there were swap events
+        """
+
+        confirmed_block, swap_events, mint_events, burn_events = self.unconfirmed.pop_confirmed(head)
+
+        if self.current_block is not None and confirmed_block <= self.current_block:
+            return False
+
+        # late duplicates of events that are already ingested
+        if self.current_block is not None:
+            swap_events, mint_events, burn_events = ([event for event in events if event[self.BLOCK_INDEX] > self.current_block] for events in (swap_events, mint_events, burn_events))
+
+        return self.ingest(self.current_block, confirmed_block, swap_events, mint_events, burn_events, sync)
+
+    def rollback(self, block) -> None:
+
+        """
+        Remove the events of the blocks from `block` on, after a reorganization of ingested blocks
+
+        The bars are rebuilt from the remaining swaps of their bucket and the ticks are loaded
+        again around the current tick, without fetching the history again.
+        """
+
+        self.logger.warning(f"Blocks from {block} on were reorganized, rolling back to block {block - 1}")
+
+        self._wait_for_tick_states()
+
+        for events in (self.swap_data, self.mint_data, self.burn_data):
+            events.truncate(int(np.count_nonzero(events.view()[:, self.BLOCK_INDEX] >= block)))
+
+        for bars in self.bars.values():
+            bars.rollback(block, self.swap_data.view())
+
+        self.current_block = block - 1
+        self.current_tick = self.swap_data[-1][1] if len(self.swap_data) > 0 else None
+
+        # the liquidity of the ticks changed with the removed mints and burns
+        self.tick_index.clear()
+        self.stale_ticks = set()
+
+        if self.current_tick is not None:
+            self.current_liquidity = self.provider.get_liquidity(self.current_block)
+            self._get_tick_states(None, self.current_tick, self.current_block)
+
+    def _handle_reorganization(self, block) -> None:
+
+        # reorganizations of blocks that are not ingested yet only changed the buffer
+        if block is not None and self.current_block is not None and block <= self.current_block:
+            self.rollback(block)
+
+    def update(self, last_block, current_block, sync=False) -> bool:
+
+        """
+        Fetch and ingest the events between last_block and current_block
+
+        :param last_block: last block that has been processed
+        :param current_block: block to process up to
+        :param sync: fetch the tick states in the calling thread instead of a background thread
+        :return: True if there were swap events in the range
+        """
+
+        # all three event types in one request
+        swap_events, mint_events, burn_events = self.provider.get_pool_events(last_block, current_block)
 
+        # the rows of a backtest are floats, the liquidity of the ticks needs the exact amounts
+        liquidity_events = None
+        if self.provider.backtest and (len(mint_events) > 0 or len(burn_events) > 0):
+            liquidity_events = (self.provider.get_exact_events(last_block, current_block, "Mint"), self.provider.get_exact_events(last_block, current_block, "Burn"))
 
-    def start(self):
-        self.collect = True
-        self.thread.start()
+        return self.ingest(last_block, current_block, swap_events, mint_events, burn_events, sync, liquidity_events)
 
-    def stop(self):
+    def ingest(self, last_block, current_block, swap_events, mint_events, burn_events, sync=False, liquidity_events=None) -> bool:
 
-        self.collect = False
-        self.thread.join()
+        """
+        Ingest the events of the blocks (last_block, current_block], e.g. pushed by the LiveFeed
 
+        :param swap_events: rows of the Swap events sorted by block and log index
+        :param mint_events: rows of the Mint events
+        :param burn_events: rows of the Burn events
+        :param sync: fetch the tick states in the calling thread instead of a background thread
+        :param liquidity_events: rows of exact integers of the Mint and Burn events if the given
+            rows are floats, e.g. in a backtest
+        :return: True if there were swap events
+        """
 
+        self.current_block = current_block
 
+        # Swap events
+        self.swap_data.extend(swap_events)
 
+        for bars in self.bars.values():
+            bars.update(swap_events)
 
+        # Mint events
+        self.mint_data.extend(mint_events)
+
+        # Burn events
+        self.burn_data.extend(burn_events)
+
+        self._apply_liquidity_events(*(liquidity_events or (mint_events, burn_events)))
+
+
+        # Just for logging
+        for i in range(int(last_block) + 1, int(current_block) + 1):
+            self.logger.info(f"#### Block: {i} ####")
+
+            for swap_event in swap_events:
+                if swap_event[self.BLOCK_INDEX] == i:
+                    self.logger.info(f"#### Swap event: {swap_event[1]} ####")
+            for mint_event in mint_events:
+                if mint_event[self.BLOCK_INDEX] == i:
+                    self.logger.info(f"#### Mint event: {mint_event[1]} - {mint_event[2]} ####")
+            for burn_event in burn_events:
+                if burn_event[self.BLOCK_INDEX] == i:
+                    self.logger.info(f"#### Burn event: {burn_event[1]} - {burn_event[2]} ####")
+
+        if len(swap_events) > 0:
+            self._update_tick(current_block, new_burn_or_mint=len(burn_events) > 0 or len(mint_events) > 0, sync=sync)
+
+        # the strategies react to the new state
+        self.dispatcher.dispatch_events(swap_events, mint_events, burn_events)
+
+        if self.current_tick is not None:
+            self.dispatcher.dispatch_block(current_block)
+
+        return len(swap_events) > 0
+
+    def _update_tick(self, current_block, new_burn_or_mint, sync) -> None:
+
+        # compute new liquidity and value locked if there is a new tick or a mint or burn event
+        if new_burn_or_mint or self.current_tick != self.swap_data[-1][1]:
+
+            self.current_liquidity = self.provider.get_liquidity(current_block)
+
+            # one update of the tick index at a time, they build on each other
+            self._wait_for_tick_states()
+
+            stale_ticks, self.stale_ticks = self.stale_ticks, set()
+
+            if sync:
+                self._get_tick_states(self.current_tick, self.swap_data[-1][1], current_block, stale_ticks)
+            else:
+                self.tick_thread = threading.Thread(target=self._get_tick_states, args=(self.current_tick, self.swap_data[-1][1], current_block, stale_ticks), daemon=True)
+                self.tick_thread.start()
+
+        self.current_tick = self.swap_data[-1][1]
+
+    def _apply_liquidity_events(self, mint_events, burn_events) -> None:
+
+        """
+        Update the liquidity of the loaded ticks from the Mint and Burn events
+
+        Ticks outside the loaded range are skipped, their states are fetched when the range is
+        extended. Newly initialized ticks are marked stale until their fee growth outside is fetched.
+        """
+
+        if len(mint_events) == 0 and len(burn_events) == 0:
+            return
+
+        # a running update fetches the states before these events
+        self._wait_for_tick_states()
+
+        for events, sign in ((mint_events, 1), (burn_events, -1)):
+            for event in events:
+                tick_lower, tick_upper, amount = int(event[1]), int(event[2]), int(event[5])
+
+                for tick, upper in ((tick_lower, False), (tick_upper, True)):
+                    if self.tick_index.covers(tick, tick) and self.tick_index.update(tick, sign * amount, upper):
+                        self.stale_ticks.add(tick)
+
+    def _wait_for_tick_states(self) -> None:
+
+        if self.tick_thread is not None:
+            self.tick_thread.join()
+            self.tick_thread = None
+
+    def _get_tick_states(self, previous_tick, current_tick, block_number, stale_ticks=(), tick_range=100) -> None:
+
+        """
+        Bring the tick index up to date for the current tick
+
+        Fetches, in one batch, the ticks of the window around the current tick that are not loaded
+        yet and the initialized ticks whose fee growth outside changed: the ones crossed since the
+        previous tick and the ones newly initialized by a mint.
+        """
+
+        tick_spacing = self.provider.tick_spacing
+
+        tick_below = int(current_tick // tick_spacing * tick_spacing)
+        lower, upper = tick_below - tick_range, tick_below + tick_range
+
+        loaded_lower, loaded_upper = self.tick_index.loaded_range
+
+        # the window does not touch the loaded range -> start over
+        if lower > loaded_upper + tick_spacing or upper < loaded_lower - tick_spacing:
+            self.tick_index.clear()
+            loaded_lower, loaded_upper = EMPTY_RANGE
+
+        ticks = [tick for tick in range(lower, upper + tick_spacing, tick_spacing) if not loaded_lower <= tick <= loaded_upper]
+
+        # crossed ticks flipped their fee growth outside
+        if previous_tick is not None:
+            ticks += [int(tick) for tick in self.tick_index.ticks_between(min(previous_tick, current_tick), max(previous_tick, current_tick))]
+
+        # new ticks have no fee growth outside yet
+        ticks += [tick for tick in stale_ticks if tick in self.tick_index]
+
+        ticks = sorted(set(ticks))
+
+        # fetch the tick states in one batch
+        tick_states = self.provider.batch(block_number, [("tick_state", tick) for tick in ticks])
+        self.tick_index.load(dict(zip(ticks, tick_states)), lower, upper)
+
+        return
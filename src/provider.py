@@ -3,18 +3,39 @@ import time
 import logging
 import numpy as np
 from typing import Tuple, List, Union
+from web3 import Web3
+from web3.logs import DISCARD
 
 from .position import Position
 from .config import addresses
+from .multicall import Multicall
+from .fee_policy import FeePolicy
+from .transaction_manager import TransactionManager, TransactionReverted
+from .allowance_manager import AllowanceManager
+from .wallet_state import WalletState
+from .call_cache import CallCache
+from .event_store import EventStore, event_to_row, take_rows
+from .pool_replay import PoolReplayer, load_snapshot
+from .swap_simulation import simulate_swap
+from .exact_math import get_amounts_for_liquidity, get_sqrt_ratio_at_tick
 from .utils import get_contract, get_provider, get_account, check_enough_balance, tick_to_price
 
 BLOCK_INDEX = 0
 
+# event types of the pool in the order of get_pool_events and their topics
+EVENT_TYPES = ("Swap", "Mint", "Burn")
+
+EVENT_TOPICS = {
+    Web3.to_hex(Web3.keccak(text="Swap(address,address,int256,int256,uint160,uint128,int24)")): "Swap",
+    Web3.to_hex(Web3.keccak(text="Mint(address,address,int24,int24,uint128,uint256,uint256)")): "Mint",
+    Web3.to_hex(Web3.keccak(text="Burn(address,int24,int24,uint128,uint256,uint256)")): "Burn",
+}
+
 class Provider:
-    def __init__(self, pool_address, network, sim=False, backtest=False, swap_data=None, mint_data=None, burn_data=None, local=False):
+    def __init__(self, pool_address, network, sim=False, backtest=False, event_store=None, pool_snapshot=None, from_block=None, to_block=None, call_cache=None, cache_confirmations=64, fee_urgency="normal", approval_ceiling=None, local=False):
 
-        if backtest and not swap_data:
-            raise ValueError("Backtest set to true -> please specify data file")
+        if backtest and not event_store:
+            raise ValueError("Backtest set to true -> please specify event store directory")
 
         self.provider = get_provider(test=local)
 
@@ -22,20 +43,46 @@ class Provider:
         self.router_contract = get_contract("UNISWAP_ROUTER", addresses[network]["UNISWAP_ROUTER"], test=local)
         self.nft_contract = get_contract("NFT_POSITION_MANAGER", addresses[network]["NFT_POSITION_MANAGER"], test=local)
 
-        self.fee = self.pool_contract.functions.fee().call()
-        self.tick_spacing = self.pool_contract.functions.tickSpacing().call()
+        self.multicall = Multicall(addresses[network]["MULTICALL"], test=local)
+
+        # reads at mined blocks are immutable, reads close to the head are not cached (reorgs)
+        self.call_cache = CallCache(path=call_cache)
+        self.cache_confirmations = cache_confirmations
+        self.latest_block = None
+
+        # a pool snapshot allows to replay the pool state locally without any calls to the node
+        snapshot = load_snapshot(pool_snapshot) if backtest and pool_snapshot and os.path.isfile(pool_snapshot) else None
 
-        self.token0_address = self.pool_contract.functions.token0().call()
-        self.token1_address = self.pool_contract.functions.token1().call()
+        if snapshot:
+            pool = snapshot["pool"]
+
+            self.fee = pool["fee"]
+            self.tick_spacing = pool["tick_spacing"]
+
+            self.token0_address = pool["token0"]
+            self.token1_address = pool["token1"]
+        else:
+            self.fee = self.pool_contract.functions.fee().call()
+            self.tick_spacing = self.pool_contract.functions.tickSpacing().call()
+
+            self.token0_address = self.pool_contract.functions.token0().call()
+            self.token1_address = self.pool_contract.functions.token1().call()
 
         self.token0_contract = get_contract("token0", self.token0_address, test=local)
         self.token1_contract = get_contract("token1", self.token1_address,test=local)
 
-        self.token0_symbol = self.token0_contract.functions.symbol().call()
-        self.token1_symbol = self.token1_contract.functions.symbol().call()
+        if snapshot:
+            self.token0_symbol = pool["token0_symbol"]
+            self.token1_symbol = pool["token1_symbol"]
+
+            self.token0_decimals = pool["token0_decimals"]
+            self.token1_decimals = pool["token1_decimals"]
+        else:
+            self.token0_symbol = self.token0_contract.functions.symbol().call()
+            self.token1_symbol = self.token1_contract.functions.symbol().call()
 
-        self.token0_decimals = self.token0_contract.functions.decimals().call()
-        self.token1_decimals = self.token1_contract.functions.decimals().call()
+            self.token0_decimals = self.token0_contract.functions.decimals().call()
+            self.token1_decimals = self.token1_contract.functions.decimals().call()
 
         self.weth = addresses[network]["WETH"]
 
@@ -44,32 +91,158 @@ class Provider:
 
         self.account = get_account(test=local)
 
+        # transactions are sent with a local nonce and tracked in the background, gas and fees are set by the fee policy
+        self.fee_policy = FeePolicy(self.provider, urgency=fee_urgency)
+        self.transactions = TransactionManager(self.provider, self.account, fee_policy=self.fee_policy)
+
+        # known allowances, a ceiling approves a token once for all later swaps and mints
+        self.allowances = AllowanceManager(self.transactions, self.account.address, ceiling=approval_ceiling)
+
+        # balances and allowances read with one multicall and updated from our receipts
+        self.wallet = WalletState(self.multicall, self.account.address, [self.token0_contract, self.token1_contract], [self.router_contract.address, self.nft_contract.address], self.transactions, self.allowances, weth=self.weth)
+
         self.sim = sim
         self.backtest = backtest
 
+        self.replayer = None
+
         if backtest:
-            self.swap_data = np.loadtxt(swap_data, delimiter=",", dtype=float)
-            self.mint_data = np.loadtxt(mint_data, delimiter=",", dtype=float)
-            self.burn_data = np.loadtxt(burn_data, delimiter=",", dtype=float)
+            store = EventStore(event_store)
+
+            # memory mapped, no parsing or copying
+            swap_events = store.float_view("Swap")
+            mint_events = store.float_view("Mint")
+            burn_events = store.float_view("Burn")
+
+            if len(swap_events) == 0:
+                raise ValueError(f"No swap events in {event_store}")
+
+            self.first_block = int(swap_events[:, BLOCK_INDEX].min()) if from_block is None else int(from_block)
+            self.last_block = int(swap_events[:, BLOCK_INDEX].max()) if to_block is None else int(to_block)
+
+            if (from_block is not None or to_block is not None) and not store.covers(self.first_block, self.last_block):
+                raise ValueError(f"Blocks {self.first_block} to {self.last_block} are not fully collected in {event_store}")
+            self.block_number = self.first_block
+
+            # blocks of the indexed events, a restart can replay any part of them
+            self.event_range = (self.first_block, self.last_block)
 
-            self.block_number = self.swap_data[0, 0]
-            self.last_block = self.swap_data[-1, 0]
+            # index the events by block once so that lookups are simple slices
+            self.swap_data, swap_offsets = self._index_events(swap_events)
+            self.mint_data, mint_offsets = self._index_events(mint_events)
+            self.burn_data, burn_offsets = self._index_events(burn_events)
+
+            self.event_data = {"Swap": self.swap_data, "Mint": self.mint_data, "Burn": self.burn_data}
+            self.event_offsets = {"Swap": swap_offsets, "Mint": mint_offsets, "Burn": burn_offsets}
+
+            # kept to replay the same events again (restart)
+            self.snapshot = snapshot
+
+            # the exact integer values for the replayer and the liquidity of the ticks
+            self.exact_events = (store.exact_rows("Swap"), store.exact_rows("Mint"), store.exact_rows("Burn"))
+
+            if snapshot:
+                self.replayer = PoolReplayer(snapshot, *self.exact_events)
+
+                # the pool state is only known from the snapshot onwards
+                self.block_number = max(self.first_block, self.replayer.block + 1)
 
         self.logger = logging.getLogger('logger3')
         self.logger.setLevel(logging.INFO)
-        os.makedirs(os.path.dirname('src/logs/provider.log'), exist_ok=True)
-        handler = logging.FileHandler('src/logs/provider.log')
-        formatter = logging.Formatter('[%(asctime)s] %(levelname)s: %(message)s')
-        handler.setFormatter(formatter)
-        self.logger.addHandler(handler)
+        # the loggers are shared by all instances, e.g. the backtests of a sweep
+        if not self.logger.handlers:
+            os.makedirs(os.path.dirname('src/logs/provider.log'), exist_ok=True)
+            handler = logging.FileHandler('src/logs/provider.log')
+            formatter = logging.Formatter('[%(asctime)s] %(levelname)s: %(message)s')
+            handler.setFormatter(formatter)
+            self.logger.addHandler(handler)
 
         self.logger.info(f"Token0: {self.token0_symbol}")
         self.logger.info(f"Token1: {self.token1_symbol}")
   
     
+    def restart(self, from_block=None, to_block=None, snapshot=None) -> None:
+
+        """
+        Rewind a backtest so that the loaded events can be replayed again
+
+        :param from_block: first block to replay, the first loaded block if None
+        :param to_block: last block to replay, the last loaded block if None
+        :param snapshot: pool snapshot to replay from (e.g. taken right before from_block), the
+            one of the backtest if None
+        """
+
+        if not self.backtest:
+            raise ValueError("Only a provider in backtest mode can be restarted")
+
+        first_block, last_block = self.event_range
+
+        from_block = first_block if from_block is None else int(from_block)
+        to_block = last_block if to_block is None else int(to_block)
+
+        if from_block < first_block or to_block > last_block:
+            raise ValueError(f"Blocks {from_block} to {to_block} are not loaded, only blocks {first_block} to {last_block}")
+
+        self.block_number = from_block
+        self.last_block = to_block
+
+        snapshot = snapshot or self.snapshot
+
+        if snapshot:
+            self.replayer = PoolReplayer(snapshot, *self.exact_events)
+            self.block_number = max(from_block, self.replayer.block + 1)
+
+    def _index_events(self, event_data) -> Tuple[np.ndarray, np.ndarray]:
+
+        """
+        Sort the events by block and build a CSR-style offsets array
+
+        offsets[i] is the first row whose block is >= first block + i, so the events of the
+        blocks [a, b] are the rows offsets[a - first block]:offsets[b + 1 - first block].
+        """
+
+        # the collected data is already sorted, keep the memory map in that case
+        if np.any(np.diff(event_data[:, BLOCK_INDEX]) < 0):
+            event_data = event_data[np.argsort(event_data[:, BLOCK_INDEX], kind="stable")]
+
+        blocks = np.arange(self.first_block, self.last_block + 2)
+        offsets = np.searchsorted(event_data[:, BLOCK_INDEX], blocks, side="left")
+
+        return event_data, offsets
+
+    def _get_indexed_events(self, last_block, current_block, type) -> np.ndarray:
+
+        event_data = self.event_data[type]
+        offsets = self.event_offsets[type]
+
+        # events of the blocks (last_block, current_block]
+        start = int(np.clip(last_block + 1 - self.first_block, 0, len(offsets) - 1))
+        end = int(np.clip(current_block + 1 - self.first_block, 0, len(offsets) - 1))
+
+        return event_data[offsets[start]:offsets[max(start, end)]]
+
+    def get_exact_events(self, last_block, current_block, type) -> List[List[int]]:
+
+        """
+        Rows of exact integers of the events of the blocks (last_block, current_block] in backtesting mode
+
+        The rows of get_events are floats, which round the amounts above 2^53.
+        """
+
+        events = self.exact_events[EVENT_TYPES.index(type)]
+
+        # the collected events are sorted by block
+        blocks = np.asarray(events.blocks) if hasattr(events, "blocks") else np.array([int(event[BLOCK_INDEX]) for event in events], dtype=np.int64)
+        start, end = np.searchsorted(blocks, [int(last_block) + 1, int(current_block) + 1], side="left")
+
+        return take_rows(events, np.arange(start, end))
+
     def get_tick_state(self, tick, block_number) -> List[Union[int, bool]]:
 
-        tick_state = self.pool_contract.functions.ticks(int(tick)).call(block_identifier=int(block_number))
+        if self.replayer:
+            tick_state = self.replayer.advance_to(block_number).get_tick_state(tick)
+        else:
+            tick_state = self._call(self.pool_contract.functions.ticks(int(tick)), block_number)
 
         if tick_state[-1]:
             return tick_state
@@ -87,138 +260,326 @@ class Provider:
             
             return current_block
         else:
-            return self.provider.eth.block_number
+            self.latest_block = self.provider.eth.block_number
+            return self.latest_block
         
+    def get_slot0(self, block) -> List[int]:
+
+        if self.replayer:
+            return self.replayer.advance_to(block).slot0()
+
+        return self._call(self.pool_contract.functions.slot0(), block)
+
     def get_current_sqrt_price(self, block) -> int:
 
-        slot0 = self.pool_contract.functions.slot0().call(block_identifier=int(block))
+        slot0 = self.get_slot0(block)
         return slot0[0]
     
     def get_current_tick(self, block) -> int:
         
-        slot0 = self.pool_contract.functions.slot0().call(block_identifier=int(block))
+        slot0 = self.get_slot0(block)
         return slot0[1]
         
     def get_events(self, last_block, current_block, type):
 
         if self.backtest:
-            if type == "Swap":
-                swap_events = self.swap_data[self.swap_data[:, BLOCK_INDEX] == current_block]
-                event_data = swap_events.tolist()
-            elif type == "Mint":
-                mint_events = self.mint_data[self.mint_data[:, BLOCK_INDEX] == current_block]
-                event_data = mint_events.tolist()
-            elif type == "Burn":
-                burn_events = self.burn_data[self.burn_data[:, BLOCK_INDEX] == current_block]
-                event_data = burn_events.tolist()
+            # view of the pre-indexed rows, no copy
+            event_data = self._get_indexed_events(last_block, current_block, type)
 
         else:
-            event_filter = self.pool_contract.events[type].create_filter(fromBlock=last_block, toBlock=current_block+1)
+            # same blocks (last_block, current_block] as in backtesting mode
+            event_filter = self.pool_contract.events[type].create_filter(fromBlock=last_block+1, toBlock=current_block)
             events = event_filter.get_all_entries()
             
-            event_data = []
-            for event in events:
-                if type == "Swap":
-                    event_data.append([event.blockNumber, event.args['tick'], event.args['liquidity'], event.args['sqrtPriceX96'], event.args['amount0'], event.args['amount1']])
-                elif type == "Mint":
-                    event_data.append([event.blockNumber, event.args['tickLower'], event.args['tickUpper'], event.args['amount0'], event.args['amount1']])
-                elif type == "Burn":
-                    event_data.append([event.blockNumber, event.args['tickLower'], event.args['tickUpper'], event.args['amount0'], event.args['amount1']])
+            event_data = [event_to_row(type, event) for event in events]
 
         return event_data
+
+    def get_pool_events(self, last_block, current_block) -> Tuple:
+
+        """
+        Swap, Mint and Burn events of the blocks (last_block, current_block]
+
+        Live, the events of all three types are fetched with a single eth_getLogs.
+
+        :return: rows of the Swap, Mint and Burn events, see EVENT_TYPES
+        """
+
+        if self.backtest:
+            return tuple(self._get_indexed_events(last_block, current_block, type) for type in EVENT_TYPES)
+
+        events = {type: [] for type in EVENT_TYPES}
+        for log in self.get_pool_logs(last_block, current_block):
+            type, row = self.decode_log(log)
+            events[type].append(row)
+
+        return tuple(events[type] for type in EVENT_TYPES)
+
+    def get_pool_logs(self, last_block, current_block) -> List:
+
+        """
+        Raw logs of the Swap, Mint and Burn events of the blocks (last_block, current_block]
+        """
+
+        return self.provider.eth.get_logs({"address": self.pool_contract.address, "fromBlock": int(last_block) + 1, "toBlock": int(current_block), "topics": [list(EVENT_TOPICS)]})
+
+    def decode_log(self, log) -> Tuple[str, List[int]]:
+
+        """
+        Event type and row of a raw log of the pool (eth_getLogs or a logs subscription)
+        """
+
+        topic = log["topics"][0]
+        type = EVENT_TOPICS[topic.lower() if isinstance(topic, str) else Web3.to_hex(topic)]
+
+        return type, event_to_row(type, self.pool_contract.events[type]().process_log(log))
     
     def get_growth_global(self, block_number) -> Tuple:
 
-        fee_growth_global_0 = self.pool_contract.functions.feeGrowthGlobal0X128().call(block_identifier=int(block_number)) / (1 << 128)
-        fee_growth_global_1 = self.pool_contract.functions.feeGrowthGlobal1X128().call(block_identifier=int(block_number)) / (1 << 128)
+        if self.replayer:
+            self.replayer.advance_to(block_number)
+
+            fee_growth_global_0 = self.replayer.fee_growth_global_0_x128 / (1 << 128)
+            fee_growth_global_1 = self.replayer.fee_growth_global_1_x128 / (1 << 128)
+        else:
+            fee_growth_global_0 = self._call(self.pool_contract.functions.feeGrowthGlobal0X128(), block_number) / (1 << 128)
+            fee_growth_global_1 = self._call(self.pool_contract.functions.feeGrowthGlobal1X128(), block_number) / (1 << 128)
 
         return fee_growth_global_0, fee_growth_global_1
     
     def get_liquidity(self, block_number) -> int:
 
-        liquidity = self.pool_contract.functions.liquidity().call(block_identifier=int(block_number))
+        if self.replayer:
+            return self.replayer.advance_to(block_number).liquidity
+
+        liquidity = self._call(self.pool_contract.functions.liquidity(), block_number)
 
         return liquidity
     
-    def sign_and_broadcast_transaction(self, transaction):
-        # Sign the transaction
-        signed_txn = self.provider.eth.account.sign_transaction(transaction, self.account.key)
+    def batch(self, block_number, requests) -> List:
 
-        # Send the transaction
-        txn_hash = self.provider.eth.send_raw_transaction(signed_txn.rawTransaction)
-        self.logger.info(f'Transaction hash: {txn_hash.hex()}')
+        """
+        Execute several state reads at the same block in a single round-trip
 
-        # Wait for the transaction to be mined
-        txn_receipt = self.provider.eth.wait_for_transaction_receipt(txn_hash)
-        self.logger.info(f'Transaction receipt: {txn_receipt}')
+        Requests are tuples of the name of a getter and its arguments besides the block:
+        ("slot0",), ("tick_state", tick), ("growth_global",) and ("liquidity",). The results are
+        the same as the ones of the corresponding get_* methods.
 
-        return txn_hash, txn_receipt
-    
-    def approve_token(self, address, amount, contract) -> None:
+        :param block_number: block of the reads
+        :param requests: list of requests
+        :return: results in the order of the requests
+        """
 
-        approved_balance = contract.functions.allowance(self.account.address, address).call()
-        # check if amount already approved
-        if approved_balance < amount:
+        if self.replayer:
+            # local state, nothing to batch
+            getters = {"slot0": self.get_slot0, "tick_state": self.get_tick_state, "growth_global": self.get_growth_global, "liquidity": self.get_liquidity}
+            return [getters[name](*args, block_number) for name, *args in requests]
 
-            approve_token_tx = contract.functions.approve(address, int(amount - approved_balance)).build_transaction({
-                'from': self.account.address,
-                'gas': 100000,
-                'nonce': self.provider.eth.get_transaction_count(self.account.address)
-            })
+        calls, decoders = [], []
+        for name, *args in requests:
+            request_calls, decoder = self._batch_request(name, *args)
 
-            txn_hash, _ = self.sign_and_broadcast_transaction(approve_token_tx)
-        
-        return 
-    
-    def swap_token(self, token_in, token_out, swap_token_amount, eth) -> None:
+            calls.append(request_calls)
+            decoders.append(decoder)
+
+        results = iter(self._call_many([call for request_calls in calls for call in request_calls], block_number))
+
+        return [decoder([next(results) for _ in request_calls]) for request_calls, decoder in zip(calls, decoders)]
+
+    def _cacheable(self, block_number) -> bool:
+
+        if self.backtest:
+            return True
+
+        # the latest blocks may still be reorged
+        return self.latest_block is not None and block_number <= self.latest_block - self.cache_confirmations
+
+    def _call(self, function, block_number):
+
+        """
+        Contract read at a block, served from the call cache if possible
+        """
+
+        block_number = int(block_number)
+
+        if not self._cacheable(block_number):
+            return function.call(block_identifier=block_number)
+
+        key = self.call_cache.key(function, block_number)
+
+        result = self.call_cache.get(key)
+        if result is None:
+            result = function.call(block_identifier=block_number)
+            self.call_cache.put(key, result)
+
+        return result
+
+    def _call_many(self, functions, block_number) -> List:
+
+        """
+        Contract reads at a block, the ones that are not cached are fetched with one multicall
+        """
+
+        block_number = int(block_number)
+
+        if not self._cacheable(block_number):
+            return self.multicall.aggregate(functions, block_identifier=block_number)
+
+        keys = [self.call_cache.key(function, block_number) for function in functions]
+        results = [self.call_cache.get(key) for key in keys]
+
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            fetched = self.multicall.aggregate([functions[i] for i in missing], block_identifier=block_number)
+
+            for i, result in zip(missing, fetched):
+                results[i] = result
+
+            self.call_cache.put_many([(keys[i], result) for i, result in zip(missing, fetched)])
+
+        return results
+
+    def _batch_request(self, name, *args) -> Tuple:
 
-        swap_token_tx = self.router_contract.functions.exactInputSingle((
+        # contract calls of a request and the conversion of their results
+        functions = self.pool_contract.functions
+
+        if name == "slot0":
+            return [functions.slot0()], lambda results: results[0]
+        elif name == "tick_state":
+            return [functions.ticks(int(args[0]))], lambda results: results[0] if results[0] and results[0][-1] else None
+        elif name == "growth_global":
+            return [functions.feeGrowthGlobal0X128(), functions.feeGrowthGlobal1X128()], lambda results: (results[0] / (1 << 128), results[1] / (1 << 128))
+        elif name == "liquidity":
+            return [functions.liquidity()], lambda results: results[0]
+
+        raise ValueError(f"Unknown request {name}")
+
+    def get_pool_snapshot(self, block_number, ticks=()) -> dict:
+
+        """
+        Slot0, liquidity, fee growth and the states of the given ticks at a block in one round-trip
+        """
+
+        ticks = [int(tick) for tick in ticks]
+
+        results = self.batch(block_number, [("slot0",), ("liquidity",), ("growth_global",)] + [("tick_state", tick) for tick in ticks])
+
+        return {
+            "slot0": results[0],
+            "liquidity": results[1],
+            "growth_global": results[2],
+            "tick_states": dict(zip(ticks, results[3:])),
+        }
+
+    def approve_token(self, address, amount, contract):
+
+        """
+        Approve the spender for the amount if the known allowance is not sufficient, without
+        waiting for the transaction to be mined
+
+        :return: the pending transaction, None if the allowance is already sufficient
+        """
+
+        return self.allowances.ensure(contract, address, amount)
+
+    def swap_token(self, token_in, token_out, swap_token_amount, eth, amount_out_minimum=0, sqrt_price_limit_x96=0):
+
+        return self.transactions.submit(self.router_contract.functions.exactInputSingle((
                 token_in,
                 token_out,
-                500,
+                self.fee,
                 self.account.address,
                 int(time.time()) + 10 * 60,
                 int(swap_token_amount),
-                0,
-                0
-            )).build_transaction({
-                'from': self.account.address,
-                'gas': 500000,
-                'nonce': self.provider.eth.get_transaction_count(self.account.address),
+                int(amount_out_minimum),
+                int(sqrt_price_limit_x96)
+            )), {
                 'value': swap_token_amount if eth else 0
             })
 
-        txn_hash, _ = self.sign_and_broadcast_transaction(swap_token_tx)
-        
-        return 
-    
-    def wrap_token(self, token_contract, amount) -> None:
+    def wrap_token(self, token_contract, amount):
 
-        wrap_token_tx = token_contract.functions.deposit().build_transaction({
-            'from': self.account.address,
-            'gas': 500000,
-            'nonce': self.provider.eth.get_transaction_count(self.account.address),
+        return self.transactions.submit(token_contract.functions.deposit(), {
             'value': amount
         })
 
-        txn_hash, _ = self.sign_and_broadcast_transaction(wrap_token_tx)
+    def get_swap_amount_in(self, amount_out, zero_for_one, current_tick, current_sqrt_price, current_liquidity=None, tick_index=None, max_slippage=0.005) -> int:
 
-        return
+        """
+        Input amount of a swap that returns at least amount_out
 
-    
-    def mint_position(self, position: Position, current_tick, current_sqrt_price) -> Tuple:
+        The swap is simulated on the known ticks of the pool if they are given, otherwise it is
+        estimated from the current price. max_slippage is added on top for price moves before the
+        swap is executed.
+
+        :param amount_out: required output amount
+        :param zero_for_one: token0 in, token1 out
+        """
+
+        amount_in = None
+
+        if tick_index is not None and current_liquidity is not None:
+            try:
+                amount_in = simulate_swap(tick_index, int(current_sqrt_price), int(current_tick), int(current_liquidity), self.fee, -int(amount_out), zero_for_one)["amount_in"]
+            except ValueError as e:
+                self.logger.info(f"Could not simulate swap: {e}")
+
+        if amount_in is None:
+            amount_in = amount_out / tick_to_price(current_tick) if zero_for_one else amount_out * tick_to_price(current_tick)
+            amount_in = amount_in / (1 - self.fee / 10**6)
+
+        return int(amount_in * (1 + max_slippage))
+
+    def get_swap_amount_out(self, amount_in, zero_for_one, current_tick, current_sqrt_price, current_liquidity=None, tick_index=None) -> int:
+
+        """
+        Output amount of a swap of amount_in, simulated on the known ticks of the pool if they
+        are given, otherwise estimated from the current price
+
+        :param amount_in: input amount including the fee
+        :param zero_for_one: token0 in, token1 out
+        """
+
+        if tick_index is not None and current_liquidity is not None:
+            try:
+                return simulate_swap(tick_index, int(current_sqrt_price), int(current_tick), int(current_liquidity), self.fee, int(amount_in), zero_for_one)["amount_out"]
+            except ValueError as e:
+                self.logger.info(f"Could not simulate swap: {e}")
+
+        amount_in = amount_in * (1 - self.fee / 10**6)
+
+        return int(amount_in * tick_to_price(current_tick) if zero_for_one else amount_in / tick_to_price(current_tick))
+
+    def mint_position(self, position: Position, current_tick, current_sqrt_price, current_liquidity=None, tick_index=None, max_slippage=0.005) -> Tuple:
+
+        """
+        Mint the position, swapping the missing amount of one token first
+
+        The swap is sized for the shortfall plus the fee and max_slippage. Its minimum output is
+        the simulated output of that input reduced by max_slippage, so it reverts if the price
+        moved further than the bound. The mint is only sent once the swap is mined, with the
+        amounts limited to the balances after it (the minted liquidity is then slightly lower).
+
+        :return: hash and receipt of the mint, None if the balance is not sufficient
+        :raises TransactionReverted: if the swap or the mint reverted
+        """
 
         lower_tick = int(position.lower_tick)
         upper_tick = int(position.upper_tick)
 
-        amount_token0 = int(position.amount_x(current_tick, current_sqrt_price))
-        amount_token1 = int(position.amount_y(current_tick, current_sqrt_price))
+        # exact amounts the pool takes for the liquidity of the position
+        amount_token0, amount_token1 = position.exact_amounts(current_sqrt_price, round_up=True)
 
-        balance_token0 = self.token0_contract.functions.balanceOf(self.account.address).call()
-        balance_token1 = self.token1_contract.functions.balanceOf(self.account.address).call()
+        # balances, allowances and nonce without a round-trip in the steady state
+        wallet = self.wallet.snapshot()
 
-        balance_token0 = balance_token0 + self.provider.eth.get_balance(self.account.address) if self.token0_is_WETH else balance_token0
-        balance_token1 = balance_token1 + self.provider.eth.get_balance(self.account.address) if self.token1_is_WETH else balance_token1
+        token_balance0 = wallet["balances"][self.token0_address]
+        token_balance1 = wallet["balances"][self.token1_address]
+        eth_balance = wallet["eth"]
+
+        balance_token0 = token_balance0 + eth_balance if self.token0_is_WETH else token_balance0
+        balance_token1 = token_balance1 + eth_balance if self.token1_is_WETH else token_balance1
 
         self.logger.info(f"Balance token0: {balance_token0}")
         self.logger.info(f"Balance token1: {balance_token1}")
@@ -226,126 +587,222 @@ class Provider:
         self.logger.info(self.token0_is_WETH)
         self.logger.info(self.token1_is_WETH)
 
-        eth_balance = self.provider.eth.get_balance(self.account.address)
-
         self.logger.info(f"ETH balance: {eth_balance}")
 
-        enough_balance = check_enough_balance(current_tick, balance_token0, balance_token1, int(amount_token0 * 1.01), int(amount_token1 * 1.01))
+        enough_balance = check_enough_balance(current_tick, balance_token0, balance_token1, amount_token0, amount_token1)
         if enough_balance == False:
             self.logger.info("Not enough balance to open position")
             return None, None
 
+        # dependent transactions are sent right away with consecutive nonces and mined in order
+        swap_transactions = []
+
         if balance_token0 < amount_token0:
             self.logger.info("Not enough balance of token0 -> swapping token1 to token0")
-            swap_token1_amount = (amount_token0 - balance_token0) * tick_to_price(current_tick)
-            swap_token1_amount = int(swap_token1_amount * 1.01) 
+            swap_token1_amount = self.get_swap_amount_in(amount_token0 - balance_token0, False, current_tick, current_sqrt_price, current_liquidity, tick_index, max_slippage)
+
+            # the swap input includes the fee and the slippage bound -> the rest has to cover the mint
+            if balance_token1 - swap_token1_amount < amount_token1:
+                self.logger.info(f"Not enough balance to open position: swapping {swap_token1_amount} token1 leaves less than {amount_token1}")
+                return None, None
+
+            # the swap reverts if the price moved by more than the slippage bound
+            amount_out_minimum = int(self.get_swap_amount_out(swap_token1_amount, False, current_tick, current_sqrt_price, current_liquidity, tick_index) * (1 - max_slippage))
 
             if not self.token1_is_WETH:
-                self.approve_token(self.router_contract.address, swap_token1_amount, self.token1_contract)
-            self.swap_token(self.token1_address, self.token0_address, swap_token1_amount, self.token1_is_WETH)
+                swap_transactions.append(self.approve_token(self.router_contract.address, swap_token1_amount, self.token1_contract))
+
+            swap_transactions.append(self.swap_token(self.token1_address, self.token0_address, swap_token1_amount, self.token1_is_WETH, amount_out_minimum=amount_out_minimum))
 
         elif balance_token1 < amount_token1:
             self.logger.info("Not enough balance of token1 -> swapping token0 to token1")
-            swap_token0_amount = (amount_token1 - balance_token1) / tick_to_price(current_tick)
-            swap_token0_amount = int(swap_token0_amount * 1.01)
+            swap_token0_amount = self.get_swap_amount_in(amount_token1 - balance_token1, True, current_tick, current_sqrt_price, current_liquidity, tick_index, max_slippage)
+
+            if balance_token0 - swap_token0_amount < amount_token0:
+                self.logger.info(f"Not enough balance to open position: swapping {swap_token0_amount} token0 leaves less than {amount_token0}")
+                return None, None
+
+            amount_out_minimum = int(self.get_swap_amount_out(swap_token0_amount, True, current_tick, current_sqrt_price, current_liquidity, tick_index) * (1 - max_slippage))
 
             # swapping ERC20 tokens -> approve router contract to spend tokens
             if not self.token0_is_WETH:
-                self.approve_token(self.router_contract.address, swap_token0_amount, self.token0_contract)
-            self.swap_token(self.token0_address, self.token1_address, swap_token0_amount, self.token0_is_WETH)
+                swap_transactions.append(self.approve_token(self.router_contract.address, swap_token0_amount, self.token0_contract))
+            swap_transactions.append(self.swap_token(self.token0_address, self.token1_address, swap_token0_amount, self.token0_is_WETH, amount_out_minimum=amount_out_minimum))
+
+        if swap_transactions:
+            # the output of the swap is only known once it is mined, a revert stops here before the mint is sent
+            self.transactions.wait_all([transaction for transaction in swap_transactions if transaction is not None])
+
+            # updated from the receipt of the swap
+            wallet = self.wallet.snapshot()
+
+            token_balance0 = wallet["balances"][self.token0_address]
+            token_balance1 = wallet["balances"][self.token1_address]
+            eth_balance = wallet["eth"]
+
+            balance_token0 = token_balance0 + eth_balance if self.token0_is_WETH else token_balance0
+            balance_token1 = token_balance1 + eth_balance if self.token1_is_WETH else token_balance1
+
+            # within the slippage bound the swap may return slightly less than the shortfall -> mint a bit less liquidity
+            amount_token0 = min(amount_token0, balance_token0)
+            amount_token1 = min(amount_token1, balance_token1)
+
+        transactions = []
 
         # check if one of the tokens is WETH and wrap it if necessary
         if self.token0_is_WETH or self.token1_is_WETH:
             if self.token0_is_WETH:
-                balance_token0 = self.token0_contract.functions.balanceOf(self.account.address).call()
-                amount_to_wrap = amount_token0 - balance_token0
+                amount_to_wrap = amount_token0 - token_balance0
 
                 if amount_to_wrap > 0:
                     self.logger.info("Not enough WETH: Wrapping token0")
-                    self.wrap_token(self.token0_contract, amount_to_wrap)
+                    transactions.append(self.wrap_token(self.token0_contract, amount_to_wrap))
 
             elif self.token1_is_WETH:
-                balance_token1 = self.token1_contract.functions.balanceOf(self.account.address).call()
-                amount_to_wrap = amount_token1 - balance_token1
+                amount_to_wrap = amount_token1 - token_balance1
 
                 if amount_to_wrap > 0:
                     self.logger.info("Not enough WETH: Wrapping token1")
-                    self.wrap_token(self.token1_contract, amount_to_wrap)
+                    transactions.append(self.wrap_token(self.token1_contract, amount_to_wrap))
             
         # approve token0 and token1 to be spent by nft manager contract
-        self.approve_token(self.nft_contract.address, amount_token0, self.token0_contract)
-        self.approve_token(self.nft_contract.address, amount_token1, self.token1_contract)
-            
+        transactions.append(self.approve_token(self.nft_contract.address, amount_token0, self.token0_contract))
+        transactions.append(self.approve_token(self.nft_contract.address, amount_token1, self.token1_contract))
 
-        mint_tx = self.nft_contract.functions.mint((
-            self.token0_address,
-            self.token1_address,
-            self.fee,
-            lower_tick,
-            upper_tick,
-            amount_token0,
-            amount_token1,
-            0,
-            0,
-            self.account.address,
-            int(time.time()) + 10 * 60  # deadline
-        )).build_transaction({
-            'from': self.account.address,
-            'gas': 500000,
-            'nonce': self.provider.eth.get_transaction_count(self.account.address)
-        })
+        mint_transaction = self.transactions.submit(self.nft_contract.functions.mint(self._mint_params(position, amount_token0, amount_token1)))
+
+        # receipts of all transactions, tracked concurrently
+        receipts = self.transactions.wait_all([transaction for transaction in transactions if transaction is not None] + [mint_transaction])
 
-        mint_tx_hash, mint_tx_receipt = self.sign_and_broadcast_transaction(mint_tx)
+        mint_tx_hash, mint_tx_receipt = receipts[-1]
 
         return mint_tx_hash, mint_tx_receipt
     
     def burn_position(self, position: Position, current_tick):
 
+        """
+        Decrease the liquidity, collect the tokens and fees and burn the NFT in one transaction
+
+        :return: hash and receipt of the transaction, the receipt twice (burn and collect)
+        """
+
         token_id = position.token_id
 
-        position = self.nft_contract.functions.positions(token_id).call()
+        liquidity = self.nft_contract.functions.positions(token_id).call()[7]
 
-        # 1. decrease liquidity
-        self.logger.info(f"Decreasing liquidity of position {token_id}")
-        liquidity = position[7]
+        self.logger.info(f"Closing position {token_id} with one multicall")
+        burn_transaction = self.transactions.submit(self.nft_contract.functions.multicall(self._close_calls(token_id, liquidity)))
 
-        decrease_liquidity_tx = self.nft_contract.functions.decreaseLiquidity((
-            token_id,
-            liquidity,
-            0,
-            0,
-            int(time.time()) + 10 * 60
-        )).build_transaction({
-            'from': self.account.address,
-            'gas': 500000,
-            'nonce': self.provider.eth.get_transaction_count(self.account.address)
-        })
+        [(burn_tx_hash, burn_tx_receipt)] = self.transactions.wait_all([burn_transaction])
+
+        return burn_tx_hash, burn_tx_receipt, burn_tx_receipt
+
+    def rebalance_position(self, position: Position, new_position: Position, current_tick, current_sqrt_price, current_liquidity=None, tick_index=None, max_slippage=0.005) -> Tuple:
+
+        """
+        Close a position and open another one atomically with one multicall of the NFT manager
+
+        decreaseLiquidity, collect, burn and mint are executed in the same transaction, so the
+        liquidity is never out of the pool between blocks. If the tokens of the wallet and of the
+        closed position do not cover the new position, a swap through the router is needed,
+        which cannot be part of the multicall: the position is then closed with one multicall and
+        the new one is minted like in mint_position.
+
+        :return: hash and receipt of the transaction with the mint, None if the position was
+            closed but the new one was not minted
+        :raises TransactionReverted: if the position could not be closed
+        """
+
+        token_id = position.token_id
+
+        liquidity = self.nft_contract.functions.positions(token_id).call()[7]
+
+        # tokens released by the closed position, fees on top are not counted
+        released_token0, released_token1 = get_amounts_for_liquidity(int(current_sqrt_price), get_sqrt_ratio_at_tick(int(position.lower_tick)), get_sqrt_ratio_at_tick(int(position.upper_tick)), int(liquidity))
+
+        amount_token0, amount_token1 = new_position.exact_amounts(current_sqrt_price, round_up=True)
+
+        wallet = self.wallet.snapshot()
+
+        balance_token0 = wallet["balances"][self.token0_address] + released_token0
+        balance_token1 = wallet["balances"][self.token1_address] + released_token1
+
+        if balance_token0 < amount_token0 or balance_token1 < amount_token1:
+            self.logger.info(f"Position {token_id} cannot be reopened without a swap -> closing and minting separately")
+
+            self.burn_position(position, current_tick)
 
-        txn_hash, _ = self.sign_and_broadcast_transaction(decrease_liquidity_tx)
+            # the position is closed at this point, a failed mint only means no new position
+            try:
+                return self.mint_position(new_position, current_tick, current_sqrt_price, current_liquidity, tick_index, max_slippage)
+            except TransactionReverted as e:
+                self.logger.info(f"Could not mint the new position: {e}")
+                return None, None
 
-        # 2. collect fees
-        self.logger.info(f"Collecting fees of position {token_id}")
-        collect_tx = self.nft_contract.functions.collect((
-            token_id,
+        # the approvals are mined before the multicall (lower nonces)
+        approvals = [
+            self.approve_token(self.nft_contract.address, amount_token0, self.token0_contract),
+            self.approve_token(self.nft_contract.address, amount_token1, self.token1_contract),
+        ]
+
+        calls = self._close_calls(token_id, liquidity) + [_encode_call(self.nft_contract, "mint", self._mint_params(new_position, amount_token0, amount_token1))]
+
+        self.logger.info(f"Rebalancing position {token_id} to {new_position.lower_tick} - {new_position.upper_tick} with one multicall")
+        rebalance_transaction = self.transactions.submit(self.nft_contract.functions.multicall(calls))
+
+        receipts = self.transactions.wait_all([approval for approval in approvals if approval is not None] + [rebalance_transaction])
+
+        return receipts[-1]
+
+    def parse_mint_receipt(self, receipt) -> Tuple[int, int, int, int]:
+
+        """
+        Token id, amounts and liquidity of a minted position, from a mint or a multicall receipt
+
+        :return: token id, amount of token0, amount of token1 and liquidity
+        """
+
+        increases = self.nft_contract.events.IncreaseLiquidity().process_receipt(receipt, errors=DISCARD)
+
+        if not increases:
+            raise ValueError(f"No IncreaseLiquidity event in transaction {Web3.to_hex(receipt['transactionHash'])}, nothing was minted")
+
+        increase = increases[-1]["args"]
+
+        return increase["tokenId"], increase["amount0"], increase["amount1"], increase["liquidity"]
+
+    def _close_calls(self, token_id, liquidity) -> List:
+
+        # 1. decrease liquidity, 2. collect tokens and fees, 3. burn the NFT
+        deadline = int(time.time()) + 10 * 60
+
+        return [
+            _encode_call(self.nft_contract, "decreaseLiquidity", (token_id, liquidity, 0, 0, deadline)),
+            _encode_call(self.nft_contract, "collect", (token_id, self.account.address, 2 ** 128 - 1, 2 ** 128 - 1)),
+            _encode_call(self.nft_contract, "burn", token_id),
+        ]
+
+    def _mint_params(self, position: Position, amount_token0, amount_token1) -> Tuple:
+
+        return (
+            self.token0_address,
+            self.token1_address,
+            self.fee,
+            int(position.lower_tick),
+            int(position.upper_tick),
+            int(amount_token0),
+            int(amount_token1),
+            0,
+            0,
             self.account.address,
-            2 ** 128 - 1,
-            2 ** 128 - 1
-        )).build_transaction({
-            'from': self.account.address,
-            'gas': 500000,
-            'nonce': self.provider.eth.get_transaction_count(self.account.address)
-        })
+            int(time.time()) + 10 * 60  # deadline
+        )
 
-        collect_txn_hash, collect_tx_receipt  = self.sign_and_broadcast_transaction(collect_tx)
 
-        # 3. burn position
-        self.logger.info(f"Burning position {token_id}")
-        burn_tx = self.nft_contract.functions.burn((token_id)).build_transaction({
-            'from': self.account.address,
-            'gas': 500000,
-            'nonce': self.provider.eth.get_transaction_count(self.account.address)
-        })
+def _encode_call(contract, function_name, *args) -> str:
 
-        burn_tx_hash, burn_tx_receipt = self.sign_and_broadcast_transaction(burn_tx)
+    # calldata of a contract function for a multicall (encodeABI before web3 v7)
+    if hasattr(contract, "encode_abi"):
+        return contract.encode_abi(function_name, args=list(args))
 
-        return burn_tx_hash, burn_tx_receipt, collect_tx_receipt
+    return contract.encodeABI(fn_name=function_name, args=list(args))
@@ -0,0 +1,115 @@
+import threading
+import numpy as np
+
+
+class RingBuffer:
+
+    """
+    Preallocated buffer that keeps the last `capacity` rows of event data
+
+    Every row is written twice, at position i and i + capacity, so the last n rows are always
+    one contiguous slice of the storage and can be handed out as a view without copying.
+    Appends are O(rows appended) and never allocate.
+
+    Views are overwritten by later appends; readers in another thread than the writer should use
+    snapshot() which copies the rows under the lock.
+    """
+
+    def __init__(self, capacity, columns, dtype=np.float64):
+
+        self.capacity = capacity
+        self.columns = columns
+
+        self._data = np.zeros((2 * capacity, columns), dtype=dtype)
+        self._end = 0
+        self._size = 0
+
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, index):
+        return self.view()[index]
+
+    def extend(self, rows) -> None:
+
+        """
+        Append rows, the oldest rows are dropped once the capacity is reached
+
+        :param rows: array or list of rows with `columns` values each
+        """
+
+        if len(rows) == 0:
+            return
+
+        rows = np.asarray(rows, dtype=self._data.dtype).reshape(-1, self.columns)[-self.capacity:]
+        count = len(rows)
+
+        with self.lock:
+            first = min(count, self.capacity - self._end)
+            rest = count - first
+
+            self._data[self._end:self._end + first] = rows[:first]
+            self._data[self._end + self.capacity:self._end + self.capacity + first] = rows[:first]
+
+            self._data[:rest] = rows[first:]
+            self._data[self.capacity:self.capacity + rest] = rows[first:]
+
+            self._end = (self._end + count) % self.capacity
+            self._size = min(self._size + count, self.capacity)
+
+    def append(self, row) -> None:
+        self.extend([row])
+
+    def replace_last(self, row) -> None:
+
+        """
+        Overwrite the most recent row
+        """
+
+        if self._size == 0:
+            raise IndexError("Cannot replace the last row of an empty buffer")
+
+        with self.lock:
+            index = (self._end - 1) % self.capacity
+            self._data[index] = row
+            self._data[index + self.capacity] = row
+
+    def truncate(self, count) -> None:
+
+        """
+        Drop the most recent rows
+        """
+
+        with self.lock:
+            count = min(count, self._size)
+
+            self._end = (self._end - count) % self.capacity
+            self._size -= count
+
+    def view(self, n=None) -> np.ndarray:
+
+        """
+        Zero-copy view of the last n rows (all rows by default), oldest first
+        """
+
+        n = self._size if n is None else min(n, self._size)
+        end = self._end + self.capacity
+
+        return self._data[end - n:end]
+
+    def snapshot(self, n=None) -> np.ndarray:
+
+        """
+        Copy of the last n rows (all rows by default) that is safe to use while appending
+        """
+
+        with self.lock:
+            return self.view(n).copy()
+
+    def clear(self) -> None:
+
+        with self.lock:
+            self._end = 0
+            self._size = 0
@@ -1,100 +1,99 @@
 import math
-import time
-import threading
 import numpy as np
-import pandas as pd
 
 from .uniwap_math import round_tick
 
 from .provider import Provider
+from .base_strategy import BaseStrategy
 from .protocol_state import ProtocolState
 from .position_manager import PositionManager
 
 
-class Strategy:
+class Strategy(BaseStrategy):
 
-    def __init__(self, provider: Provider, state: ProtocolState, position_manager: PositionManager):
+    # parameters of the example strategy, see on_block
+    DEFAULT_PARAMS = {
+        "close_after_blocks": 5 * 60,
+        "bar_resolution": 5,
+        "lookback_bars": 120,
+        "max_std": 10,
+        "range_scale": math.sqrt(60),
+        "amount_token1": 10**18,
+    }
 
-        self.provider = provider
-        self.state = state
-        self.position_manager = position_manager
+    def __init__(self, provider: Provider, state: ProtocolState, position_manager: PositionManager, params=None):
 
-        self.evaluate = False
-        self.thread = threading.Thread(target=self._evaluate)
+        super().__init__(provider, state, position_manager)
 
-    def _evaluate(self):
+        params = params or {}
+        self.validate_params(params)
 
-        # wait for first tick
-        while self.state.current_tick is None:
-            time.sleep(10)
+        self.params = {**self.DEFAULT_PARAMS, **params}
 
-        while self.evaluate:
+        # block at which the open positions have to be closed, kept up to date by the hooks
+        self.close_at_block = {}
 
-            if not self.provider.backtest:
-                time.sleep(60)
+    @classmethod
+    def validate_params(cls, params) -> None:
 
-            past_swap_data = np.stack(self.state.swap_data, axis=0) if self.state.swap_data else np.array([])
-            past_mint_data = np.stack(self.state.mint_data, axis=0) if self.state.mint_data else np.array([])
-            past_burn_data = np.stack(self.state.burn_data, axis=0) if self.state.burn_data else np.array([])
+        unknown = set(params) - set(cls.DEFAULT_PARAMS)
+        if unknown:
+            raise ValueError(f"Unknown strategy parameters: {', '.join(sorted(unknown))}")
 
-            current_block = self.state.current_block
-            current_tick = self.state.current_tick
-
-            self._strategy(past_swap_data, past_mint_data, past_burn_data, current_block, current_tick)
-
-    def _strategy(self, past_swap_data: np.ndarray, past_mint_data: np.ndarray, past_burn_data: np.ndarray, current_block: int, current_tick: int) -> None:
+    def on_block(self, block) -> None:
 
         """
-        Implement your strategy here (closing and opening of positions)
+        Implement your strategy here (closing and opening of positions), see BaseStrategy for the other hooks
 
-        :param past_swap_data: contains the last swap data
-        :param past_mint_data: contains the last mint data
-        :param past_burn_data: contains the last burn data
-        :param current_block: : contains the current block number
-        :param current_tick: contains the current tick
+        The state holds the history: state.swap_data, state.mint_data and state.burn_data contain the
+        last events, state.bars the tick and volume bars and state.current_tick the current tick.
+        The hooks run in the thread that updates the state, so its data can be read without copies.
+
+        :param block: contains the current block number
         :return: None
         """
 
-        # Simple example strategy: 
+        # Simple example strategy (default parameters):
         #  - close all positions after 5 * 60 blocks (~ 1 hour assuming a block time of 12 seconds)
-        #  - open a new position if no position is open AND the past 120 ticks are within 1 standard deviation of the current tick
-        #  - tick range of new position is the standard deviation of the past 2 hours
+        #  - open a new position if no position is open AND the std of the past 120 minute-by-minute tick changes is at most 10
+        #  - tick range of new position is the std extrapolated to 1 hour (sqrt(60))
+
+        params = self.params
 
         # evaluate open positions
-        for index in self.position_manager.open_positions_index:
-            if self.position_manager.positions_meta_data[index]["block"] + 60 * 5 <= current_block:
+        for index, close_at_block in list(self.close_at_block.items()):
+            if close_at_block <= block:
                 self.position_manager.close_position(index)
 
         # consider every 5th block in order to get minute-by-minute data
-        data = pd.DataFrame(past_swap_data)
-        reduced_data = data.groupby(data.iloc[:,0] // 5).apply(lambda x: x.iloc[-1]).to_numpy()
+        bars = self.state.bars[params["bar_resolution"]]
 
-        # not enough data to make informed decision
-        if reduced_data.shape[0] < 120:
+        # not enough data to make informed decision or already open position
+        if len(bars) < params["lookback_bars"] or len(self.position_manager.open_positions_index) > 0:
             return
 
         # consider the last 2 hours
-        last_2_hours = reduced_data[-120:, self.state.TICK_INDEX]
+        last_closes = bars.close(params["lookback_bars"])
 
         # calculate the standard deviation of the minute-by-minute tick change
-        delta = np.diff(last_2_hours)
+        delta = np.diff(last_closes)
         std = np.std(delta)
 
-        # too much volatility or already open position
-        if std > 10 or len(self.position_manager.open_positions_index) > 0:
-            time.sleep(2)
+        # too much volatility
+        if std > params["max_std"]:
             return
 
+        current_tick = self.state.current_tick
+
         # open a new position -> extrapolate the minute-by-minute std to 1 hour
-        upper_tick = round_tick((current_tick + std * math.sqrt(60)))
-        lower_tick = round_tick((current_tick - std * math.sqrt(60)))
-        
-        self.position_manager.open_position(lower_tick, upper_tick, y_real=10**18)
-
-    def start(self):
-        self.evaluate = True
-        self.thread.start()
-    
-    def stop(self):
-        self.evaluate = False
-        self.thread.join()
+        upper_tick = round_tick((current_tick + std * params["range_scale"]))
+        lower_tick = round_tick((current_tick - std * params["range_scale"]))
+
+        opened = len(self.position_manager.positions)
+        self.position_manager.open_position(lower_tick, upper_tick, y_real=params["amount_token1"])
+
+        if len(self.position_manager.positions) > opened:
+            self.close_at_block[opened] = block + params["close_after_blocks"]
+
+    def on_position_closed(self, index, performance) -> None:
+        self.close_at_block.pop(index, None)
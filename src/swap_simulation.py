@@ -0,0 +1,171 @@
+import numpy as np
+from typing import Iterator
+
+from .tick_index import TickIndex, LIQUIDITY_NET_INDEX
+from .exact_math import MIN_TICK, MAX_TICK, MIN_SQRT_RATIO, MAX_SQRT_RATIO, compute_swap_step, get_sqrt_ratio_at_tick, get_tick_at_sqrt_ratio
+
+
+def swap_steps(tick_index: TickIndex, sqrt_price_x96, tick, liquidity, fee, amount_specified, zero_for_one, sqrt_price_limit_x96=None) -> Iterator[dict]:
+
+    """
+    Steps of a swap as executed by the pool contract, one per tick range
+
+    Every step is a dict with the price, tick and liquidity at its start and end, the target
+    price, the amounts and the crossed tick (None if no initialized tick was crossed). The ticks
+    are not modified; callers that keep the fee growth (PoolReplayer) cross them when a step is
+    returned.
+
+    :param amount_specified: positive for exact input, negative for exact output
+    :param zero_for_one: token0 in, token1 out
+    :param sqrt_price_limit_x96: price the swap must not pass, the price bound if not given
+    """
+
+    if sqrt_price_limit_x96 is None:
+        sqrt_price_limit_x96 = MIN_SQRT_RATIO + 1 if zero_for_one else MAX_SQRT_RATIO - 1
+
+    amount_remaining = amount_specified
+
+    while amount_remaining != 0 and sqrt_price_x96 != sqrt_price_limit_x96:
+
+        tick_next, initialized = tick_index.next_initialized_tick_within_one_word(tick, zero_for_one)
+        tick_next = min(max(tick_next, MIN_TICK), MAX_TICK)
+
+        if not tick_index.covers(min(tick, tick_next), max(tick, tick_next)):
+            raise ValueError(f"Swap moves from tick {tick} to tick {tick_next}, outside of the known ticks {tick_index.loaded_range}")
+
+        sqrt_price_next_x96 = get_sqrt_ratio_at_tick(tick_next)
+
+        if (sqrt_price_next_x96 < sqrt_price_limit_x96) if zero_for_one else (sqrt_price_next_x96 > sqrt_price_limit_x96):
+            sqrt_price_target_x96 = sqrt_price_limit_x96
+        else:
+            sqrt_price_target_x96 = sqrt_price_next_x96
+
+        step = {"sqrt_price_start_x96": sqrt_price_x96, "tick_start": tick, "liquidity": liquidity, "sqrt_price_target_x96": sqrt_price_target_x96}
+
+        sqrt_price_x96, amount_in, amount_out, fee_amount = compute_swap_step(sqrt_price_x96, sqrt_price_target_x96, liquidity, amount_remaining, fee)
+
+        if amount_specified > 0:
+            amount_remaining -= amount_in + fee_amount
+        else:
+            amount_remaining += amount_out
+
+        crossed = None
+        if sqrt_price_x96 == sqrt_price_next_x96:
+            if initialized:
+                liquidity_net = tick_index.get(tick_next)[LIQUIDITY_NET_INDEX]
+                liquidity = liquidity - liquidity_net if zero_for_one else liquidity + liquidity_net
+                crossed = tick_next
+
+            tick = tick_next - 1 if zero_for_one else tick_next
+        elif sqrt_price_x96 != step["sqrt_price_start_x96"]:
+            tick = get_tick_at_sqrt_ratio(sqrt_price_x96)
+
+        step.update({"sqrt_price_x96": sqrt_price_x96, "tick": tick, "liquidity_after": liquidity, "amount_in": amount_in, "amount_out": amount_out, "fee_amount": fee_amount, "crossed": crossed, "reached_target": sqrt_price_x96 == sqrt_price_target_x96})
+
+        yield step
+
+        # the price did not move and the target was not reached -> nothing left to swap
+        if sqrt_price_x96 == step["sqrt_price_start_x96"] and not step["reached_target"]:
+            break
+
+def simulate_swap(tick_index: TickIndex, sqrt_price_x96, tick, liquidity, fee, amount_specified, zero_for_one, sqrt_price_limit_x96=None) -> dict:
+
+    """
+    Outcome of a swap against the given pool state without executing it
+
+    :param tick_index: initialized ticks of the pool
+    :param amount_specified: positive for exact input, negative for exact output
+    :param zero_for_one: token0 in, token1 out
+    :return: amount_in (including the fee), amount_out, fee_amount, the final sqrt_price_x96,
+        tick and liquidity and the crossed initialized ticks
+    """
+
+    result = {"amount_in": 0, "amount_out": 0, "fee_amount": 0, "sqrt_price_x96": sqrt_price_x96, "tick": tick, "liquidity": liquidity, "ticks_crossed": []}
+
+    for step in swap_steps(tick_index, sqrt_price_x96, tick, liquidity, fee, amount_specified, zero_for_one, sqrt_price_limit_x96):
+        result["amount_in"] += step["amount_in"] + step["fee_amount"]
+        result["amount_out"] += step["amount_out"]
+        result["fee_amount"] += step["fee_amount"]
+
+        result.update({"sqrt_price_x96": step["sqrt_price_x96"], "tick": step["tick"], "liquidity": step["liquidity_after"]})
+
+        if step["crossed"] is not None:
+            result["ticks_crossed"].append(step["crossed"])
+
+    return result
+
+def simulate_swap_ladder(tick_index: TickIndex, sqrt_price_x96, tick, liquidity, fee, amounts, zero_for_one, sqrt_price_limit_x96=None) -> dict:
+
+    """
+    simulate_swap for many trade sizes at once
+
+    The ticks are walked once for the largest amount. A step that reaches its target consumes
+    the same amount for every trade size that reaches it, so the completed steps of each size
+    follow from a search in the cumulative amounts and only the last, partial step is computed
+    per size. Results are identical to calling simulate_swap for every amount.
+
+    :param amounts: trade sizes, all positive (exact input) or all negative (exact output)
+    :return: same keys as simulate_swap with one entry per amount, ticks_crossed is the number
+        of crossed initialized ticks
+    """
+
+    amounts = [int(amount) for amount in np.ravel(amounts)]
+    exact_input = all(amount >= 0 for amount in amounts)
+
+    if not exact_input and any(amount > 0 for amount in amounts):
+        raise ValueError("Amounts have to be all exact input (positive) or all exact output (negative)")
+
+    largest = max(amounts) if exact_input else min(amounts)
+    steps = list(swap_steps(tick_index, sqrt_price_x96, tick, liquidity, fee, largest, zero_for_one, sqrt_price_limit_x96))
+
+    # amount of the specified token consumed up to the end of every step
+    consumed = [step["amount_in"] + step["fee_amount"] if exact_input else step["amount_out"] for step in steps]
+    consumed_after = np.cumsum(np.array([0] + consumed, dtype=object))[1:]
+
+    # only the steps that reached their target are the same for smaller amounts
+    completed_steps = next((i for i, step in enumerate(steps) if not step["reached_target"]), len(steps))
+
+    totals = {key: np.cumsum(np.array([0] + [step[key] for step in steps], dtype=object)) for key in ("amount_in", "amount_out", "fee_amount")}
+    crossed = np.cumsum([0] + [step["crossed"] is not None for step in steps])
+
+    result = {key: np.empty(len(amounts), dtype=object) for key in ("amount_in", "amount_out", "fee_amount", "sqrt_price_x96", "tick", "liquidity")}
+    result["ticks_crossed"] = np.zeros(len(amounts), dtype=np.int64)
+
+    completed = np.searchsorted(consumed_after[:completed_steps], np.array([abs(amount) for amount in amounts], dtype=object), side="right")
+
+    for i, (amount, k) in enumerate(zip(amounts, completed)):
+        k = int(k)
+
+        amount_in, amount_out, fee_amount = totals["amount_in"][k], totals["amount_out"][k], totals["fee_amount"][k]
+        remaining = abs(amount) - (consumed_after[k - 1] if k > 0 else 0)
+
+        if k > 0:
+            state = (steps[k - 1]["sqrt_price_x96"], steps[k - 1]["tick"], steps[k - 1]["liquidity_after"])
+        else:
+            state = (sqrt_price_x96, tick, liquidity)
+
+        if remaining > 0 and k < len(steps):
+            # last step stops within the tick range of step k
+            step = steps[k]
+            sqrt_price_next_x96, step_in, step_out, step_fee = compute_swap_step(step["sqrt_price_start_x96"], step["sqrt_price_target_x96"], step["liquidity"], remaining if exact_input else -remaining, fee)
+
+            amount_in, amount_out, fee_amount = amount_in + step_in, amount_out + step_out, fee_amount + step_fee
+            tick_after = get_tick_at_sqrt_ratio(sqrt_price_next_x96) if sqrt_price_next_x96 != step["sqrt_price_start_x96"] else step["tick_start"]
+
+            state = (sqrt_price_next_x96, tick_after, step["liquidity"])
+
+        result["amount_in"][i] = amount_in + fee_amount
+        result["amount_out"][i] = amount_out
+        result["fee_amount"][i] = fee_amount
+        result["sqrt_price_x96"][i], result["tick"][i], result["liquidity"][i] = state
+        result["ticks_crossed"][i] = crossed[k]
+
+    return result
+
+def price_impact(sqrt_price_before_x96, sqrt_price_after_x96) -> float:
+
+    """
+    Relative change of the price (token1 per token0) caused by a swap
+    """
+
+    return (sqrt_price_after_x96 / sqrt_price_before_x96) ** 2 - 1
@@ -0,0 +1,226 @@
+import csv
+import itertools
+import multiprocessing
+from typing import List, Tuple
+from concurrent.futures import ProcessPoolExecutor
+
+from .backtest import Backtest
+from .strategy import Strategy
+from .provider import Provider
+from .protocol_state import ProtocolState
+from .position_manager import PositionManager
+from .pool_replay import PoolReplayer
+
+RESULT_COLUMNS = ["positions", "fees", "value_position", "value_hold", "pnl", "gas_cost", "net_pnl"]
+
+# provider of the worker processes, loaded once and restarted for every backtest
+_provider = None
+
+
+def parameter_grid(grid: dict) -> List[dict]:
+
+    """
+    All combinations of the strategy parameters
+
+    :param grid: parameter name -> list of values
+    """
+
+    names = list(grid)
+
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+def shard_ranges(first_block, last_block, shards, warmup_blocks=0) -> List[Tuple[int, int, int]]:
+
+    """
+    Split a block range into consecutive shards
+
+    :param warmup_blocks: blocks before every shard that are replayed to fill the history of
+        the strategy, the first shard starts without warm-up
+    :return: (warm-up start, first block, last block) of every shard
+    """
+
+    size = -(-(last_block - first_block + 1) // shards)
+
+    ranges = []
+    for start in range(first_block, last_block + 1, size):
+        ranges.append((max(first_block, start - warmup_blocks), start, min(start + size - 1, last_block)))
+
+    return ranges
+
+def run_shards(provider_kwargs: dict, grid: dict, shards=1, warmup_blocks=None, max_workers=None) -> List[dict]:
+
+    """
+    Backtest every configuration of the grid on every shard of the block range in parallel
+
+    Every shard starts from the pool snapshot at its warm-up start, reconstructed by replaying
+    the events from the snapshot of the backtest once. Positions still open at the end of a
+    shard are closed at its last block, so the shards are independent of each other.
+
+    The events are loaded once: with fork the workers inherit the provider of this process and
+    share its memory mapped event data, otherwise every worker loads it once in its initializer.
+
+    :param provider_kwargs: arguments of the backtest Provider, more than one shard requires a pool snapshot
+    :param grid: parameter name -> list of values, see Strategy.DEFAULT_PARAMS
+    :param shards: number of shards of the block range
+    :param warmup_blocks: warm-up before every shard, the history the strategy needs if None
+    :param max_workers: number of processes, all cores if None
+    :return: one row per configuration and shard with the parameters, the blocks and the
+        results, ordered by configuration and block
+    """
+
+    global _provider
+
+    configurations = parameter_grid(grid)
+
+    # fail before starting any worker
+    for params in configurations:
+        Strategy.validate_params(params)
+
+    if warmup_blocks is None:
+        warmup_blocks = max(_history_blocks({**Strategy.DEFAULT_PARAMS, **params}) for params in configurations)
+
+    _provider = Provider(**provider_kwargs)
+
+    ranges = shard_ranges(_provider.first_block, _provider.last_block, shards, warmup_blocks)
+
+    if len(ranges) == 1:
+        snapshots = [None]
+    elif not _provider.snapshot:
+        raise ValueError("Sharded backtests replay the pool state and require a pool snapshot")
+    else:
+        # pool state at the start of every shard, in one pass over the events
+        replayer = PoolReplayer(_provider.snapshot, *_provider.exact_events)
+        snapshots = [replayer.advance_to(max(warmup_start - 1, replayer.block)).to_snapshot() for warmup_start, _, _ in ranges]
+
+    tasks = [(params, shard_range, snapshot) for params in configurations for shard_range, snapshot in zip(ranges, snapshots)]
+
+    if "fork" in multiprocessing.get_all_start_methods():
+        executor = ProcessPoolExecutor(max_workers, mp_context=multiprocessing.get_context("fork"))
+    else:
+        executor = ProcessPoolExecutor(max_workers, initializer=_init_worker, initargs=(provider_kwargs,))
+
+    with executor:
+        results = list(executor.map(_run_shard, tasks))
+
+    return [{**params, "from_block": shard_range[1], "to_block": shard_range[2], **result} for (params, shard_range, _), result in zip(tasks, results)]
+
+def run_sweep(provider_kwargs: dict, grid: dict, shards=1, warmup_blocks=None, max_workers=None) -> List[dict]:
+
+    """
+    Backtest every configuration of the grid, see run_shards
+
+    :return: one row per configuration with the parameters and the results stitched over the shards
+    """
+
+    rows = run_shards(provider_kwargs, grid, shards, warmup_blocks, max_workers)
+
+    return [stitch_results(list(shard_rows)) for _, shard_rows in itertools.groupby(rows, key=_params_of)]
+
+def walk_forward(rows: List[dict]) -> List[dict]:
+
+    """
+    Walk-forward evaluation of the rows of run_shards
+
+    For every shard but the first, the configuration with the best PnL net of gas on the previous
+    shard is evaluated on it.
+
+    :return: one row per evaluated shard with the chosen configuration and its results
+    """
+
+    shards = {}
+    for row in rows:
+        shards.setdefault(row["from_block"], []).append(row)
+
+    blocks = sorted(shards)
+
+    evaluated = []
+    for previous, current in zip(blocks, blocks[1:]):
+        best = max(shards[previous], key=lambda row: row["net_pnl"])
+        evaluated.append(next(row for row in shards[current] if _params_of(row) == _params_of(best)))
+
+    return evaluated
+
+def stitch_results(rows: List[dict]) -> dict:
+
+    """
+    Combine the results of consecutive shards of one configuration
+    """
+
+    rows = sorted(rows, key=lambda row: row["from_block"])
+
+    stitched = {**rows[0], "to_block": rows[-1]["to_block"]}
+    for column in RESULT_COLUMNS:
+        stitched[column] = sum(row[column] for row in rows)
+
+    return stitched
+
+def summarize_performance(performance: List[dict], token1_decimals, eth_price=1.0) -> dict:
+
+    """
+    Totals of the closed positions in token1, the PnL gross and net of the gas spent on them
+
+    :param eth_price: price of ETH in token1 the gas is valued at, 1 if token1 is WETH
+    """
+
+    fees = sum(sum(entry["accumulated_fees"]) for entry in performance) / 10**token1_decimals
+    value_position = sum(entry["value_position"] for entry in performance) / 10**token1_decimals
+    value_hold = sum(entry["value_hold"] for entry in performance) / 10**token1_decimals
+
+    # gas is recorded in wei
+    gas_cost = sum(entry["gas_cost"] for entry in performance) / 10**18 * eth_price
+
+    pnl = fees + value_position - value_hold
+
+    return {"positions": len(performance), "fees": fees, "value_position": value_position, "value_hold": value_hold, "pnl": pnl, "gas_cost": gas_cost, "net_pnl": pnl - gas_cost}
+
+def write_results(rows: List[dict], path, sort_by="net_pnl") -> None:
+
+    """
+    Write the results table as CSV, by default best configuration first
+
+    :param sort_by: column to sort by (descending), the order of the rows if None
+    """
+
+    if sort_by is not None:
+        rows = sorted(rows, key=lambda row: row[sort_by], reverse=True)
+
+    columns = [column for column in rows[0] if column not in RESULT_COLUMNS] + RESULT_COLUMNS if rows else RESULT_COLUMNS
+
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(rows)
+
+def _history_blocks(params) -> int:
+
+    # blocks of bars the strategy looks back
+    return params["lookback_bars"] * params["bar_resolution"]
+
+def _params_of(row) -> dict:
+    return {key: value for key, value in row.items() if key not in RESULT_COLUMNS and key not in ("from_block", "to_block")}
+
+def _init_worker(provider_kwargs) -> None:
+
+    global _provider
+    _provider = Provider(**provider_kwargs)
+
+def _run_shard(task) -> dict:
+
+    params, (warmup_start, from_block, to_block), snapshot = task
+
+    _provider.restart(warmup_start, to_block, snapshot)
+
+    params = {**Strategy.DEFAULT_PARAMS, **params}
+
+    state = ProtocolState(_provider, bar_resolutions=(params["bar_resolution"],))
+    position_manager = PositionManager(_provider, state)
+    strategy = Strategy(_provider, state, position_manager, params=params)
+
+    Backtest(_provider, state, strategy, trade_from_block=from_block).run()
+
+    # close what is still open at the end of the shard
+    state.current_block = to_block
+    for index in list(position_manager.open_positions_index):
+        position_manager.close_position(index)
+
+    return summarize_performance(position_manager.performance, _provider.token1_decimals)
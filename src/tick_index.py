@@ -0,0 +1,247 @@
+import threading
+import numpy as np
+from typing import List, Optional, Tuple
+
+from .exact_math import MAX_UINT256, next_initialized_tick_within_one_word
+
+# Layout of the stored tick states, same as the first values of the pool's ticks() getter
+LIQUIDITY_GROSS_INDEX = 0
+LIQUIDITY_NET_INDEX = 1
+FEE_GROWTH_OUTSIDE_0_INDEX = 2
+FEE_GROWTH_OUTSIDE_1_INDEX = 3
+
+# loaded_range of an index that only knows a part of the pool but nothing yet
+EMPTY_RANGE = (0, -1)
+
+
+class TickIndex:
+
+    """
+    Sorted, array-backed index of the initialized ticks of a pool
+
+    Keeps the ticks as a sorted int64 array next to an object array of their states
+    [liquidityGross, liquidityNet, feeGrowthOutside0X128, feeGrowthOutside1X128] as Python ints.
+    Next initialized tick queries are binary searches, the active liquidity at any set of ticks is
+    read from a prefix sum of liquidityNet that is rebuilt lazily after the ticks changed.
+
+    The index may only know a part of the pool: loaded_range is the range of ticks whose states
+    have been loaded, EMPTY_RANGE before the first load and None if the index holds all
+    initialized ticks (e.g. from a snapshot).
+    """
+
+    def __init__(self, tick_spacing, tick_states=None, loaded_range=None):
+
+        self.tick_spacing = tick_spacing
+
+        self.ticks = np.empty(0, dtype=np.int64)
+        self.states = np.empty((0, 4), dtype=object)
+
+        self.loaded_range = loaded_range
+
+        # prefix sum of liquidityNet over self.ticks, None if outdated
+        self._cumulative_net = None
+
+        self.lock = threading.Lock()
+
+        if tick_states:
+            self.load(tick_states)
+
+    def __len__(self):
+        return len(self.ticks)
+
+    def __contains__(self, tick):
+        return self._position(int(tick)) is not None
+
+    def load(self, tick_states: dict, lower=None, upper=None) -> None:
+
+        """
+        Set the states of many ticks at once
+
+        :param tick_states: tick -> tick state (the pool's ticks() layout or its first four values),
+            ticks with no liquidity are removed from the index
+        :param lower: first tick of the loaded range, extends loaded_range together with upper
+        :param upper: last tick of the loaded range
+        """
+
+        with self.lock:
+            states = {int(tick): tick_state for tick, tick_state in tick_states.items()}
+
+            keep = ~np.isin(self.ticks, np.fromiter(states.keys(), dtype=np.int64, count=len(states)))
+
+            new_ticks = [tick for tick, tick_state in states.items() if tick_state is not None and int(tick_state[0]) > 0]
+            new_states = np.empty((len(new_ticks), 4), dtype=object)
+            for i, tick in enumerate(new_ticks):
+                new_states[i] = [int(value) for value in states[tick][:4]]
+
+            ticks = np.concatenate([self.ticks[keep], np.array(new_ticks, dtype=np.int64)])
+            order = np.argsort(ticks, kind="stable")
+
+            self.ticks = ticks[order]
+            self.states = np.concatenate([self.states[keep], new_states])[order]
+            self._cumulative_net = None
+
+            if lower is not None and upper is not None and self.loaded_range is not None:
+                if self.loaded_range[0] > self.loaded_range[1] or lower > self.loaded_range[1] + self.tick_spacing or upper < self.loaded_range[0] - self.tick_spacing:
+                    self.loaded_range = (int(lower), int(upper))
+                else:
+                    self.loaded_range = (min(self.loaded_range[0], int(lower)), max(self.loaded_range[1], int(upper)))
+
+    def clear(self) -> None:
+
+        with self.lock:
+            self.ticks = np.empty(0, dtype=np.int64)
+            self.states = np.empty((0, 4), dtype=object)
+            self._cumulative_net = None
+
+            if self.loaded_range is not None:
+                self.loaded_range = EMPTY_RANGE
+
+    def covers(self, lower, upper) -> bool:
+
+        """
+        Whether the states of all ticks between lower and upper are known
+        """
+
+        loaded_range = self.loaded_range
+
+        return loaded_range is None or (loaded_range[0] <= lower and upper <= loaded_range[1])
+
+    def get(self, tick) -> Optional[List[int]]:
+
+        """
+        State of the tick or None if it is not initialized
+        """
+
+        with self.lock:
+            position = self._position(int(tick))
+            return None if position is None else list(self.states[position])
+
+    def to_dict(self) -> dict:
+
+        with self.lock:
+            return {int(tick): list(tick_state) for tick, tick_state in zip(self.ticks, self.states)}
+
+    def update(self, tick, liquidity_delta, upper, current_tick=None, fee_growth_global_0_x128=0, fee_growth_global_1_x128=0) -> bool:
+
+        """
+        Apply a liquidity change of a position bounded by the tick, like Tick.update of the pool
+
+        :param upper: whether the tick is the upper tick of the position
+        :param current_tick: current tick of the pool, initializes the fee growth outside of new ticks
+        :return: True if the tick got initialized or uninitialized
+        """
+
+        tick = int(tick)
+
+        with self.lock:
+            position = self._position(tick)
+            flipped = position is None
+
+            if position is None:
+                tick_state = [0, 0, 0, 0]
+
+                # by convention all growth before a tick was initialized happened below it
+                if current_tick is not None and tick <= current_tick:
+                    tick_state[FEE_GROWTH_OUTSIDE_0_INDEX] = fee_growth_global_0_x128
+                    tick_state[FEE_GROWTH_OUTSIDE_1_INDEX] = fee_growth_global_1_x128
+
+                position = int(np.searchsorted(self.ticks, tick))
+                self.ticks = np.insert(self.ticks, position, tick)
+                self.states = np.insert(self.states, position, np.array([tick_state], dtype=object), axis=0)
+
+            self.states[position, LIQUIDITY_GROSS_INDEX] += liquidity_delta
+            self.states[position, LIQUIDITY_NET_INDEX] += -liquidity_delta if upper else liquidity_delta
+
+            if self.states[position, LIQUIDITY_GROSS_INDEX] <= 0:
+                self.ticks = np.delete(self.ticks, position)
+                self.states = np.delete(self.states, position, axis=0)
+                flipped = True
+
+            self._cumulative_net = None
+
+            return flipped
+
+    def cross(self, tick, fee_growth_global_0_x128, fee_growth_global_1_x128) -> int:
+
+        """
+        Flip the fee growth outside of a crossed tick, like Tick.cross of the pool
+
+        :return: liquidityNet of the tick
+        """
+
+        with self.lock:
+            position = self._position(int(tick))
+
+            tick_state = self.states[position]
+            tick_state[FEE_GROWTH_OUTSIDE_0_INDEX] = (fee_growth_global_0_x128 - tick_state[FEE_GROWTH_OUTSIDE_0_INDEX]) % (MAX_UINT256 + 1)
+            tick_state[FEE_GROWTH_OUTSIDE_1_INDEX] = (fee_growth_global_1_x128 - tick_state[FEE_GROWTH_OUTSIDE_1_INDEX]) % (MAX_UINT256 + 1)
+
+            return tick_state[LIQUIDITY_NET_INDEX]
+
+    def next_initialized_tick(self, tick, lte) -> Optional[int]:
+
+        """
+        Closest initialized tick at or below (lte) or above the tick, None if there is none
+        """
+
+        ticks = self.ticks
+
+        if lte:
+            position = int(np.searchsorted(ticks, tick, side="right")) - 1
+            return int(ticks[position]) if position >= 0 else None
+
+        position = int(np.searchsorted(ticks, tick, side="right"))
+        return int(ticks[position]) if position < len(ticks) else None
+
+    def next_initialized_tick_within_one_word(self, tick, lte) -> Tuple[int, bool]:
+
+        """
+        Same result as TickBitmap.nextInitializedTickWithinOneWord of the pool
+        """
+
+        return next_initialized_tick_within_one_word(self.ticks, tick, self.tick_spacing, lte)
+
+    def ticks_between(self, lower, upper) -> np.ndarray:
+
+        """
+        Initialized ticks in (lower, upper], i.e. the ticks crossed when the price moves between them
+        """
+
+        ticks = self.ticks
+
+        return ticks[np.searchsorted(ticks, lower, side="right"):np.searchsorted(ticks, upper, side="right")]
+
+    def liquidity_at(self, ticks, current_tick, current_liquidity) -> np.ndarray:
+
+        """
+        Active liquidity if the price were at the given ticks
+
+        Starting from the current liquidity, adds the liquidityNet of all initialized ticks between
+        the current tick and each tick, from the prefix sum of liquidityNet.
+
+        :param ticks: array of ticks
+        :param current_tick: current tick of the pool
+        :param current_liquidity: active liquidity at the current tick
+        :return: object array of Python ints with the shape of ticks
+        """
+
+        with self.lock:
+            if self._cumulative_net is None:
+                self._cumulative_net = np.concatenate([np.array([0], dtype=object), np.cumsum(self.states[:, LIQUIDITY_NET_INDEX])]) if len(self.ticks) else np.array([0], dtype=object)
+
+            sorted_ticks, cumulative_net = self.ticks, self._cumulative_net
+
+        # sum of liquidityNet of the initialized ticks <= tick
+        net_below = cumulative_net[np.searchsorted(sorted_ticks, np.asarray(ticks), side="right")]
+        net_below_current = cumulative_net[np.searchsorted(sorted_ticks, current_tick, side="right")]
+
+        return int(current_liquidity) + net_below - net_below_current
+
+    def _position(self, tick) -> Optional[int]:
+
+        position = int(np.searchsorted(self.ticks, tick))
+
+        if position < len(self.ticks) and self.ticks[position] == tick:
+            return position
+
+        return None
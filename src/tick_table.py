@@ -0,0 +1,160 @@
+import math
+import threading
+import numpy as np
+
+from .exact_math import MIN_TICK, MAX_TICK, get_sqrt_ratio_at_tick, get_sqrt_ratio_at_tick_batch
+
+
+class TickTable:
+
+    """
+    Lazily built lookup table of the prices of the ticks that are multiples of tick_spacing
+
+    Entry i holds the values of tick (first index + i) * tick_spacing. The table starts empty and
+    grows by at least `window` entries around every tick that is looked up, so only the active
+    part of the tick range is ever computed. The float values are computed with np.power (within
+    an ulp of math.pow in uniwap_math), the exact Q64.96 values like the pool's TickMath.
+
+    Every pool has its own spacing, so the table of a pool is get_tick_table(tick_spacing).
+
+    Ticks that are not multiples of the spacing or would grow the table beyond max_size are
+    computed directly.
+    """
+
+    def __init__(self, tick_spacing=1, window=1024, max_size=2**20):
+
+        self.tick_spacing = tick_spacing
+        self.window = window
+        self.max_size = max_size
+
+        # (first index, float sqrt prices, float prices, exact sqrt prices), replaced as a whole
+        # when the table grows so that readers never see a partially updated table
+        self.table = (0, np.empty(0), np.empty(0), np.empty(0, dtype=object))
+
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.table[1])
+
+    def sqrt_price(self, tick) -> float:
+
+        table, index = self._index(tick)
+        return float(np.power(1.0001, tick / 2)) if table is None else table[1].item(index)
+
+    def price(self, tick) -> float:
+
+        table, index = self._index(tick)
+        return float(np.power(1.0001, float(tick))) if table is None else table[2].item(index)
+
+    def sqrt_price_x96(self, tick) -> int:
+
+        table, index = self._index(tick)
+        return get_sqrt_ratio_at_tick(tick) if table is None else table[3][index]
+
+    def sqrt_prices_for(self, ticks) -> np.ndarray:
+
+        """
+        Float sqrt prices of an array of ticks
+        """
+
+        table, indices = self._indices(ticks)
+        return np.power(1.0001, np.asarray(ticks, dtype=np.float64) / 2) if table is None else table[1][indices]
+
+    def prices_for(self, ticks) -> np.ndarray:
+
+        table, indices = self._indices(ticks)
+        return np.power(1.0001, np.asarray(ticks, dtype=np.float64)) if table is None else table[2][indices]
+
+    def sqrt_prices_x96_for(self, ticks) -> np.ndarray:
+
+        """
+        Exact sqrt prices (Q64.96) of an array of ticks, object array of Python ints
+        """
+
+        table, indices = self._indices(ticks)
+        return get_sqrt_ratio_at_tick_batch(np.asarray(ticks, dtype=np.int64)) if table is None else table[3][indices]
+
+    def _index(self, tick):
+
+        if tick != int(tick) or int(tick) % self.tick_spacing != 0:
+            return None, None
+
+        index = int(tick) // self.tick_spacing
+
+        table = self._ensure(index, index)
+        if table is None:
+            return None, None
+
+        return table, index - table[0]
+
+    def _indices(self, ticks):
+
+        ticks = np.asarray(ticks)
+
+        if ticks.size == 0 or np.any(ticks != np.floor(ticks)) or np.any(ticks.astype(np.int64) % self.tick_spacing != 0):
+            return None, None
+
+        indices = ticks.astype(np.int64) // self.tick_spacing
+
+        table = self._ensure(int(indices.min()), int(indices.max()))
+        if table is None:
+            return None, None
+
+        return table, indices - table[0]
+
+    def _ensure(self, first_index, last_index):
+
+        table = self.table
+        if len(table[1]) > 0 and table[0] <= first_index and last_index < table[0] + len(table[1]):
+            return table
+
+        with self.lock:
+            current_first, sqrt_prices, prices, sqrt_prices_x96 = self.table
+            current_last = current_first + len(sqrt_prices) - 1
+
+            if len(sqrt_prices) == 0:
+                current_first, current_last = first_index, first_index - 1
+
+            new_first = max(min(current_first, first_index - self.window), math.ceil(MIN_TICK / self.tick_spacing))
+            new_last = min(max(current_last, last_index + self.window), MAX_TICK // self.tick_spacing)
+
+            if first_index < new_first or last_index > new_last or new_last - new_first + 1 > self.max_size:
+                return None
+
+            below = self._compute(new_first, current_first)
+            above = self._compute(current_last + 1, new_last + 1)
+
+            self.table = (
+                new_first,
+                np.concatenate([below[0], sqrt_prices, above[0]]),
+                np.concatenate([below[1], prices, above[1]]),
+                np.concatenate([below[2], sqrt_prices_x96, above[2]]),
+            )
+
+            return self.table
+
+    def _compute(self, first_index, end_index):
+
+        ticks = np.arange(first_index, max(first_index, end_index), dtype=np.int64) * self.tick_spacing
+
+        sqrt_prices = np.power(1.0001, ticks / 2)
+        prices = np.power(1.0001, ticks.astype(np.float64))
+        sqrt_prices_x96 = get_sqrt_ratio_at_tick_batch(ticks) if len(ticks) else np.empty(0, dtype=object)
+
+        return sqrt_prices, prices, sqrt_prices_x96
+
+
+_tick_tables = {}
+_tick_tables_lock = threading.Lock()
+
+def get_tick_table(tick_spacing=1) -> TickTable:
+
+    """
+    Shared table for the given tick spacing
+    """
+
+    with _tick_tables_lock:
+        if tick_spacing not in _tick_tables:
+            _tick_tables[tick_spacing] = TickTable(tick_spacing)
+
+        return _tick_tables[tick_spacing]
@@ -0,0 +1,348 @@
+import math
+import time
+import logging
+import threading
+from typing import List, Optional, Tuple
+from concurrent.futures import Future, FIRST_EXCEPTION, wait
+
+from web3.exceptions import TransactionNotFound
+
+from .fee_policy import gas_cost, gas_key
+
+
+class TransactionReverted(RuntimeError):
+
+    """
+    A transaction was mined but reverted (receipt status 0)
+    """
+
+    def __init__(self, transaction_hash, receipt):
+
+        super().__init__(f"Transaction {transaction_hash.hex()} reverted")
+
+        self.transaction_hash = transaction_hash
+        self.receipt = receipt
+
+
+class PendingTransaction:
+
+    """
+    Transaction that has been sent, with all hashes it was sent under (fee bumps)
+    """
+
+    def __init__(self, nonce, transaction, transaction_hash):
+
+        self.nonce = nonce
+        self.transaction = transaction
+        self.hashes = [transaction_hash]
+
+        self.sent_at = time.monotonic()
+        self.bumps = 0
+
+        # set to (hash of the mined transaction, receipt)
+        self.future = Future()
+
+        # type of the call whose gas limit is learned from the receipt, see fee_policy.gas_key
+        self.gas_key = None
+
+    @property
+    def hash(self):
+        return self.hashes[-1]
+
+    def done(self) -> bool:
+        return self.future.done()
+
+    def wait(self, timeout=None) -> Tuple:
+
+        """
+        Block until the transaction is mined
+
+        :return: hash of the mined transaction and its receipt
+        :raises TransactionReverted: if the transaction reverted
+        """
+
+        return self.future.result(timeout)
+
+
+class TransactionManager:
+
+    """
+    Sends the transactions of an account without waiting for each of them to be mined
+
+    The nonce is tracked locally: it is read from the node once and then incremented for every
+    transaction, so dependent transactions (e.g. approve -> swap -> mint) are all sent right
+    away with consecutive nonces and can be mined in the same block. The node executes them in
+    nonce order.
+
+    A single background thread polls the receipts of all pending transactions. A transaction
+    that is not mined after bump_after seconds is replaced by the same transaction with fees
+    raised by bump_factor (at most max_bumps times). A failed poll (e.g. a node timeout) is
+    logged and retried with the next one. Waiters give up after wait_timeout seconds.
+
+    With a fee policy, the gas limit is estimated and the EIP-1559 fees are set by the policy.
+    Gas is only estimated when no transaction of the account is pending: a transaction sent
+    behind pending ones may depend on them (e.g. a swap on an approval) and the estimate at the
+    latest block would be wrong. The policy's learned limit of the call type is used instead,
+    the gas used by every mined transaction is fed back into it.
+    """
+
+    def __init__(self, w3, account, fee_policy=None, bump_after=36, bump_factor=1.125, max_bumps=5, poll_interval=1, wait_timeout=900):
+
+        self.w3 = w3
+        self.account = account
+        self.fee_policy = fee_policy
+
+        self.bump_after = bump_after
+        self.bump_factor = bump_factor
+        self.max_bumps = max_bumps
+        self.poll_interval = poll_interval
+        self.wait_timeout = wait_timeout
+
+        # next nonce to use, read from the node on the first transaction
+        self.nonce = None
+
+        # nonce -> PendingTransaction
+        self.pending = {}
+
+        # realized cost of all mined transactions in wei
+        self.gas_spent = 0
+
+        # called with the receipt and the transaction of every mined transaction before its waiters are woken up
+        self.receipt_listeners = []
+
+        self.lock = threading.Lock()
+        self.new_transaction = threading.Event()
+        self.thread = None
+
+        self.logger = logging.getLogger('logger3')
+
+    def submit(self, function, params=None, urgency=None) -> PendingTransaction:
+
+        """
+        Build, sign and send a transaction with the next nonce
+
+        :param function: contract function to call, e.g. contract.functions.approve(spender, amount)
+        :param params: transaction parameters besides from and nonce (gas, value, fees), with a fee
+            policy the gas is the limit used if it cannot be estimated
+        :param urgency: urgency of the fees (low, normal or high), the one of the fee policy by default
+        """
+
+        with self.lock:
+            nonce = self._sync_nonce()
+
+            try:
+                params = {**(params or {}), "from": self.account.address, "nonce": nonce}
+
+                if self.fee_policy is not None:
+                    if not self.pending:
+                        params["gas"] = self.fee_policy.estimate_gas(function, {"from": self.account.address, "value": params.get("value", 0)}, fallback=params.get("gas"))
+                    else:
+                        params["gas"] = self.fee_policy.gas_limit(function, fallback=params.get("gas"))
+
+                    params.update(self.fee_policy.fees(urgency))
+
+                transaction = function.build_transaction(params)
+                transaction_hash = self._send(transaction)
+            except Exception as e:
+                # the nonce is not used, read it again in case the node disagrees
+                self.nonce = None
+                self.logger.info(f"Could not send transaction with nonce {nonce}: {e}")
+                raise
+
+            self.nonce += 1
+
+            pending_transaction = PendingTransaction(nonce, transaction, transaction_hash)
+            pending_transaction.gas_key = gas_key(function) if self.fee_policy is not None else None
+            self.pending[nonce] = pending_transaction
+
+            self._start_tracking()
+
+        self.logger.info(f"Sent transaction {transaction_hash.hex()} with nonce {nonce}")
+
+        return pending_transaction
+
+    def sync_nonce(self) -> int:
+
+        """
+        Next nonce to use, read from the node if it is not known yet
+        """
+
+        with self.lock:
+            return self._sync_nonce()
+
+    def _sync_nonce(self) -> int:
+
+        # called with the lock held
+        if self.nonce is None:
+            self.nonce = self.w3.eth.get_transaction_count(self.account.address, "pending")
+
+        return self.nonce
+
+    def wait_all(self, pending_transactions: List[PendingTransaction], timeout=None) -> List[Tuple]:
+
+        """
+        Receipts of several transactions, tracked concurrently
+
+        Fails as soon as one of them fails, without waiting for the ones that depend on it.
+
+        :param timeout: seconds to wait at most, wait_timeout by default
+        :return: (hash, receipt) of every transaction in the given order
+        :raises TransactionReverted: if one of the transactions reverted
+        :raises TimeoutError: if not all transactions are mined in time
+        """
+
+        timeout = self.wait_timeout if timeout is None else timeout
+
+        done, not_done = wait([pending_transaction.future for pending_transaction in pending_transactions], timeout, return_when=FIRST_EXCEPTION)
+
+        # the first failed transaction in the given (nonce) order
+        for pending_transaction in pending_transactions:
+            if pending_transaction.future in done and pending_transaction.future.exception() is not None:
+                raise pending_transaction.future.exception()
+
+        if not_done:
+            raise TimeoutError(f"{len(not_done)} transactions not mined after {timeout} s")
+
+        return [pending_transaction.wait() for pending_transaction in pending_transactions]
+
+    def _send(self, transaction):
+
+        signed_transaction = self.w3.eth.account.sign_transaction(transaction, self.account.key)
+        raw_transaction = signed_transaction.raw_transaction if hasattr(signed_transaction, "raw_transaction") else signed_transaction.rawTransaction
+
+        return self.w3.eth.send_raw_transaction(raw_transaction)
+
+    def _start_tracking(self) -> None:
+
+        self.new_transaction.set()
+
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target=self._track, daemon=True)
+            self.thread.start()
+
+    def _track(self) -> None:
+
+        try:
+            while True:
+
+                with self.lock:
+                    pending_transactions = sorted(self.pending.values(), key=lambda pending_transaction: pending_transaction.nonce)
+
+                if not pending_transactions:
+                    self.new_transaction.wait()
+                    self.new_transaction.clear()
+                    continue
+
+                try:
+                    self._poll(pending_transactions)
+                except Exception as e:
+                    # e.g. a timeout of the node, the transactions are polled again
+                    self.logger.warning(f"Could not poll the pending transactions: {e}")
+
+                time.sleep(self.poll_interval)
+        finally:
+            # nothing resolves the waiters anymore
+            self._fail_pending(RuntimeError("Transaction tracking stopped"))
+
+    def _poll(self, pending_transactions) -> None:
+
+        confirmed_nonce = None
+
+        for pending_transaction in pending_transactions:
+            receipt = self._find_receipt(pending_transaction)
+
+            if receipt is not None:
+                self._finish(pending_transaction, result=(receipt["transactionHash"], receipt))
+                continue
+
+            # another transaction with the same nonce was mined
+            if confirmed_nonce is None:
+                confirmed_nonce = self.w3.eth.get_transaction_count(self.account.address)
+
+            if confirmed_nonce > pending_transaction.nonce:
+                receipt = self._find_receipt(pending_transaction)
+
+                if receipt is not None:
+                    self._finish(pending_transaction, result=(receipt["transactionHash"], receipt))
+                else:
+                    self._finish(pending_transaction, exception=RuntimeError(f"Nonce {pending_transaction.nonce} was used by another transaction"))
+                continue
+
+            if time.monotonic() - pending_transaction.sent_at > self.bump_after and pending_transaction.bumps < self.max_bumps:
+                self._bump(pending_transaction)
+
+    def _fail_pending(self, exception) -> None:
+
+        with self.lock:
+            pending_transactions, self.pending = list(self.pending.values()), {}
+
+        for pending_transaction in pending_transactions:
+            if not pending_transaction.done():
+                pending_transaction.future.set_exception(exception)
+
+    def _find_receipt(self, pending_transaction) -> Optional[dict]:
+
+        for transaction_hash in pending_transaction.hashes:
+            try:
+                return self.w3.eth.get_transaction_receipt(transaction_hash)
+            except TransactionNotFound:
+                continue
+
+        return None
+
+    def _bump(self, pending_transaction) -> None:
+
+        """
+        Replace a stuck transaction by the same transaction with higher fees
+        """
+
+        transaction = dict(pending_transaction.transaction)
+
+        for fee in ("maxFeePerGas", "maxPriorityFeePerGas", "gasPrice"):
+            if fee in transaction:
+                transaction[fee] = math.ceil(transaction[fee] * self.bump_factor)
+
+        try:
+            transaction_hash = self._send(transaction)
+        except Exception as e:
+            # e.g. mined in the meantime, the receipt is found with the next poll
+            self.logger.info(f"Could not replace transaction with nonce {pending_transaction.nonce}: {e}")
+            pending_transaction.bumps += 1
+            return
+
+        pending_transaction.transaction = transaction
+        pending_transaction.hashes.append(transaction_hash)
+        pending_transaction.sent_at = time.monotonic()
+        pending_transaction.bumps += 1
+
+        self.logger.info(f"Replaced transaction with nonce {pending_transaction.nonce} by {transaction_hash.hex()} with higher fees")
+
+    def _finish(self, pending_transaction, result=None, exception=None) -> None:
+
+        with self.lock:
+            self.pending.pop(pending_transaction.nonce, None)
+
+            if result is not None:
+                self.gas_spent += gas_cost(result[1])
+
+                # the gas limit of later calls of the same type that cannot be estimated
+                if pending_transaction.gas_key is not None and result[1]["status"] == 1:
+                    self.fee_policy.record_gas_used(pending_transaction.gas_key, result[1]["gasUsed"])
+
+        if result is not None:
+            for listener in self.receipt_listeners:
+                try:
+                    listener(result[1], pending_transaction.transaction)
+                except Exception as e:
+                    self.logger.warning(f"Receipt listener failed: {e}")
+
+        # mined, but the transactions sent after it that depend on it revert as well
+        if exception is None and result[1]["status"] == 0:
+            self.logger.warning(f"Transaction {result[0].hex()} with nonce {pending_transaction.nonce} reverted")
+            exception = TransactionReverted(*result)
+
+        if exception is not None:
+            pending_transaction.future.set_exception(exception)
+        else:
+            pending_transaction.future.set_result(result)
+            self.logger.info(f"Transaction receipt: {result[1]}")
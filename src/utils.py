@@ -7,9 +7,13 @@ from web3 import Web3
 from dotenv import load_dotenv
 
 from .uniwap_math import calculate_fee_inside, tick_to_price, tick_to_sqrt_price
+from .tick_table import get_tick_table
 
 load_dotenv()
 
+# prices of arbitrary ticks (e.g. the current tick), tables of pool ticks are keyed by the tick spacing
+_tick_table = get_tick_table()
+
 def get_env_variable(var_name):
     return os.environ.get(var_name)
 
@@ -42,6 +46,8 @@ def load_abi(name: str) -> str:
         abi = "nft_manager"
     elif "ROUTER" in name:
         abi = "router"
+    elif "MULTICALL" in name:
+        abi = "multicall"
     else:
         abi = name.lower()
 
@@ -50,21 +56,8 @@ def load_abi(name: str) -> str:
         abi: str = json.load(f)
     return abi
 
-def check_data_exists(from_block, to_block, pool_address):
-    
-        swap_data_exists = os.path.isfile(f"data/{pool_address}/Swap.csv")
-        mint_data_exists = os.path.isfile(f"data/{pool_address}/Mint.csv")
-        burn_data_exists = os.path.isfile(f"data/{pool_address}/Burn.csv")
-    
-        if swap_data_exists and mint_data_exists and burn_data_exists:
-            swap_data = np.loadtxt(f"data/{pool_address}/Swap.csv", delimiter=",", dtype=float)
-            if swap_data[-1, 0] + 20 >= to_block and swap_data[0, 0] - 20 <= from_block:
-                return True
-        else:
-            return False
-        
 def check_enough_balance(current_tick, balance_token0, balance_token1, amount_token0, amount_token1):
-    current_price = tick_to_price(current_tick)
+    current_price = _tick_table.price(current_tick)
 
     if balance_token0 < amount_token0 and balance_token1 < amount_token1:
         # not enough of eiter token
@@ -86,8 +79,8 @@ def check_enough_balance(current_tick, balance_token0, balance_token1, amount_to
 
 def real_reservers_to_virtal_reserves(lower_tick, upper_tick, current_tick, current_sqrt_price, x_real=None, y_real=None):
 
-    lower_sqrt_price = int(tick_to_sqrt_price(lower_tick) * 2**96)
-    upper_sqrt_price = int(tick_to_sqrt_price(upper_tick) * 2**96)
+    lower_sqrt_price = int(_tick_table.sqrt_price(lower_tick) * 2**96)
+    upper_sqrt_price = int(_tick_table.sqrt_price(upper_tick) * 2**96)
 
     if y_real:
 
@@ -111,9 +104,9 @@ def real_reservers_to_virtal_reserves(lower_tick, upper_tick, current_tick, curr
 
 def virtual_reserves_to_real_reserves(lower_tick, upper_tick, current_tick, current_sqrt_price, liquidity):
 
-    lower_sqrtPrice = tick_to_sqrt_price(lower_tick)
+    lower_sqrtPrice = _tick_table.sqrt_price(lower_tick)
     current_sqrtPrice = current_sqrt_price
-    upper_sqrtPrice = tick_to_sqrt_price(upper_tick)
+    upper_sqrtPrice = _tick_table.sqrt_price(upper_tick)
 
     x_virt = liquidity / current_sqrtPrice
     y_virt = liquidity * current_sqrtPrice
@@ -126,8 +119,8 @@ def virtual_reserves_to_real_reserves(lower_tick, upper_tick, current_tick, curr
 
 def total_value_in_tick(current_tick, sqrtPrice, liquidity):
 
-    lower_sqrtPrice = tick_to_sqrt_price(current_tick - 5)
-    upper_sqrtPrice = tick_to_sqrt_price(current_tick + 5)
+    lower_sqrtPrice = _tick_table.sqrt_price(current_tick - 5)
+    upper_sqrtPrice = _tick_table.sqrt_price(current_tick + 5)
 
     x_virt = liquidity / sqrtPrice
     y_virt = liquidity * sqrtPrice
@@ -152,7 +145,7 @@ def get_fee_growth_inside_last(lower_tick_state, upper_tick_state, lower_tick, u
 
 def get_volume_in_last_blocks(swap_data, token_decimals, block_interval_size=12, number_volume=64):
 
-    swap_data_np = np.stack(swap_data, axis=0)
+    swap_data_np = np.asarray(swap_data)
 
     last_block = int(swap_data_np[-1, 0])
 
@@ -177,55 +170,35 @@ def get_volume_in_last_blocks(swap_data, token_decimals, block_interval_size=12,
 
 def get_total_value_locked_in_tick(tick, liquidity, token_decimals):
 
-    x_real, y_real = total_value_in_tick(tick, tick_to_sqrt_price(tick), liquidity)
+    x_real, y_real = total_value_in_tick(tick, _tick_table.sqrt_price(tick), liquidity)
 
-    total_value_locked = x_real * tick_to_price(tick) / 10**token_decimals + y_real / 10**token_decimals
+    total_value_locked = x_real * _tick_table.price(tick) / 10**token_decimals + y_real / 10**token_decimals
 
     return total_value_locked
 
-def get_value_locked_for_tick_range(current_tick, current_liquidity, tick_states, tick_spacing, token_decimals, tick_range=100):
-        
-    current_tick_rounded = current_tick // tick_spacing * tick_spacing
+def get_value_locked_for_tick_range(current_tick, current_liquidity, tick_index, tick_spacing, token_decimals, tick_range=100):
 
-    liquidities = [None for _ in range(0, 2 * tick_range + tick_spacing, tick_spacing)]
     ticks = [current_tick - i for i in range(tick_range, 0, -tick_spacing)] + [current_tick] + [current_tick + i for i in range(10, tick_range + tick_spacing, tick_spacing)]
-    ticks_rounded = [tick // tick_spacing * tick_spacing for tick in ticks]
 
-    liquidities[tick_range // tick_spacing] = current_liquidity
-
-    liquidity_tick_below = current_liquidity
-    liquidity_tick_above = current_liquidity
-
-    required_ticks = set(ticks_rounded)
-    available_tick_states = set(tick_states.keys())
+    current_tick_rounded = current_tick // tick_spacing * tick_spacing
 
-    if not required_ticks.issubset(available_tick_states):
+    if not tick_index.covers(current_tick_rounded - tick_range, current_tick_rounded + tick_range):
         # not all tick states are fetched yet -> check again later
         return [], []
 
+    # active liquidity at every tick from the prefix sum of liquidityNet
+    liquidities = tick_index.liquidity_at(np.array(ticks), current_tick, current_liquidity)
 
-    for i in range(0, tick_range, 10):
-
-        tick_state_below = tick_states[current_tick_rounded - i]
-        tick_state_above = tick_states[current_tick_rounded + tick_spacing + i]
+    # same as get_total_value_locked_in_tick for every tick, with the prices taken from the tick table at once
+    ticks_np = np.array(ticks)
+    liquidities_np = np.array(liquidities, dtype=np.float64)
 
-        if tick_state_below:
-            liquidity_net_below = tick_state_below[1]
-            liquidity_tick_below = liquidity_tick_below - liquidity_net_below
-            liquidities[(tick_range - i - tick_spacing) // tick_spacing] = liquidity_tick_below
-        else:
-            liquidities[(tick_range - i - tick_spacing) // tick_spacing] = liquidity_tick_below
-            
-        if tick_state_above:
-            liquidity_net_above = tick_state_above[1]
-            liquidity_tick_above = liquidity_tick_above + liquidity_net_above
-            liquidities[(tick_range + i + tick_spacing) // tick_spacing] = liquidity_tick_above
-        else:
-            liquidities[(tick_range + i + tick_spacing) // tick_spacing] = liquidity_tick_above
+    tick_table = get_tick_table(tick_spacing)
 
+    sqrt_prices = tick_table.sqrt_prices_for(ticks_np)
+    x_real = liquidities_np / sqrt_prices - liquidities_np / tick_table.sqrt_prices_for(ticks_np + 5)
+    y_real = liquidities_np * sqrt_prices - liquidities_np * tick_table.sqrt_prices_for(ticks_np - 5)
 
-    value_locked = []
-    for tick, liquidity in zip(ticks, liquidities):
-        value_locked.append(get_total_value_locked_in_tick(tick, liquidity, token_decimals))
+    value_locked = x_real * tick_table.prices_for(ticks_np) / 10**token_decimals + y_real / 10**token_decimals
 
-    return value_locked, ticks
+    return value_locked.tolist(), ticks
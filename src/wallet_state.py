@@ -0,0 +1,157 @@
+import time
+import logging
+import threading
+from typing import List, Optional
+
+from web3 import Web3
+
+from .multicall import Multicall
+from .fee_policy import gas_cost
+from .allowance_manager import AllowanceManager, _to_hex, _to_bytes
+from .transaction_manager import TransactionManager
+
+TRANSFER_TOPIC = Web3.to_hex(Web3.keccak(text="Transfer(address,address,uint256)"))
+
+# WETH wraps and unwraps without a Transfer event
+DEPOSIT_TOPIC = Web3.to_hex(Web3.keccak(text="Deposit(address,uint256)"))
+WITHDRAWAL_TOPIC = Web3.to_hex(Web3.keccak(text="Withdrawal(address,uint256)"))
+
+
+class WalletState:
+
+    """
+    Balances, allowances and nonce of the account for the tokens of the pool
+
+    A refresh reads the ETH balance, the token balances and the allowances of all spenders with
+    a single multicall, the nonce is the local one of the transaction manager. Afterwards the
+    state is kept up to date from the receipts of our own transactions (token transfers, WETH
+    deposits and withdrawals, the value and the gas of the transaction), so the checks before a
+    mint do not need any call. It is read again after max_age seconds, e.g. for deposits from
+    elsewhere.
+    """
+
+    def __init__(self, multicall: Multicall, owner, tokens: List, spenders: List, transactions: TransactionManager, allowances: Optional[AllowanceManager] = None, weth=None, max_age=300):
+
+        """
+        :param tokens: token contracts, e.g. token0 and token1 of the pool
+        :param spenders: addresses whose allowances are read, e.g. the router and the NFT manager
+        :param allowances: allowance manager that is seeded with the read allowances
+        :param weth: address of WETH
+        """
+
+        self.multicall = multicall
+        self.owner = owner
+        self.tokens = tokens
+        self.spenders = spenders
+        self.transactions = transactions
+        self.allowances = allowances
+        self.weth = weth
+        self.max_age = max_age
+
+        self.eth = None
+        # token address -> balance
+        self.balances = {}
+
+        # time of the last refresh
+        self.refreshed_at = None
+
+        self.lock = threading.Lock()
+
+        self.transactions.receipt_listeners.append(self.update_from_receipt)
+
+        self.logger = logging.getLogger('logger3')
+
+    def snapshot(self) -> dict:
+
+        """
+        Current state of the wallet, refreshed if it is older than max_age
+
+        :return: eth balance, token balances, allowances ((token, spender) -> allowance) and nonce
+        """
+
+        if self.refreshed_at is None or time.monotonic() - self.refreshed_at > self.max_age:
+            self.refresh()
+
+        with self.lock:
+            balances = dict(self.balances)
+            eth = self.eth
+
+        allowances = {(token.address, spender): self.allowances.known(token.address, spender) for token in self.tokens for spender in self.spenders} if self.allowances else {}
+
+        return {"eth": eth, "balances": balances, "allowances": allowances, "nonce": self.transactions.nonce}
+
+    def balance(self, contract) -> int:
+        return self.snapshot()["balances"][contract.address]
+
+    def refresh(self) -> None:
+
+        """
+        Read the balances and allowances with one multicall
+
+        Allowances whose call failed are left to the allowance manager, which reads them when
+        they are needed.
+
+        :raises RuntimeError: if the ETH balance or a token balance could not be read
+        """
+
+        calls = [self.multicall.contract.functions.getEthBalance(self.owner)]
+        calls += [token.functions.balanceOf(self.owner) for token in self.tokens]
+        calls += [token.functions.allowance(self.owner, spender) for token in self.tokens for spender in self.spenders]
+
+        results = self.multicall.aggregate(calls)
+
+        eth, balances, allowances = results[0], results[1:1 + len(self.tokens)], results[1 + len(self.tokens):]
+
+        if eth is None or None in balances:
+            raise RuntimeError(f"Could not read the balances of {self.owner}")
+
+        with self.lock:
+            self.eth = eth
+            self.balances = {token.address: balance for token, balance in zip(self.tokens, balances)}
+            self.refreshed_at = time.monotonic()
+
+        # pending transactions are already accounted for in the allowance manager
+        if self.allowances is not None and not self.transactions.pending:
+            keys = [(token.address, spender) for token in self.tokens for spender in self.spenders]
+
+            self.allowances.set_many({key: allowance for key, allowance in zip(keys, allowances) if allowance is not None})
+
+        # nonce of the next transaction, read once and then tracked locally
+        self.transactions.sync_nonce()
+
+    def update_from_receipt(self, receipt, transaction=None) -> None:
+
+        """
+        Apply the token transfers, WETH deposits and withdrawals and the ETH spent by one of our transactions
+        """
+
+        if self.refreshed_at is None:
+            return
+
+        owner = "0x" + self.owner[2:].lower().rjust(64, "0")
+
+        with self.lock:
+            self.eth -= gas_cost(receipt)
+            if transaction is not None and receipt["status"] == 1:
+                self.eth -= transaction.get("value", 0)
+
+            for log in receipt["logs"]:
+                token = Web3.to_checksum_address(log["address"])
+                if token not in self.balances:
+                    continue
+
+                topics = [_to_hex(topic) for topic in log["topics"]]
+                value = int.from_bytes(_to_bytes(log["data"])[:32], "big")
+
+                if topics[0] == TRANSFER_TOPIC and len(topics) == 3:
+                    if topics[1] == owner:
+                        self.balances[token] -= value
+                    if topics[2] == owner:
+                        self.balances[token] += value
+
+                elif token == self.weth and len(topics) == 2 and topics[1] == owner:
+                    if topics[0] == DEPOSIT_TOPIC:
+                        self.balances[token] += value
+                    elif topics[0] == WITHDRAWAL_TOPIC:
+                        self.balances[token] -= value
+                        self.eth += value
@@ -0,0 +1,142 @@
+import unittest
+from types import SimpleNamespace
+
+from web3 import Web3
+from hexbytes import HexBytes
+
+from src.transaction_manager import TransactionManager, TransactionReverted
+from src.allowance_manager import AllowanceManager, APPROVAL_TOPIC
+
+from test.test_transaction_manager import FakeEth, FakeFunction
+
+OWNER = Web3.to_checksum_address("0x" + "aa" * 20)
+TOKEN = Web3.to_checksum_address("0x" + "bb" * 20)
+SPENDER = Web3.to_checksum_address("0x" + "cc" * 20)
+
+
+class FakeToken:
+
+    def __init__(self, allowance=0):
+
+        self.address = TOKEN
+        self.allowance_calls = 0
+        self.approvals = []
+
+        token = self
+
+        class Functions:
+
+            def allowance(self, owner, spender):
+                token.allowance_calls += 1
+                return SimpleNamespace(call=lambda: allowance)
+
+            def approve(self, spender, value):
+                token.approvals.append((spender, value))
+                return FakeFunction("approve")
+
+        self.functions = Functions()
+
+
+def approval_log(value):
+
+    return {
+        "address": TOKEN.lower(),
+        "topics": [HexBytes(APPROVAL_TOPIC), HexBytes(bytes(12) + bytes.fromhex(OWNER[2:])), HexBytes(bytes(12) + bytes.fromhex(SPENDER[2:]))],
+        "data": HexBytes(value.to_bytes(32, "big")),
+    }
+
+
+class TestAllowanceManager(unittest.TestCase):
+
+    def setUp(self):
+
+        self.eth = FakeEth()
+        self.transactions = TransactionManager(SimpleNamespace(eth=self.eth), SimpleNamespace(address=OWNER, key=None), poll_interval=0.01)
+
+    def test_sufficient_allowance_is_read_once(self):
+
+        token = FakeToken(allowance=100)
+        allowances = AllowanceManager(self.transactions, OWNER)
+
+        self.assertIsNone(allowances.ensure(token, SPENDER, 40))
+        self.assertIsNone(allowances.ensure(token, SPENDER, 60))
+
+        self.assertEqual(token.allowance_calls, 1)
+        self.assertEqual(allowances.allowances[(TOKEN, SPENDER)], 0)
+
+        # spent -> approved again
+        self.assertIsNotNone(allowances.ensure(token, SPENDER, 1))
+
+    def test_approves_the_amount(self):
+
+        token = FakeToken(allowance=30)
+        allowances = AllowanceManager(self.transactions, OWNER)
+
+        approval = allowances.ensure(token, SPENDER, 100)
+
+        # approve sets the allowance -> the whole amount, not the shortfall
+        self.assertIsNotNone(approval)
+        self.assertEqual(token.approvals, [(SPENDER, 100)])
+
+    def test_ceiling_is_approved_once(self):
+
+        token = FakeToken(allowance=0)
+        allowances = AllowanceManager(self.transactions, OWNER, ceiling=10**30)
+
+        approval = allowances.ensure(token, SPENDER, 10**18)
+
+        for _ in range(10):
+            self.assertIsNone(allowances.ensure(token, SPENDER, 10**18))
+
+        self.assertEqual(token.approvals, [(SPENDER, 10**30)])
+        self.assertEqual(token.allowance_calls, 1)
+
+        self.eth.mine(approval.hash)
+        approval.wait(timeout=5)
+
+        self.assertEqual(allowances.allowances[(TOKEN, SPENDER)], 10**30 - 11 * 10**18)
+
+    def test_update_from_receipt(self):
+
+        token = FakeToken(allowance=0)
+        allowances = AllowanceManager(self.transactions, OWNER)
+
+        approval = allowances.ensure(token, SPENDER, 10)
+        spend = self.transactions.submit(FakeFunction("mint"))
+
+        # the mint is still pending -> its spending may not be included
+        self.eth.mine(approval.hash, logs=[approval_log(10)])
+        approval.wait(timeout=5)
+
+        self.assertEqual(allowances.allowances[(TOKEN, SPENDER)], 0)
+
+        # e.g. an Approval of the remaining allowance on transferFrom
+        self.eth.mine(spend.hash, logs=[approval_log(3)])
+        spend.wait(timeout=5)
+
+        self.assertEqual(allowances.allowances[(TOKEN, SPENDER)], 3)
+
+        # Approval of another owner
+        log = approval_log(7)
+        log["topics"][1] = HexBytes(bytes(32))
+        allowances.update_from_receipt({"logs": [log]})
+
+        self.assertEqual(allowances.allowances[(TOKEN, SPENDER)], 3)
+
+    def test_failed_approval_is_forgotten(self):
+
+        token = FakeToken(allowance=0)
+        allowances = AllowanceManager(self.transactions, OWNER)
+
+        approval = allowances.ensure(token, SPENDER, 10)
+
+        self.eth.mine(approval.hash, status=0)
+
+        with self.assertRaises(TransactionReverted):
+            approval.wait(timeout=5)
+
+        self.assertNotIn((TOKEN, SPENDER), allowances.allowances)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import unittest
+import numpy as np
+
+from src.block_bars import BlockBars
+
+def swap(block, tick, amount0=0, amount1=0):
+    return [block, tick, 10**18, 2**96, amount0, amount1, 0]
+
+class TestBlockBars(unittest.TestCase):
+
+    def test_ohlc_and_volume(self):
+
+        bars = BlockBars(5)
+        bars.update([swap(100, 10, -1, 2), swap(101, 14, 3, -4), swap(104, 8), swap(106, 9, 5, -5)])
+
+        self.assertEqual(len(bars), 2)
+
+        first, second = bars.view()
+        self.assertEqual(first[:5].tolist(), [100, 10, 14, 8, 8])
+        self.assertEqual(first[BlockBars.VOLUME0_INDEX], 4)
+        self.assertEqual(first[BlockBars.VOLUME1_INDEX], 6)
+        self.assertEqual(first[BlockBars.SWAPS_INDEX], 3)
+        self.assertEqual(second[:5].tolist(), [105, 9, 9, 9, 9])
+
+    def test_incremental_updates_match_single_update(self):
+
+        rng = np.random.default_rng(0)
+        blocks = np.sort(rng.integers(0, 500, 400))
+        swaps = np.column_stack([blocks, rng.integers(-50, 50, 400), np.zeros(400), np.zeros(400), rng.normal(size=400), rng.normal(size=400), np.zeros(400)])
+
+        incremental = BlockBars(5)
+        for block in range(0, 500, 3):
+            incremental.update(swaps[(blocks >= block) & (blocks < block + 3)])
+
+        single = BlockBars(5)
+        single.update(swaps)
+
+        np.testing.assert_allclose(incremental.view(), single.view())
+
+        # close is the tick of the last swap in each bucket
+        last_rows = np.flatnonzero(np.r_[blocks[1:] // 5 != blocks[:-1] // 5, True])
+        np.testing.assert_array_equal(single.close(), swaps[last_rows, 1])
+
+    def test_capacity(self):
+
+        bars = BlockBars(1, capacity=3)
+        bars.update([swap(block, block) for block in range(10)])
+
+        self.assertEqual(bars.close().tolist(), [7, 8, 9])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,6 +5,7 @@ import psutil
 import signal
 import unittest
 import subprocess
+from web3.logs import DISCARD
 
 from src.uniwap_math import tick_to_price
 from src.utils import get_contract, get_account, get_provider, get_env_variable, real_reservers_to_virtal_reserves
@@ -125,11 +126,11 @@ class TestBurn(unittest.TestCase, TestUtil):
         # Burn the position
         burn_tx, burn_tx_receipt, collect_tx_receipt = provider.burn_position(position, tick_before_burn)
 
-        fees_token0 = collect_tx_receipt.logs[3].data[-64:-32]
-        fees_token1 = collect_tx_receipt.logs[3].data[-32:]
+        # decrease liquidity, collect and burn are one multicall -> Collect event of the NFT manager
+        collect = provider.nft_contract.events.Collect().process_receipt(collect_tx_receipt, errors=DISCARD)[0]["args"]
 
-        fees_token0 = int.from_bytes(fees_token0, byteorder='big')
-        fees_token1 = int.from_bytes(fees_token1, byteorder='big')
+        fees_token0 = collect["amount0"]
+        fees_token1 = collect["amount1"]
 
         self.assertGreater(fees_token0, 0)
         self.assertGreater(fees_token1, 0)
@@ -143,3 +144,35 @@ class TestBurn(unittest.TestCase, TestUtil):
 
         self.assertGreater(acquired_fees_in_token0, 0)
 
+    def testRebalance(self):
+
+        provider = Provider(pool_address="0x88e6A0c2dDD26FEEb64F039a2c41296FcB3f5640", network="mainnet", local=True)
+
+        current_block = provider.get_current_block()
+        current_tick = provider.get_current_tick(current_block)
+        current_sqrt_price = provider.get_current_sqrt_price(current_block)
+
+        lower_tick = int(current_tick // 10 * 10 - 100)
+        upper_tick = int(current_tick // 10 * 10 + 100)
+
+        y_real = 10 * 10**self.token1_decimals
+        x_virt, y_virt, x_real = real_reservers_to_virtal_reserves(lower_tick, upper_tick, current_tick, current_sqrt_price, y_real=y_real)
+        liquidity = math.sqrt(x_virt * y_virt)
+
+        position = Position(current_tick, lower_tick, upper_tick, liquidity, None, None)
+        _, txn_receipt = provider.mint_position(position, current_tick, current_sqrt_price)
+
+        position.token_id, _, _, _ = provider.parse_mint_receipt(txn_receipt)
+
+        # half of the liquidity in a wider range -> no swap needed
+        new_position = Position(current_tick, lower_tick - 100, upper_tick + 100, int(liquidity / 2), None, None)
+
+        _, rebalance_receipt = provider.rebalance_position(position, new_position, current_tick, current_sqrt_price)
+
+        decrease = provider.nft_contract.events.DecreaseLiquidity().process_receipt(rebalance_receipt, errors=DISCARD)
+        new_token_id, amount_token0, amount_token1, _ = provider.parse_mint_receipt(rebalance_receipt)
+
+        # closed and reopened in the same transaction
+        self.assertEqual(decrease[0]["args"]["tokenId"], position.token_id)
+        self.assertGreater(new_token_id, position.token_id)
+        self.assertGreater(amount_token0 + amount_token1, 0)
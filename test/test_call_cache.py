@@ -0,0 +1,102 @@
+import os
+import unittest
+import tempfile
+from types import SimpleNamespace
+
+from src.provider import Provider
+from src.multicall import Multicall
+from src.call_cache import CallCache
+from src.utils import get_contract
+
+from test.test_multicall import POOL_ADDRESS, TICK_STATE, FakeAggregate3
+
+class TestCallCache(unittest.TestCase):
+
+    def setUp(self):
+
+        self.directory = tempfile.TemporaryDirectory()
+        self.pool_contract = get_contract("POOL", POOL_ADDRESS)
+
+    def tearDown(self):
+
+        self.directory.cleanup()
+
+    def test_key(self):
+
+        functions = self.pool_contract.functions
+
+        self.assertEqual(CallCache.key(functions.ticks(10), 100), CallCache.key(functions.ticks(10), 100))
+        self.assertNotEqual(CallCache.key(functions.ticks(10), 100), CallCache.key(functions.ticks(10), 101))
+        self.assertNotEqual(CallCache.key(functions.ticks(10), 100), CallCache.key(functions.ticks(20), 100))
+
+    def test_lru_eviction(self):
+
+        cache = CallCache(max_size=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")
+        cache.put("c", 3)
+
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), 3)
+
+    def test_disk_tier(self):
+
+        path = os.path.join(self.directory.name, "calls.sqlite")
+
+        cache = CallCache(path=path)
+        cache.put("tick", TICK_STATE)
+        cache.put("failed", None)
+        cache.close()
+
+        cache = CallCache(path=path)
+
+        self.assertEqual(cache.get("tick"), TICK_STATE)
+        self.assertIsNone(cache.get("failed"))
+        cache.close()
+
+    def _provider(self, backtest, latest_block=None):
+
+        calls_made = []
+
+        multicall = Multicall()
+        multicall.contract = SimpleNamespace(functions=SimpleNamespace(aggregate3=FakeAggregate3(calls_made)))
+
+        provider = Provider.__new__(Provider)
+        provider.backtest = backtest
+        provider.latest_block = latest_block
+        provider.cache_confirmations = 64
+        provider.replayer = None
+        provider.pool_contract = self.pool_contract
+        provider.multicall = multicall
+        provider.call_cache = CallCache()
+
+        return provider, calls_made
+
+    def test_repeated_reads_are_served_from_cache(self):
+
+        provider, calls_made = self._provider(backtest=True)
+
+        provider.batch(100, [("tick_state", 10), ("liquidity",)])
+        results = provider.batch(100, [("tick_state", 10), ("tick_state", 20), ("liquidity",)])
+
+        self.assertEqual(results, [TICK_STATE, TICK_STATE, 12345])
+
+        # the second batch only fetched tick 20
+        self.assertEqual([len(calls) for calls in calls_made], [2, 1])
+
+    def test_latest_blocks_bypass_cache(self):
+
+        provider, calls_made = self._provider(backtest=False, latest_block=1000)
+
+        provider.batch(990, [("liquidity",)])
+        provider.batch(990, [("liquidity",)])
+        provider.batch(900, [("liquidity",)])
+        provider.batch(900, [("liquidity",)])
+
+        self.assertEqual(len(calls_made), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
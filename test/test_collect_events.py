@@ -0,0 +1,153 @@
+import os
+import json
+import unittest
+import tempfile
+from types import SimpleNamespace
+
+from src.event_store import EventStore
+from src.collect_events import collect_events, event_topic
+
+POOL_ADDRESS = "0x88e6A0c2dDD26FEEb64F039a2c41296FcB3f5640"
+
+with open("assets/pool.json") as f:
+    POOL_ABI = json.load(f)
+
+
+class FakeEth:
+
+    def __init__(self, logs, max_results=5, fail_from=None):
+
+        self.logs = logs
+        self.max_results = max_results
+        self.fail_from = fail_from
+        self.requests = []
+
+    def get_logs(self, params):
+
+        self.requests.append((params["fromBlock"], params["toBlock"]))
+
+        if self.fail_from is not None and params["toBlock"] >= self.fail_from:
+            raise ConnectionError("node unavailable")
+
+        logs = [log for log in self.logs if params["fromBlock"] <= log["blockNumber"] <= params["toBlock"] and log["topics"][0] in params["topics"][0]]
+        if len(logs) > self.max_results:
+            raise ValueError({"code": -32005, "message": "query returned more than 10000 results"})
+
+        return logs
+
+
+class FakeEvent:
+
+    def process_log(self, log):
+        return SimpleNamespace(blockNumber=log["blockNumber"], logIndex=log["logIndex"], args=log["args"])
+
+
+class FakeContract:
+
+    def __init__(self, logs, **kwargs):
+
+        self.address = POOL_ADDRESS
+        self.abi = POOL_ABI
+        self.w3 = SimpleNamespace(eth=FakeEth(logs, **kwargs))
+        self.events = {"Swap": FakeEvent, "Mint": FakeEvent, "Burn": FakeEvent}
+
+
+def swap_log(contract, block, log_index):
+
+    args = {"tick": block, "liquidity": 1, "sqrtPriceX96": 2**96, "amount0": 1, "amount1": -1}
+    return {"blockNumber": block, "logIndex": log_index, "topics": [event_topic(contract, "Swap")], "args": args}
+
+def mint_log(contract, block, log_index):
+
+    args = {"tickLower": -10, "tickUpper": 10, "amount0": 1, "amount1": 1, "amount": 5}
+    return {"blockNumber": block, "logIndex": log_index, "topics": [event_topic(contract, "Mint")], "args": args}
+
+
+class TestCollectEvents(unittest.TestCase):
+
+    def setUp(self):
+
+        self.directory = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.directory.name)
+
+        contract = FakeContract([])
+        self.logs = []
+        for block in range(100, 200):
+            self.logs.append(swap_log(contract, block, 1))
+            if block % 10 == 0:
+                self.logs.append(mint_log(contract, block, 0))
+
+    def tearDown(self):
+
+        os.chdir(self.cwd)
+        self.directory.cleanup()
+
+    def test_collects_all_events_once(self):
+
+        contract = FakeContract(self.logs)
+        collect_events(contract, 100, 199, max_workers=3, window=40, min_window=1, fast_response=0)
+
+        store = EventStore(f"data/{POOL_ADDRESS}")
+
+        self.assertEqual(store.exact("Swap", "block"), list(range(100, 200)))
+        self.assertEqual(store.exact("Mint", "block"), list(range(100, 200, 10)))
+        self.assertEqual(store.rows("Burn"), 0)
+
+        # windows with too many results were split
+        self.assertTrue(any(end - start + 1 < 40 for start, end in contract.w3.eth.requests))
+
+    def test_resumes_after_interruption(self):
+
+        contract = FakeContract(self.logs, max_results=1000, fail_from=150)
+        with self.assertRaises(ConnectionError):
+            collect_events(contract, 100, 199, max_workers=1, window=10, fast_response=0, retries=0)
+
+        store = EventStore(f"data/{POOL_ADDRESS}")
+        self.assertEqual(store.coverage("Swap"), [[100, 149]])
+
+        contract = FakeContract(self.logs, max_results=1000)
+        collect_events(contract, 100, 199, max_workers=2, window=10)
+
+        self.assertEqual(contract.w3.eth.requests[0][0], 150)
+
+        store = EventStore(f"data/{POOL_ADDRESS}")
+        self.assertEqual(store.exact("Swap", "block"), list(range(100, 200)))
+        self.assertEqual(store.exact("Mint", "block"), list(range(100, 200, 10)))
+
+    def test_fetches_only_missing_ranges(self):
+
+        collect_events(FakeContract(self.logs, max_results=1000), 130, 159, window=10)
+
+        contract = FakeContract(self.logs, max_results=1000)
+        collect_events(contract, 100, 199, window=100)
+
+        self.assertEqual(sorted(contract.w3.eth.requests), [(100, 129), (160, 199)])
+
+        store = EventStore(f"data/{POOL_ADDRESS}")
+        self.assertEqual(store.coverage("Swap"), [[100, 199]])
+        self.assertEqual(store.exact("Swap", "block"), list(range(100, 200)))
+
+    def test_backfill_is_committed_in_chunks(self):
+
+        collect_events(FakeContract(self.logs, max_results=1000), 170, 199, window=10)
+
+        # the backfill fails at block 150, the chunks before it are merged in
+        contract = FakeContract(self.logs, max_results=1000, fail_from=150)
+        with self.assertRaises(ConnectionError):
+            collect_events(contract, 100, 199, max_workers=1, window=10, fast_response=0, retries=0, backfill_rows=20)
+
+        store = EventStore(f"data/{POOL_ADDRESS}")
+        self.assertEqual(store.coverage("Swap"), [[100, 139], [170, 199]])
+        self.assertEqual(store.exact("Swap", "block"), list(range(100, 140)) + list(range(170, 200)))
+
+        collect_events(FakeContract(self.logs, max_results=1000), 100, 199, window=10, backfill_rows=20)
+
+        store = EventStore(f"data/{POOL_ADDRESS}")
+        self.assertEqual(store.coverage("Swap"), [[100, 199]])
+        self.assertEqual(store.exact("Swap", "block"), list(range(100, 200)))
+        self.assertEqual(store.exact("Mint", "block"), list(range(100, 200, 10)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,168 @@
+import unittest
+from types import SimpleNamespace
+
+from src.protocol_state import ProtocolState
+from src.confirmation_buffer import ConfirmationBuffer
+
+
+def decode_log(log):
+    return log["type"], log["row"]
+
+def swap_log(block, log_index, tick, block_hash=None, removed=False):
+    return {"blockNumber": block, "blockHash": block_hash or f"0x{block:064x}", "logIndex": log_index, "removed": removed, "type": "Swap", "row": [block, tick, 1, 1, 1, -1, log_index]}
+
+def mint_log(block, log_index, block_hash=None):
+    return {"blockNumber": block, "blockHash": block_hash or f"0x{block:064x}", "logIndex": log_index, "type": "Mint", "row": [block, -10, 10, 1, 1, 1, log_index]}
+
+
+class TestConfirmationBuffer(unittest.TestCase):
+
+    def test_confirmations(self):
+
+        buffer = ConfirmationBuffer(decode_log, confirmations=2)
+
+        # received twice, e.g. over the websocket and from a catch-up
+        buffer.add([swap_log(10, 1, 5), mint_log(10, 0), swap_log(11, 0, 6)])
+        buffer.add([swap_log(10, 1, 5)])
+
+        self.assertEqual(len(buffer), 3)
+
+        confirmed_block, swaps, mints, burns = buffer.pop_confirmed(12)
+
+        self.assertEqual(confirmed_block, 10)
+        self.assertEqual([swap[1] for swap in swaps], [5])
+        self.assertEqual(len(mints), 1)
+        self.assertEqual(burns, [])
+
+        self.assertEqual(buffer.pop_confirmed(13)[1][0][1], 6)
+        self.assertEqual(len(buffer), 0)
+
+    def test_removed_log(self):
+
+        buffer = ConfirmationBuffer(decode_log, confirmations=1)
+
+        buffer.add([swap_log(10, 0, 5), swap_log(10, 1, 6)])
+
+        self.assertEqual(buffer.add([swap_log(10, 1, 6, removed=True)]), 10)
+        self.assertEqual([swap[1] for swap in buffer.pop_confirmed(11)[1]], [5])
+
+    def test_new_block_hash(self):
+
+        buffer = ConfirmationBuffer(decode_log, confirmations=3)
+
+        buffer.add([swap_log(10, 0, 5), swap_log(11, 0, 6), swap_log(12, 0, 7)])
+
+        # block 11 was replaced -> its events and the ones of the blocks on top of it are gone
+        self.assertIsNone(buffer.add_head(10, f"0x{10:064x}"))
+        self.assertEqual(buffer.add_head(11, "0x" + "ab" * 32), 11)
+
+        self.assertEqual(len(buffer), 1)
+
+        buffer.add([swap_log(11, 0, 8, block_hash="0x" + "ab" * 32)])
+
+        self.assertEqual([swap[1] for swap in buffer.pop_confirmed(14)[1]], [5, 8])
+
+    def test_replace(self):
+
+        buffer = ConfirmationBuffer(decode_log)
+
+        buffer.add([swap_log(10, 0, 5), swap_log(11, 0, 6)])
+
+        # a poll with the same logs changes nothing
+        self.assertIsNone(buffer.replace(10, 11, [swap_log(10, 0, 5), swap_log(11, 0, 6)]))
+
+        # block 11 is a different block now
+        self.assertEqual(buffer.replace(10, 12, [swap_log(10, 0, 5), swap_log(11, 0, 9, block_hash="0x" + "cd" * 32)]), 11)
+        self.assertEqual([swap[1] for swap in buffer.pop_confirmed(12)[1]], [5, 9])
+
+    def test_recheck_confirmed_blocks(self):
+
+        buffer = ConfirmationBuffer(decode_log, confirmations=1, recheck=2)
+
+        buffer.replace(10, 12, [swap_log(10, 0, 5), swap_log(11, 0, 6)])
+        self.assertEqual(buffer.pop_confirmed(12)[0], 11)
+
+        # the confirmed block 11 is polled again unchanged, block 9 was never received
+        self.assertIsNone(buffer.replace(9, 13, [swap_log(9, 0, 4), swap_log(11, 0, 6), swap_log(10, 0, 5)]))
+        self.assertEqual(buffer.pop_confirmed(13)[0], 12)
+
+        # a reorganization of the confirmed block 11, deeper than the confirmations
+        self.assertEqual(buffer.replace(11, 13, [swap_log(11, 0, 7, block_hash="0x" + "cd" * 32)]), 11)
+
+        self.assertEqual([swap[1] for swap in buffer.pop_confirmed(13)[1]], [7])
+
+
+class TestProtocolStateReorganization(unittest.TestCase):
+
+    def setUp(self):
+
+        provider = SimpleNamespace(backtest=False, tick_spacing=10, decode_log=decode_log, get_liquidity=lambda block: 1, batch=lambda block, requests: [None] * len(requests))
+
+        self.state = ProtocolState(provider, bar_resolutions=(5,), confirmations=1)
+        self.state.current_block = 9
+
+        self.blocks = []
+        self.state.dispatcher.dispatch_block = self.blocks.append
+
+    def test_only_confirmed_events(self):
+
+        state = self.state
+
+        state.receive_logs([swap_log(10, 0, 5), swap_log(11, 0, 6)])
+        state.confirm(11)
+
+        self.assertEqual((state.current_block, state.current_tick, len(state.swap_data)), (10, 5, 1))
+        self.assertEqual(self.blocks, [10])
+
+        # not confirmed yet -> removing it does not touch the state
+        state.receive_logs([swap_log(11, 0, 6, removed=True)])
+        state.receive_logs([swap_log(11, 1, 7, block_hash="0x" + "ef" * 32)])
+        state.confirm(12)
+
+        self.assertEqual([swap[1] for swap in state.swap_data.view()], [5, 7])
+
+    def test_rollback(self):
+
+        state = self.state
+
+        state.receive_logs([swap_log(10, 0, 5), swap_log(11, 0, 6), swap_log(12, 0, 7)])
+        state.confirm(13)
+
+        self.assertEqual((state.current_block, state.current_tick), (12, 7))
+        self.assertEqual(state.bars[5].view()[-1][state.bars[5].CLOSE_INDEX], 7)
+
+        # a reorganization deeper than the confirmations
+        state.receive_logs([swap_log(11, 0, 6, removed=True)])
+
+        self.assertEqual((state.current_block, state.current_tick), (10, 5))
+        self.assertEqual([swap[1] for swap in state.swap_data.view()], [5])
+        self.assertEqual(state.bars[5].view()[-1][state.bars[5].CLOSE_INDEX], 5)
+
+        # the blocks of the new chain are ingested again
+        state.receive_logs([swap_log(11, 0, 8, block_hash="0x" + "ef" * 32)])
+        state.confirm(13)
+
+        self.assertEqual([swap[1] for swap in state.swap_data.view()], [5, 8])
+        self.assertEqual(state.current_block, 12)
+
+    def test_poll_detects_deep_reorganization(self):
+
+        state = self.state
+
+        chain = [swap_log(10, 0, 5), swap_log(11, 0, 6)]
+        state.provider.get_pool_logs = lambda last_block, head: [log for log in chain if last_block < log["blockNumber"] <= head]
+
+        state.sync(12)
+
+        self.assertEqual((state.current_block, state.current_tick), (11, 6))
+
+        # block 11 is replaced after it was ingested, the next poll fetches it again
+        chain[1] = swap_log(11, 0, 8, block_hash="0x" + "ef" * 32)
+        state.sync(13)
+
+        self.assertEqual([swap[1] for swap in state.swap_data.view()], [5, 8])
+        self.assertEqual((state.current_block, state.current_tick), (12, 8))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import unittest
+import numpy as np
+
+from src.backtest import Backtest
+from src.strategy import Strategy
+from src.base_strategy import BaseStrategy
+from src.protocol_state import ProtocolState
+from src.position_manager import PositionManager
+from src.event_dispatcher import EventDispatcher
+
+from test.test_sweep import backtest_provider
+
+
+class Recorder(BaseStrategy):
+
+    def __init__(self, provider=None, state=None, position_manager=None):
+
+        super().__init__(provider, state, position_manager)
+        self.calls = []
+
+    def on_block(self, block):
+        self.calls.append(("block", block))
+
+    def on_swap(self, event):
+        self.calls.append(("swap", int(event[0]), int(event[-1])))
+
+    def on_burn(self, event):
+        self.calls.append(("burn", int(event[0]), int(event[-1])))
+
+
+class TestEventDispatcher(unittest.TestCase):
+
+    def test_event_order(self):
+
+        dispatcher = EventDispatcher()
+        recorder = Recorder()
+        dispatcher.subscribe(recorder)
+
+        swaps = np.array([[10, 0, 0, 0, 0, 0, 1], [11, 0, 0, 0, 0, 0, 0]], dtype=np.float64)
+        mints = np.array([[10, 0, 0, 0, 0, 0, 0]], dtype=np.float64)
+        burns = [[10, 0, 0, 0, 0, 0, 2], [11, 0, 0, 0, 0, 0, 5]]
+
+        dispatcher.dispatch_events(swaps, mints, burns)
+        dispatcher.dispatch_block(11)
+
+        # by block and log index, mints are not delivered to a strategy without on_mint
+        self.assertEqual(recorder.calls, [("swap", 10, 1), ("burn", 10, 2), ("swap", 11, 0), ("burn", 11, 5), ("block", 11)])
+
+    def test_only_overridden_hooks(self):
+
+        dispatcher = EventDispatcher()
+        dispatcher.subscribe(Recorder())
+
+        self.assertEqual(len(dispatcher.handlers["on_swap"]), 1)
+        self.assertEqual(dispatcher.handlers["on_mint"], [])
+        self.assertEqual(dispatcher.handlers["on_position_closed"], [])
+
+    def test_subscribe_once(self):
+
+        dispatcher = EventDispatcher()
+        recorder = Recorder()
+
+        dispatcher.subscribe(recorder)
+        dispatcher.subscribe(recorder)
+        dispatcher.dispatch_block(1)
+
+        dispatcher.unsubscribe(recorder)
+        dispatcher.dispatch_block(2)
+
+        self.assertEqual(recorder.calls, [("block", 1)])
+
+    def test_warmup(self):
+
+        dispatcher = EventDispatcher(trade_from_block=5)
+        recorder = Recorder()
+        dispatcher.subscribe(recorder)
+
+        dispatcher.dispatch_events([[4, 0, 0, 0, 0, 0, 0]], [], [])
+        dispatcher.dispatch_block(4)
+        dispatcher.dispatch_block(5)
+
+        self.assertEqual(recorder.calls, [("swap", 4, 0), ("block", 5)])
+
+    def test_backtest(self):
+
+        provider = backtest_provider()
+        state = ProtocolState(provider, bar_resolutions=(5,))
+        position_manager = PositionManager(provider, state)
+
+        recorder = Recorder(provider, state, position_manager)
+        strategy = Strategy(provider, state, position_manager, params={"close_after_blocks": 50, "lookback_bars": 20, "max_std": 20})
+
+        recorder.start()
+        Backtest(provider, state, strategy).run()
+
+        # every swap once and every block once, in order (the backtest starts after the first block)
+        swaps = [call[1] for call in recorder.calls if call[0] == "swap"]
+        blocks = [call[1] for call in recorder.calls if call[0] == "block"]
+
+        self.assertEqual(swaps, list(range(101, 1100)))
+        self.assertEqual(blocks, list(range(101, 1100)))
+
+        # the example strategy keeps track of its positions from the hooks
+        self.assertGreater(len(position_manager.closed_positions_index), 0)
+        self.assertEqual(set(strategy.close_at_block), set(position_manager.open_positions_index))
+
+
+if __name__ == '__main__':
+    unittest.main()
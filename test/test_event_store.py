@@ -0,0 +1,130 @@
+import os
+import unittest
+import tempfile
+
+from src.event_store import EventStore
+
+SWAPS = [
+    [17000001, 201000, 2**127 + 5, 2**159 + 12345, -(2**200) - 1, 10**30 + 7, 3],
+    [17000002, -201000, 12, 2**96, 10**18 + 1, -(10**18) - 3, 0],
+]
+
+MINTS = [
+    [17000001, 200990, 201010, 2**70 + 1, 3, 2**100 + 9, 1],
+]
+
+class TestEventStore(unittest.TestCase):
+
+    def setUp(self):
+
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "pool")
+
+    def tearDown(self):
+
+        self.directory.cleanup()
+
+    def test_exact_round_trip(self):
+
+        store = EventStore(self.path)
+        store.append({"Swap": SWAPS[:1], "Mint": MINTS, "Burn": []})
+        store.append({"Swap": SWAPS[1:], "Mint": [], "Burn": []})
+
+        store = EventStore(self.path)
+
+        self.assertEqual(store.rows("Swap"), 2)
+        self.assertEqual(store.rows("Mint"), 1)
+        self.assertEqual(store.rows("Burn"), 0)
+
+        self.assertEqual(store.exact("Swap", "sqrt_price_x96"), [SWAPS[0][3], SWAPS[1][3]])
+        self.assertEqual(store.exact("Swap", "amount0"), [SWAPS[0][4], SWAPS[1][4]])
+        self.assertEqual(store.exact("Swap", "block"), [SWAPS[0][0], SWAPS[1][0]])
+
+        rows = store.exact_rows("Swap")
+        self.assertEqual(rows[0], SWAPS[0])
+        self.assertEqual(rows[1], SWAPS[1])
+        self.assertEqual(store.exact_rows("Mint")[0], MINTS[0])
+
+    def test_float_view(self):
+
+        store = EventStore(self.path)
+        store.append({"Swap": SWAPS})
+
+        float_view = store.float_view("Swap")
+
+        self.assertEqual(float_view.shape, (2, 7))
+        self.assertEqual(float_view[1, 1], -201000.0)
+        self.assertEqual(float_view[0, 4], float(SWAPS[0][4]))
+        self.assertEqual(store.float_view("Burn").shape, (0, 7))
+
+    def test_interrupted_append_is_discarded(self):
+
+        store = EventStore(self.path)
+        store.append({"Swap": SWAPS[:1]})
+
+        # bytes of a row that was never committed to meta.json
+        with open(os.path.join(self.path, "Swap", "block.bin"), "ab") as f:
+            f.write(b"\xff" * 8)
+
+        store = EventStore(self.path)
+        store.append({"Swap": SWAPS[1:]})
+
+        self.assertEqual(store.exact("Swap", "block"), [SWAPS[0][0], SWAPS[1][0]])
+
+    def test_coverage(self):
+
+        store = EventStore(self.path)
+        store.append({"Swap": [], "Mint": [], "Burn": []}, covered=(100, 199))
+        store.append({"Swap": [], "Mint": [], "Burn": []}, covered=(300, 399))
+        store.append({"Swap": []}, covered=(200, 249))
+
+        store = EventStore(self.path)
+
+        self.assertEqual(store.coverage("Swap"), [[100, 249], [300, 399]])
+        self.assertEqual(store.missing("Swap", 50, 450), [(50, 99), (250, 299), (400, 450)])
+        self.assertEqual(store.missing_ranges(150, 350), [(200, 299)])
+        self.assertTrue(store.covers(100, 249, events=["Swap"]))
+        self.assertFalse(store.covers(100, 249))
+
+    def test_backfill_stays_sorted_without_duplicates(self):
+
+        store = EventStore(self.path)
+        store.append({"Swap": SWAPS[1:]}, covered=(17000002, 17000002))
+        store.append({"Swap": SWAPS}, covered=(17000001, 17000002))
+
+        store = EventStore(self.path)
+
+        self.assertEqual(store.rows("Swap"), 2)
+        self.assertEqual(store.exact_rows("Swap")[0], SWAPS[0])
+        self.assertEqual(store.exact_rows("Swap")[1], SWAPS[1])
+        self.assertEqual(store.float_view("Swap")[0, 1], 201000.0)
+        self.assertEqual(store.coverage("Swap"), [[17000001, 17000002]])
+
+    def test_merge_replaces_rows(self):
+
+        store = EventStore(self.path)
+        store.append({"Swap": SWAPS[1:]})
+
+        # an earlier row and a new version of the stored one
+        replaced = SWAPS[1][:1] + [-201010] + SWAPS[1][2:]
+        store.append({"Swap": [replaced, SWAPS[0]]})
+
+        self.assertEqual(store.rows("Swap"), 2)
+        self.assertEqual(store.exact_rows("Swap").take([1, 0]), [replaced, SWAPS[0]])
+        self.assertEqual(store.float_view("Swap")[1, 1], -201010.0)
+
+    def test_import_csv(self):
+
+        csv_path = os.path.join(self.directory.name, "Swap.csv")
+        with open(csv_path, "w") as f:
+            for row in SWAPS:
+                f.write(", ".join(str(value) for value in row) + "\n")
+
+        store = EventStore(self.path)
+        store.import_csv("Swap", csv_path)
+
+        self.assertEqual(store.exact_rows("Swap")[0], SWAPS[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
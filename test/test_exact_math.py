@@ -0,0 +1,72 @@
+import random
+import unittest
+import numpy as np
+from math import isqrt
+
+from src.position import Position
+from src.position_book import PositionBook
+from src.exact_math import MIN_TICK, MAX_TICK, MIN_SQRT_RATIO, MAX_SQRT_RATIO, get_sqrt_ratio_at_tick, get_tick_at_sqrt_ratio, get_liquidity_for_amounts, get_amounts_for_liquidity, get_sqrt_ratio_at_tick_batch, get_tick_at_sqrt_ratio_batch, get_amounts_for_liquidity_batch
+
+def encode_price_sqrt(reserve1, reserve0):
+    return isqrt(reserve1 * 2**192 // reserve0)
+
+class TestExactMath(unittest.TestCase):
+
+    def test_sqrt_ratio_bounds(self):
+
+        self.assertEqual(get_sqrt_ratio_at_tick(MIN_TICK), MIN_SQRT_RATIO)
+        self.assertEqual(get_sqrt_ratio_at_tick(MAX_TICK), MAX_SQRT_RATIO)
+
+    def test_liquidity_for_amounts(self):
+
+        # test vectors of the LiquidityAmounts library
+        sqrt_price_a = encode_price_sqrt(100, 110)
+        sqrt_price_b = encode_price_sqrt(110, 100)
+
+        self.assertEqual(get_liquidity_for_amounts(encode_price_sqrt(1, 1), sqrt_price_a, sqrt_price_b, 100, 200), 2148)
+        self.assertEqual(get_liquidity_for_amounts(encode_price_sqrt(99, 110), sqrt_price_a, sqrt_price_b, 100, 200), 1048)
+        self.assertEqual(get_liquidity_for_amounts(encode_price_sqrt(111, 100), sqrt_price_a, sqrt_price_b, 100, 200), 2097)
+
+        self.assertEqual(get_amounts_for_liquidity(encode_price_sqrt(1, 1), sqrt_price_a, sqrt_price_b, 2148), (99, 99))
+        self.assertEqual(get_amounts_for_liquidity(encode_price_sqrt(99, 110), sqrt_price_a, sqrt_price_b, 1048), (99, 0))
+        self.assertEqual(get_amounts_for_liquidity(encode_price_sqrt(111, 100), sqrt_price_a, sqrt_price_b, 2097), (0, 199))
+
+    def test_batch_matches_scalar(self):
+
+        rng = random.Random(0)
+
+        ticks = [rng.randint(MIN_TICK, MAX_TICK) for _ in range(500)] + [MIN_TICK, MAX_TICK, 0, -1, 1]
+        self.assertEqual(get_sqrt_ratio_at_tick_batch(ticks).tolist(), [get_sqrt_ratio_at_tick(tick) for tick in ticks])
+
+        sqrt_prices = [rng.randint(MIN_SQRT_RATIO, MAX_SQRT_RATIO - 1) for _ in range(200)]
+        self.assertEqual(get_tick_at_sqrt_ratio_batch(sqrt_prices).tolist(), [get_tick_at_sqrt_ratio(sqrt_price) for sqrt_price in sqrt_prices])
+
+        lower_ticks = [rng.randint(-50000, 0) for _ in range(200)]
+        upper_ticks = [rng.randint(1, 50000) for _ in range(200)]
+        current = [get_sqrt_ratio_at_tick(rng.randint(-60000, 60000)) for _ in range(200)]
+        liquidities = [rng.randint(1, 10**30) for _ in range(200)]
+
+        amounts0, amounts1 = get_amounts_for_liquidity_batch(current, get_sqrt_ratio_at_tick_batch(lower_ticks), get_sqrt_ratio_at_tick_batch(upper_ticks), liquidities, round_up=True)
+
+        for i in range(200):
+            expected = get_amounts_for_liquidity(current[i], get_sqrt_ratio_at_tick(lower_ticks[i]), get_sqrt_ratio_at_tick(upper_ticks[i]), liquidities[i], round_up=True)
+            self.assertEqual((amounts0[i], amounts1[i]), expected)
+
+    def test_position_exact_amounts(self):
+
+        liquidity = 400520207989578995206
+        position = Position(0, -50, 50, liquidity, 0, 0)
+        book = PositionBook.from_positions([position, position])
+
+        sqrt_price = get_sqrt_ratio_at_tick(0)
+        amount0, amount1 = position.exact_amounts(sqrt_price, round_up=True)
+
+        self.assertEqual(get_liquidity_for_amounts(sqrt_price, get_sqrt_ratio_at_tick(-50), get_sqrt_ratio_at_tick(50), amount0, amount1), liquidity)
+
+        amounts0, amounts1 = book.exact_amounts(sqrt_price, round_up=True)
+        self.assertEqual(amounts0.tolist(), [amount0, amount0])
+        self.assertEqual(amounts1.tolist(), [amount1, amount1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import unittest
+from types import SimpleNamespace
+
+from web3.exceptions import ContractLogicError
+
+from src.fee_policy import FeePolicy, gas_cost, gas_key
+
+
+class FakeEth:
+
+    def __init__(self):
+        self.fee_history_calls = 0
+
+    def fee_history(self, block_count, newest_block, reward_percentiles):
+
+        self.fee_history_calls += 1
+
+        # rewards at the 10th, 50th and 90th percentile of three blocks
+        return {
+            "oldestBlock": 100,
+            "baseFeePerGas": [10 * 10**9, 11 * 10**9, 12 * 10**9, 13 * 10**9],
+            "reward": [[1 * 10**9, 2 * 10**9, 5 * 10**9], [1 * 10**9, 3 * 10**9, 6 * 10**9], [2 * 10**9, 2 * 10**9, 9 * 10**9]],
+        }
+
+
+class FakeFunction:
+
+    def __init__(self, gas=None, fn_name="swap", args=()):
+        self.gas = gas
+        self.fn_name = fn_name
+        self.args = args
+
+    def estimate_gas(self, params):
+
+        if self.gas is None:
+            raise ContractLogicError("execution reverted: STF")
+
+        return self.gas
+
+
+class TestFeePolicy(unittest.TestCase):
+
+    def setUp(self):
+
+        self.eth = FakeEth()
+        self.policy = FeePolicy(SimpleNamespace(eth=self.eth))
+
+    def test_fees_by_urgency(self):
+
+        # base fee of the next block is 13 gwei
+        self.assertEqual(self.policy.fees(), {"maxFeePerGas": 28 * 10**9, "maxPriorityFeePerGas": 2 * 10**9})
+        self.assertEqual(self.policy.fees("low")["maxPriorityFeePerGas"], 1 * 10**9)
+        self.assertEqual(self.policy.fees("high"), {"maxFeePerGas": 32 * 10**9, "maxPriorityFeePerGas": 6 * 10**9})
+
+        # the fee history is read once
+        self.assertEqual(self.eth.fee_history_calls, 1)
+
+        with self.assertRaises(ValueError):
+            self.policy.fees("asap")
+
+    def test_estimate_gas(self):
+
+        self.assertEqual(self.policy.estimate_gas(FakeFunction(50000), {}), 60000)
+
+        # a call that reverts at the latest block
+        self.assertEqual(self.policy.estimate_gas(FakeFunction(fn_name="collect"), {}, fallback=100000), 100000)
+
+        with self.assertRaises(ContractLogicError):
+            self.policy.estimate_gas(FakeFunction(fn_name="collect"), {})
+
+    def test_gas_limit(self):
+
+        # defaults until a call of the type is estimated or mined
+        self.assertEqual(self.policy.gas_limit(FakeFunction(fn_name="approve")), 100000)
+        self.assertIsNone(self.policy.gas_limit(FakeFunction()))
+
+        self.policy.estimate_gas(FakeFunction(40000, "approve"), {})
+        self.policy.record_gas_used(gas_key(FakeFunction(fn_name="approve")), 30000)
+        self.assertEqual(self.policy.gas_limit(FakeFunction(fn_name="approve")), 48000)
+
+        # a call reverting at the latest block uses the learned limit
+        self.assertEqual(self.policy.estimate_gas(FakeFunction(fn_name="approve"), {}, fallback=100000), 48000)
+
+        # multicalls by the calls they batch
+        close = FakeFunction(fn_name="multicall", args=(["0x0c49ccbe00", "0xfc6f786500"],))
+        rebalance = FakeFunction(fn_name="multicall", args=(["0x0c49ccbe00", "0xfc6f786500", "0x8831645600"],))
+        self.policy.record_gas_used(gas_key(close), 200000)
+        self.assertEqual(self.policy.gas_limit(close), 240000)
+        self.assertEqual(self.policy.gas_limit(rebalance), 800000)
+
+    def test_gas_cost(self):
+
+        self.assertEqual(gas_cost({"gasUsed": 21000, "effectiveGasPrice": 3 * 10**9}), 63000 * 10**9)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import asyncio
+import unittest
+from types import SimpleNamespace
+
+from web3 import Web3
+
+from src.utils import load_abi
+from src.live_feed import LiveFeed
+from src.provider import EVENT_TOPICS
+
+
+class FakeState:
+
+    def __init__(self):
+        self.current_block = None
+        self.calls = []
+
+    def sync(self, head, sync=False):
+        self.calls.append(("sync", head))
+        self.current_block = head
+
+    def confirm(self, head, sync=False):
+        self.calls.append(("confirm", head))
+
+
+def live_feed(get_current_block=None):
+
+    provider = SimpleNamespace(backtest=False, get_current_block=get_current_block)
+
+    return LiveFeed(provider, FakeState(), ws_url=None)
+
+
+class TestLiveFeed(unittest.TestCase):
+
+    def test_event_topics(self):
+
+        # topics of the events in the ABI of the pool
+        topics = {}
+        for entry in load_abi("POOL"):
+            if entry.get("type") == "event" and entry["name"] in ("Swap", "Mint", "Burn"):
+                signature = f"{entry['name']}({','.join(argument['type'] for argument in entry['inputs'])})"
+                topics[Web3.to_hex(Web3.keccak(text=signature))] = entry["name"]
+
+        self.assertEqual(topics, EVENT_TOPICS)
+
+    def test_flush(self):
+
+        feed = live_feed()
+        feed.pending_head = 12
+
+        asyncio.run(feed._flush(12))
+
+        self.assertEqual(feed.state.calls, [("confirm", 12)])
+        self.assertIsNone(feed.pending_head)
+
+    def test_catch_up(self):
+
+        feed = live_feed()
+
+        # starts at the first head
+        asyncio.run(feed._catch_up(100))
+        self.assertEqual((feed.state.current_block, feed.state.calls), (100, []))
+
+        asyncio.run(feed._catch_up(100))
+        asyncio.run(feed._catch_up(103))
+
+        self.assertEqual(feed.state.calls, [("sync", 103)])
+
+    def test_poll_backoff(self):
+
+        blocks = iter([100, ConnectionError("down"), ConnectionError("down"), 101])
+
+        def get_current_block():
+            block = next(blocks)
+            if isinstance(block, Exception):
+                raise block
+            return block
+
+        feed = live_feed(get_current_block=get_current_block)
+        feed.poll_interval = 12
+        feed.running = True
+
+        sleeps = []
+
+        async def sleep(seconds):
+            sleeps.append(seconds)
+            if len(sleeps) == 4:
+                feed.running = False
+
+        feed._sleep = sleep
+
+        asyncio.run(feed._poll())
+
+        # doubled after every failure, reset after a success
+        self.assertEqual(sleeps, [12, 24, 48, 12])
+        self.assertEqual(feed.state.calls, [("sync", 101)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+import logging
+import unittest
+from types import SimpleNamespace
+
+from src.provider import Provider
+from src.transaction_manager import TransactionReverted
+from src.position import Position
+from src.exact_math import get_sqrt_ratio_at_tick, get_liquidity_for_amounts, MAX_UINT256
+
+
+class FakeContract:
+
+    def __init__(self, address):
+
+        self.address = address
+        self.functions = SimpleNamespace(**{name: (lambda *args, name=name: (name, args)) for name in ("exactInputSingle", "deposit", "mint", "approve")})
+
+
+class FakeTransactions:
+
+    def __init__(self):
+
+        self.submitted = []
+        self.calls = {}
+
+        # called with the pending transactions that are waited for, e.g. to apply a swap
+        self.on_wait = lambda pending_transactions: None
+
+    def submit(self, function, params=None):
+
+        self.submitted.append(function[0])
+        self.calls[function[0]] = function[1]
+
+        return SimpleNamespace(function=function)
+
+    def wait_all(self, pending_transactions, timeout=None):
+
+        self.on_wait(pending_transactions)
+
+        return [("0x", {"status": 1}) for _ in pending_transactions]
+
+
+def fake_provider(balance_token0, balance_token1):
+
+    provider = Provider.__new__(Provider)
+
+    provider.fee = 500
+    provider.token0_address, provider.token1_address = "T0", "T1"
+    provider.token0_is_WETH = provider.token1_is_WETH = False
+    provider.token0_contract, provider.token1_contract = FakeContract("T0"), FakeContract("T1")
+    provider.router_contract, provider.nft_contract = FakeContract("ROUTER"), FakeContract("NFT")
+    provider.account = SimpleNamespace(address="0xabc")
+
+    balances = {"T0": balance_token0, "T1": balance_token1}
+    provider.wallet = SimpleNamespace(balances=balances, snapshot=lambda: {"eth": 0, "balances": dict(balances)})
+    provider.allowances = SimpleNamespace(ensure=lambda contract, spender, amount: None)
+    provider.transactions = FakeTransactions()
+
+    provider.logger = logging.getLogger('test')
+
+    return provider
+
+
+class TestMintPosition(unittest.TestCase):
+
+    def setUp(self):
+
+        # around price 1, both tokens in the range
+        self.sqrt_price = get_sqrt_ratio_at_tick(0)
+        liquidity = get_liquidity_for_amounts(self.sqrt_price, get_sqrt_ratio_at_tick(-100), get_sqrt_ratio_at_tick(100), MAX_UINT256, 10**18)
+
+        self.position = Position(0, -100, 100, liquidity, 0, 0)
+        self.amount_token0, self.amount_token1 = self.position.exact_amounts(self.sqrt_price, round_up=True)
+
+    def test_swap_leaves_too_little(self):
+
+        # enough at the price, but not with the swap fee and the slippage bound on top
+        provider = fake_provider(0, self.amount_token0 + self.amount_token1 + 10**12)
+
+        self.assertEqual(provider.mint_position(self.position, 0, self.sqrt_price), (None, None))
+        self.assertEqual(provider.transactions.submitted, [])
+
+    def test_swap_and_mint(self):
+
+        provider = fake_provider(0, 2 * (self.amount_token0 + self.amount_token1))
+
+        provider.mint_position(self.position, 0, self.sqrt_price)
+
+        self.assertEqual(provider.transactions.submitted, ["exactInputSingle", "mint"])
+
+    def test_swap_minimum_from_simulated_output(self):
+
+        provider = fake_provider(0, 2 * (self.amount_token0 + self.amount_token1))
+
+        provider.mint_position(self.position, 0, self.sqrt_price, max_slippage=0.005)
+
+        amount_in, amount_out_minimum = provider.transactions.calls["exactInputSingle"][0][5:7]
+
+        # output of the padded input reduced by the slippage bound: around the shortfall, not above it
+        self.assertEqual(amount_out_minimum, int(provider.get_swap_amount_out(amount_in, False, 0, self.sqrt_price) * 0.995))
+        self.assertLess(amount_out_minimum, self.amount_token0)
+        self.assertGreater(amount_out_minimum, self.amount_token0 * 0.99)
+
+    def test_mint_waits_for_the_swap(self):
+
+        provider = fake_provider(0, 2 * (self.amount_token0 + self.amount_token1))
+
+        def swap_mined(pending_transactions):
+
+            # the swap returned its minimum output, less than the shortfall
+            if pending_transactions[0].function[0] == "exactInputSingle":
+                self.assertNotIn("mint", provider.transactions.submitted)
+                provider.wallet.balances["T0"] += provider.transactions.calls["exactInputSingle"][0][6]
+
+        provider.transactions.on_wait = swap_mined
+
+        provider.mint_position(self.position, 0, self.sqrt_price)
+
+        amount_token0, amount_token1 = provider.transactions.calls["mint"][0][5:7]
+
+        self.assertEqual(amount_token0, provider.wallet.balances["T0"])
+        self.assertLess(amount_token0, self.amount_token0)
+        self.assertEqual(amount_token1, self.amount_token1)
+
+    def test_reverted_swap_stops_the_mint(self):
+
+        provider = fake_provider(0, 2 * (self.amount_token0 + self.amount_token1))
+
+        def swap_reverted(pending_transactions):
+            raise TransactionReverted(b"\x01", {"status": 0})
+
+        provider.transactions.on_wait = swap_reverted
+
+        with self.assertRaises(TransactionReverted):
+            provider.mint_position(self.position, 0, self.sqrt_price)
+
+        self.assertEqual(provider.transactions.submitted, ["exactInputSingle"])
+
+
+if __name__ == '__main__':
+    unittest.main()
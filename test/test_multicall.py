@@ -0,0 +1,99 @@
+import unittest
+from types import SimpleNamespace
+from web3 import Web3
+from eth_abi import encode
+
+from src.provider import Provider
+from src.multicall import Multicall, decode_result
+from src.utils import get_contract
+
+POOL_ADDRESS = "0x88e6A0c2dDD26FEEb64F039a2c41296FcB3f5640"
+
+TICK_STATE = [10**18, -10**18, 2**200, 3, -5, 7, 11, True]
+SLOT0 = [2**96, 201000, 1, 2, 3, 0, True]
+
+
+def selector_of(signature):
+    return Web3.keccak(text=signature)[:4]
+
+
+class FakeAggregate3:
+
+    """
+    Answers aggregate3 with the encoded results of the pool getters
+    """
+
+    def __init__(self, calls_made):
+        self.calls_made = calls_made
+
+    def __call__(self, calls):
+
+        self.calls_made.append(calls)
+
+        results = []
+        for target, _, call_data in calls:
+            selector = call_data[:4]
+            if selector == selector_of("ticks(int24)"):
+                results.append((True, encode(["uint128", "int128", "uint256", "uint256", "int56", "uint160", "uint32", "bool"], TICK_STATE)))
+            elif selector == selector_of("slot0()"):
+                results.append((True, encode(["uint160", "int24", "uint16", "uint16", "uint16", "uint8", "bool"], SLOT0)))
+            elif selector == selector_of("liquidity()"):
+                results.append((True, encode(["uint128"], [12345])))
+            elif selector in (selector_of("feeGrowthGlobal0X128()"), selector_of("feeGrowthGlobal1X128()")):
+                results.append((True, encode(["uint256"], [1 << 128])))
+            else:
+                results.append((False, b""))
+
+        return SimpleNamespace(call=lambda block_identifier: results)
+
+
+class TestMulticall(unittest.TestCase):
+
+    def setUp(self):
+
+        self.pool_contract = get_contract("POOL", POOL_ADDRESS)
+
+        self.calls_made = []
+        self.multicall = Multicall(max_calls=3)
+        self.multicall.contract = SimpleNamespace(functions=SimpleNamespace(aggregate3=FakeAggregate3(self.calls_made)))
+
+    def test_decode_result(self):
+
+        tick_state = decode_result(self.pool_contract.functions.ticks(10), encode(["uint128", "int128", "uint256", "uint256", "int56", "uint160", "uint32", "bool"], TICK_STATE))
+        liquidity = decode_result(self.pool_contract.functions.liquidity(), encode(["uint128"], [12345]))
+
+        self.assertEqual(tick_state, TICK_STATE)
+        self.assertEqual(liquidity, 12345)
+
+    def test_aggregate_in_chunks(self):
+
+        functions = self.pool_contract.functions
+        results = self.multicall.aggregate([functions.ticks(tick) for tick in range(0, 50, 10)] + [functions.liquidity(), functions.fee()])
+
+        self.assertEqual(len(self.calls_made), 3)
+        self.assertEqual(results[:5], [TICK_STATE] * 5)
+        self.assertEqual(results[5], 12345)
+        self.assertIsNone(results[6])
+
+    def test_provider_pool_snapshot(self):
+
+        provider = Provider.__new__(Provider)
+        provider.backtest = False
+        provider.latest_block = None
+        provider.replayer = None
+        provider.pool_contract = self.pool_contract
+        provider.multicall = self.multicall
+
+        snapshot = provider.get_pool_snapshot(100, ticks=[10, 20])
+
+        self.assertEqual(snapshot["slot0"], SLOT0)
+        self.assertEqual(snapshot["liquidity"], 12345)
+        self.assertEqual(snapshot["growth_global"], (1.0, 1.0))
+        self.assertEqual(snapshot["tick_states"], {10: TICK_STATE, 20: TICK_STATE})
+
+        # slot0, liquidity, two fee growth and two tick calls
+        self.assertEqual(sum(len(calls) for calls in self.calls_made), 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
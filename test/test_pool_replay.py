@@ -0,0 +1,147 @@
+import unittest
+
+from src.exact_math import Q96, Q128, compute_swap_step, get_sqrt_ratio_at_tick, get_tick_at_sqrt_ratio
+from src.pool_replay import PoolReplayer, SnapshotRangeError
+
+L0 = 10**18
+L1 = 5 * 10**17
+
+class TestPoolReplay(unittest.TestCase):
+
+    def setUp(self):
+
+        # two positions around tick 0: [-100, 100] with L0 and [-50, 50] with L1
+        self.snapshot = {
+            "block": 99,
+            "pool": {"fee": 500, "tick_spacing": 10},
+            "sqrt_price_x96": Q96,
+            "tick": 0,
+            "fee_protocol": 0,
+            "liquidity": L0 + L1,
+            "fee_growth_global_0_x128": 0,
+            "fee_growth_global_1_x128": 0,
+            "ticks": {
+                "-100": [L0, L0, 0, 0],
+                "-50": [L1, L1, 0, 0],
+                "50": [L1, -L1, 0, 0],
+                "100": [L0, -L0, 0, 0],
+            },
+        }
+
+    def _swap_one_for_zero_to_tick(self, tick):
+
+        # amounts of a swap from tick 0 to the given tick (between 50 and 100) crossing tick 50
+        target = get_sqrt_ratio_at_tick(tick)
+        sqrt_price_50 = get_sqrt_ratio_at_tick(50)
+
+        _, amount_in_1, amount_out_1, fee_1 = compute_swap_step(Q96, sqrt_price_50, L0 + L1, 10**30, 500)
+        _, amount_in_2, amount_out_2, fee_2 = compute_swap_step(sqrt_price_50, target, L0, 10**30, 500)
+
+        amount1 = amount_in_1 + fee_1 + amount_in_2 + fee_2
+        amount0 = -(amount_out_1 + amount_out_2)
+
+        return [100, tick, L0, target, amount0, amount1, 1], fee_1, fee_2
+
+    def test_swap_crosses_tick(self):
+
+        swap, fee_1, fee_2 = self._swap_one_for_zero_to_tick(70)
+
+        replayer = PoolReplayer(self.snapshot, swap_events=[swap])
+        replayer.advance_to(100)
+
+        fee_growth_at_crossing = fee_1 * Q128 // (L0 + L1)
+
+        self.assertEqual(replayer.tick, 70)
+        self.assertEqual(replayer.liquidity, L0)
+        self.assertEqual(replayer.fee_growth_global_0_x128, 0)
+        self.assertEqual(replayer.fee_growth_global_1_x128, fee_growth_at_crossing + fee_2 * Q128 // L0)
+
+        # fee growth outside of the crossed tick is flipped
+        self.assertEqual(replayer.get_tick_state(50)[3], fee_growth_at_crossing)
+        self.assertEqual(replayer.get_tick_state(100)[3], 0)
+
+    def test_mint_and_burn(self):
+
+        mint = [100, -20, 20, 0, 0, 10**17, 0]
+        burn = [101, -20, 20, 0, 0, 10**17, 3]
+
+        replayer = PoolReplayer(self.snapshot, mint_events=[mint], burn_events=[burn])
+
+        replayer.advance_to(100)
+
+        self.assertEqual(replayer.liquidity, L0 + L1 + 10**17)
+        self.assertEqual(replayer.get_tick_state(-20)[:2], [10**17, 10**17])
+        self.assertEqual(replayer.get_tick_state(20)[:2], [10**17, -10**17])
+        self.assertTrue(replayer.get_tick_state(20)[-1])
+
+        replayer.advance_to(101)
+
+        self.assertEqual(replayer.liquidity, L0 + L1)
+        self.assertFalse(replayer.get_tick_state(-20)[-1])
+        self.assertFalse(replayer.get_tick_state(20)[-1])
+        self.assertNotIn(20, replayer.initialized_ticks)
+
+    def test_events_ordered_by_log_index(self):
+
+        # the mint happens before the swap in the same block
+        swap, _, _ = self._swap_one_for_zero_to_tick(70)
+        swap[-1] = 5
+        mint = [100, 60, 80, 0, 0, 10**17, 2]
+
+        replayer = PoolReplayer(self.snapshot, swap_events=[swap], mint_events=[mint])
+        replayer.advance_to(100)
+
+        # tick 60 was initialized below the current tick and crossed by the swap
+        self.assertNotEqual(replayer.get_tick_state(60)[3], 0)
+
+    def test_cannot_go_back(self):
+
+        replayer = PoolReplayer(self.snapshot)
+        replayer.advance_to(120)
+
+        with self.assertRaises(ValueError):
+            replayer.advance_to(110)
+
+    def test_snapshot_round_trip(self):
+
+        swap, _, _ = self._swap_one_for_zero_to_tick(70)
+
+        replayer = PoolReplayer(self.snapshot, swap_events=[swap])
+        replayer.advance_to(100)
+
+        restored = PoolReplayer(replayer.to_snapshot())
+
+        self.assertEqual(restored.slot0(), replayer.slot0())
+        self.assertEqual(restored.ticks, replayer.ticks)
+        self.assertEqual(restored.fee_growth_global_1_x128, replayer.fee_growth_global_1_x128)
+
+    def test_snapshot_tick_range(self):
+
+        # only the ticks between -60 and 60 were fetched
+        snapshot = dict(self.snapshot, ticks={"-50": [L1, L1, 0, 0], "50": [L1, -L1, 0, 0]}, tick_range=[-60, 60], liquidity=L1)
+
+        replayer = PoolReplayer(snapshot)
+
+        # a mint outside the window only changes the liquidity
+        replayer.apply_mint(-100, 100, L0)
+
+        self.assertEqual(replayer.liquidity, L0 + L1)
+        self.assertEqual(sorted(replayer.ticks), [-50, 50])
+        self.assertEqual(PoolReplayer(replayer.to_snapshot()).tick_index.loaded_range, (-60, 60))
+
+        with self.assertRaises(SnapshotRangeError):
+            replayer.get_tick_state(100)
+
+        swap, _, _ = self._swap_one_for_zero_to_tick(70)
+
+        with self.assertRaises(SnapshotRangeError):
+            replayer.apply_swap(swap[4], swap[5], swap[3], swap[2], swap[1])
+
+    def test_tick_at_sqrt_ratio(self):
+
+        for tick in [-887272, -100, -1, 0, 1, 70, 200000, 887271]:
+            self.assertEqual(get_tick_at_sqrt_ratio(get_sqrt_ratio_at_tick(tick)), tick)
+
+
+if __name__ == '__main__':
+    unittest.main()
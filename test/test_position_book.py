@@ -0,0 +1,57 @@
+import unittest
+import numpy as np
+
+from src.position import Position
+from src.position_book import PositionBook
+
+class TestPositionBook(unittest.TestCase):
+
+    def setUp(self):
+
+        rng = np.random.default_rng(0)
+
+        lower_ticks = rng.integers(-1000, 1000, 20) * 10
+        upper_ticks = lower_ticks + rng.integers(1, 200, 20) * 10
+        init_ticks = rng.integers(-12000, 12000, 20)
+        liquidities = rng.uniform(1e15, 1e18, 20)
+
+        self.positions = [Position(int(init), int(lower), int(upper), float(liquidity), 1e-3, 2e-3) for init, lower, upper, liquidity in zip(init_ticks, lower_ticks, upper_ticks, liquidities)]
+        self.book = PositionBook.from_positions(self.positions)
+
+        self.ticks = np.array([-15000, -5000, -1, 0, 1, 3333, 15000])
+
+    def assertMatchesScalar(self, vectorized, scalar):
+
+        # vectorized has shape (ticks, positions)
+        expected = np.array([[scalar(position, int(tick)) for position in self.positions] for tick in self.ticks])
+        np.testing.assert_allclose(vectorized, expected, rtol=1e-12, atol=1e-9)
+
+    def test_amounts(self):
+
+        self.assertMatchesScalar(self.book.amount_x(self.ticks[:, None]), lambda position, tick: position.amount_x(tick))
+        self.assertMatchesScalar(self.book.amount_y(self.ticks[:, None]), lambda position, tick: position.amount_y(tick))
+
+    def test_values(self):
+
+        self.assertMatchesScalar(self.book.value_position(self.ticks[:, None]), lambda position, tick: position.value_position(tick))
+        self.assertMatchesScalar(self.book.value_hold(self.ticks[:, None]), lambda position, tick: position.value_hold(tick))
+        self.assertMatchesScalar(self.book.impermanent_loss(self.ticks[:, None]), lambda position, tick: position.impermantent_loss(tick))
+
+    def test_accumulated_fees(self):
+
+        fees_0, fees_1 = self.book.accumulated_fees(self.ticks[:, None], 5e-3, 7e-3)
+
+        self.assertMatchesScalar(fees_0, lambda position, tick: position.accumulated_fees(tick, 5e-3, 7e-3)[0])
+        self.assertMatchesScalar(np.broadcast_to(fees_1, fees_0.shape), lambda position, tick: position.accumulated_fees(tick, 5e-3, 7e-3)[1])
+
+    def test_exact_sqrt_price(self):
+
+        sqrt_price = 2**96 * 1.0001 ** 50
+
+        amount_x = self.book.amount_x(100, sqrt_price)
+
+        np.testing.assert_allclose(amount_x, [position.amount_x(100, sqrt_price) for position in self.positions], rtol=1e-12)
+
+
+if __name__ == '__main__':
+    unittest.main()
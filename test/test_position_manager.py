@@ -0,0 +1,153 @@
+import unittest
+import numpy as np
+from types import SimpleNamespace
+
+from web3 import Web3
+
+from src.utils import load_abi
+from src.provider import _encode_call
+from src.transaction_manager import TransactionReverted
+from src.base_strategy import BaseStrategy
+from src.protocol_state import ProtocolState
+from src.position_manager import PositionManager
+
+from test.test_sweep import backtest_provider
+
+
+class Closed(BaseStrategy):
+
+    def __init__(self, provider=None, state=None, position_manager=None):
+
+        super().__init__(provider, state, position_manager)
+        self.closed = []
+
+    def on_position_closed(self, index, performance):
+        self.closed.append((index, performance))
+
+
+class TestPositionManager(unittest.TestCase):
+
+    def setUp(self):
+
+        self.provider = backtest_provider()
+        self.state = ProtocolState(self.provider, bar_resolutions=(5,))
+        self.position_manager = PositionManager(self.provider, self.state)
+
+        self.state.update(100, 110)
+
+    def test_rebalance(self):
+
+        closed = Closed(self.provider, self.state, self.position_manager)
+        closed.start()
+
+        self.position_manager.open_position(-100, 100, y_real=10**18)
+        self.position_manager.rebalance_position(0, -200, 200, y_real=10**18)
+
+        self.assertEqual(self.position_manager.open_positions_index, [1])
+        self.assertEqual(self.position_manager.closed_positions_index, [0])
+        self.assertEqual((self.position_manager.positions[1].lower_tick, self.position_manager.positions[1].upper_tick), (-200, 200))
+
+        self.assertEqual(len(self.position_manager.performance), 1)
+        self.assertEqual(self.position_manager.performance[0]["gas_cost"], 0)
+        self.assertEqual(closed.closed, [(0, self.position_manager.performance[0])])
+
+    def test_rebalance_keeps_position(self):
+
+        self.position_manager.open_position(-100, 100, y_real=10**18)
+
+        # a range above the price takes no token1 -> nothing is closed
+        self.position_manager.rebalance_position(0, 100, 200, y_real=10**18)
+
+        self.assertEqual(self.position_manager.open_positions_index, [0])
+        self.assertEqual(self.position_manager.performance, [])
+
+    def _live(self):
+
+        # pool state of the backtest, transactions of a live provider
+        pool_snapshot = self.provider.get_pool_snapshot(110, ticks=[-200, -100, 100, 200])
+
+        self.provider.backtest = False
+        self.provider.get_pool_snapshot = lambda block, ticks=(): pool_snapshot
+        self.provider.transactions = SimpleNamespace(gas_spent=0)
+        self.provider.parse_mint_receipt = lambda receipt: (receipt["token_id"], 1, 2, receipt.get("liquidity", 3))
+
+    def test_live_mint_without_balance(self):
+
+        self._live()
+        self.provider.mint_position = lambda *args: (None, None)
+
+        self.position_manager.open_position(-100, 100, y_real=10**18)
+
+        self.assertEqual(self.position_manager.positions, [])
+        self.assertEqual(self.position_manager.open_positions_index, [])
+
+    def test_live_close_reverted(self):
+
+        self._live()
+        self.provider.mint_position = lambda *args: ("0x01", {"token_id": 42})
+
+        def burn_position(*args):
+            raise TransactionReverted(b"\x02", {"status": 0})
+
+        self.provider.burn_position = burn_position
+
+        self.position_manager.open_position(-100, 100, y_real=10**18)
+        self.position_manager.close_position(0)
+
+        self.assertEqual(self.position_manager.positions[0].token_id, 42)
+        self.assertEqual(self.position_manager.open_positions_index, [0])
+        self.assertEqual(self.position_manager.performance, [])
+
+    def test_live_rebalance_closed_without_new_position(self):
+
+        self._live()
+        self.provider.mint_position = lambda *args: ("0x01", {"token_id": 42})
+
+        # closed, but the new position could not be minted
+        self.provider.rebalance_position = lambda *args: (None, None)
+
+        self.position_manager.open_position(-100, 100, y_real=10**18)
+        self.position_manager.rebalance_position(0, -200, 200, y_real=10**18)
+
+        self.assertEqual(len(self.position_manager.positions), 1)
+        self.assertEqual(self.position_manager.open_positions_index, [])
+        self.assertEqual(self.position_manager.closed_positions_index, [0])
+
+    def test_exact_liquidity_events(self):
+
+        provider = backtest_provider()
+
+        # an amount that is not exact as float
+        mint = [105, -100, 100, 0, 0, 2**60 + 1, 1]
+
+        provider.mint_data, mint_offsets = provider._index_events(np.array([mint], dtype=np.float64))
+        provider.event_data["Mint"], provider.event_offsets["Mint"] = provider.mint_data, mint_offsets
+        provider.exact_events = (provider.exact_events[0], [mint], [])
+
+        state = ProtocolState(provider, bar_resolutions=(5,))
+        state.update(100, 104, sync=True)
+
+        tick_state = state.tick_index.get(-100)
+        state.update(104, 110, sync=True)
+
+        self.assertEqual(state.tick_index.get(-100)[1], tick_state[1] + 2**60 + 1)
+
+    def test_encode_multicall(self):
+
+        nft_contract = Web3().eth.contract(abi=load_abi("NFT_POSITION_MANAGER"))
+
+        calls = [
+            _encode_call(nft_contract, "collect", (7, "0x" + "11" * 20, 2 ** 128 - 1, 2 ** 128 - 1)),
+            _encode_call(nft_contract, "burn", 7),
+        ]
+
+        collect, collect_args = nft_contract.decode_function_input(calls[0])
+        burn, burn_args = nft_contract.decode_function_input(calls[1])
+
+        self.assertEqual(collect.fn_name, "collect")
+        self.assertEqual(collect_args["params"]["tokenId"], 7)
+        self.assertEqual((burn.fn_name, burn_args["tokenId"]), ("burn", 7))
+
+
+if __name__ == '__main__':
+    unittest.main()
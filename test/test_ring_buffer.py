@@ -0,0 +1,73 @@
+import unittest
+import numpy as np
+
+from src.ring_buffer import RingBuffer
+
+class TestRingBuffer(unittest.TestCase):
+
+    def test_keeps_last_rows_in_order(self):
+
+        buffer = RingBuffer(4, 2)
+        buffer.extend([[1, 10], [2, 20], [3, 30]])
+        buffer.extend([[4, 40], [5, 50]])
+
+        self.assertEqual(len(buffer), 4)
+        self.assertEqual(buffer.view()[:, 0].tolist(), [2, 3, 4, 5])
+        self.assertEqual(buffer.view(2)[:, 1].tolist(), [40, 50])
+        self.assertEqual(buffer[-1][1], 50)
+
+    def test_view_is_zero_copy(self):
+
+        buffer = RingBuffer(3, 1)
+        for value in range(7):
+            buffer.append([value])
+
+        view = buffer.view()
+
+        self.assertEqual(view[:, 0].tolist(), [4, 5, 6])
+        self.assertFalse(view.flags.owndata)
+
+    def test_extend_larger_than_capacity(self):
+
+        buffer = RingBuffer(3, 1)
+        buffer.append([0])
+        buffer.extend(np.arange(10).reshape(-1, 1))
+
+        self.assertEqual(buffer.view()[:, 0].tolist(), [7, 8, 9])
+
+    def test_snapshot_is_a_copy(self):
+
+        buffer = RingBuffer(2, 1)
+        buffer.extend([[1], [2]])
+
+        snapshot = buffer.snapshot()
+        buffer.extend([[3], [4]])
+
+        self.assertEqual(snapshot[:, 0].tolist(), [1, 2])
+        self.assertEqual(buffer.snapshot()[:, 0].tolist(), [3, 4])
+
+    def test_exact_integers_are_converted(self):
+
+        buffer = RingBuffer(2, 2)
+        buffer.append([17000000, 2**200])
+
+        self.assertEqual(buffer[0][1], float(2**200))
+
+    def test_truncate(self):
+
+        buffer = RingBuffer(4, 1)
+        buffer.extend(np.arange(6).reshape(-1, 1))
+
+        buffer.truncate(3)
+        self.assertEqual(buffer.view()[:, 0].tolist(), [2])
+
+        # the storage wraps around
+        buffer.extend([[6], [7], [8]])
+        self.assertEqual(buffer.view()[:, 0].tolist(), [2, 6, 7, 8])
+
+        buffer.truncate(10)
+        self.assertEqual(len(buffer), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
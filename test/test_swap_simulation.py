@@ -0,0 +1,100 @@
+import logging
+import unittest
+import numpy as np
+
+from src.provider import Provider
+from src.tick_index import TickIndex
+from src.swap_simulation import simulate_swap, simulate_swap_ladder, price_impact
+from src.exact_math import Q96, compute_swap_step, get_sqrt_ratio_at_tick
+
+L0 = 10**18
+L1 = 5 * 10**17
+
+class TestSwapSimulation(unittest.TestCase):
+
+    def setUp(self):
+
+        # two positions around tick 0: [-100, 100] with L0 and [-50, 50] with L1
+        self.tick_index = TickIndex(10, {-100: [L0, L0, 0, 0], -50: [L1, L1, 0, 0], 50: [L1, -L1, 0, 0], 100: [L0, -L0, 0, 0]})
+        self.pool = (self.tick_index, Q96, 0, L0 + L1, 500)
+
+    def test_exact_input_crosses_tick(self):
+
+        target = get_sqrt_ratio_at_tick(70)
+        sqrt_price_50 = get_sqrt_ratio_at_tick(50)
+
+        _, amount_in_1, amount_out_1, fee_1 = compute_swap_step(Q96, sqrt_price_50, L0 + L1, 10**30, 500)
+        _, amount_in_2, amount_out_2, fee_2 = compute_swap_step(sqrt_price_50, target, L0, 10**30, 500)
+
+        result = simulate_swap(*self.pool, 10**30, False, target)
+
+        self.assertEqual(result["sqrt_price_x96"], target)
+        self.assertEqual(result["tick"], 70)
+        self.assertEqual(result["liquidity"], L0)
+        self.assertEqual(result["ticks_crossed"], [50])
+        self.assertEqual(result["amount_in"], amount_in_1 + fee_1 + amount_in_2 + fee_2)
+        self.assertEqual(result["amount_out"], amount_out_1 + amount_out_2)
+        self.assertEqual(result["fee_amount"], fee_1 + fee_2)
+
+        # the ticks are not modified by a simulation
+        self.assertEqual(self.tick_index.get(50), [L1, -L1, 0, 0])
+
+    def test_exact_output(self):
+
+        result = simulate_swap(*self.pool, -10**15, True)
+        self.assertEqual(result["amount_out"], 10**15)
+
+        # the same input as exact input swap gives at least the output
+        self.assertGreaterEqual(simulate_swap(*self.pool, result["amount_in"], True)["amount_out"], 10**15)
+
+    def test_price_limit(self):
+
+        limit = get_sqrt_ratio_at_tick(-20)
+        result = simulate_swap(*self.pool, 10**20, True, limit)
+
+        self.assertEqual(result["sqrt_price_x96"], limit)
+        self.assertLess(result["amount_in"], 10**20)
+        self.assertAlmostEqual(price_impact(Q96, result["sqrt_price_x96"]), 1.0001**-20 - 1)
+
+    def test_ladder_matches_single_swaps(self):
+
+        rng = np.random.default_rng(0)
+
+        ladders = [
+            ([int(amount) for amount in rng.integers(1, 10**16, 20)] + [10**13, 10**20], True),
+            ([int(amount) for amount in rng.integers(1, 10**16, 20)] + [10**20], False),
+            ([-int(amount) for amount in rng.integers(1, 10**15, 20)], True),
+        ]
+
+        for amounts, zero_for_one in ladders:
+            ladder = simulate_swap_ladder(*self.pool, amounts, zero_for_one)
+
+            for i, amount in enumerate(amounts):
+                single = simulate_swap(*self.pool, amount, zero_for_one)
+
+                for key in ("amount_in", "amount_out", "fee_amount", "sqrt_price_x96", "tick", "liquidity"):
+                    self.assertEqual(ladder[key][i], single[key], (amount, key))
+                self.assertEqual(ladder["ticks_crossed"][i], len(single["ticks_crossed"]))
+
+    def test_outside_loaded_ticks(self):
+
+        tick_index = TickIndex(10, {-50: [L1, L1, 0, 0], 50: [L1, -L1, 0, 0]}, loaded_range=(-100, 100))
+
+        with self.assertRaises(ValueError):
+            simulate_swap(tick_index, Q96, 0, L1, 500, 10**20, True)
+
+    def test_provider_swap_amount(self):
+
+        provider = Provider.__new__(Provider)
+        provider.fee = 500
+        provider.logger = logging.getLogger("test")
+
+        amount_in = simulate_swap(*self.pool, -10**15, False)["amount_in"]
+        self.assertEqual(provider.get_swap_amount_in(10**15, False, 0, Q96, L0 + L1, self.tick_index, max_slippage=0.01), int(amount_in * 1.01))
+
+        # without the ticks the amount is estimated from the price
+        self.assertEqual(provider.get_swap_amount_in(10**15, False, 0, Q96, max_slippage=0), int(10**15 / (1 - 500 / 10**6)))
+
+
+if __name__ == '__main__':
+    unittest.main()
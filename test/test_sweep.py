@@ -0,0 +1,187 @@
+import os
+import csv
+import tempfile
+import unittest
+import numpy as np
+
+from src import sweep
+from src.provider import Provider
+from src.pool_replay import PoolReplayer
+from src.exact_math import get_sqrt_ratio_at_tick
+
+L = 10**18
+
+
+def backtest_provider():
+
+    # price moving slowly around tick 0 with every tick of the spacing initialized
+    snapshot = {
+        "block": 99,
+        "pool": {"fee": 500, "tick_spacing": 10},
+        "sqrt_price_x96": get_sqrt_ratio_at_tick(0),
+        "tick": 0,
+        "fee_protocol": 0,
+        "liquidity": L,
+        "fee_growth_global_0_x128": 0,
+        "fee_growth_global_1_x128": 0,
+        "ticks": {str(tick): [L, 0, 0, 0] for tick in range(-500, 510, 10)},
+    }
+
+    rng = np.random.default_rng(0)
+    ticks = np.cumsum(rng.integers(-2, 3, 1000))
+
+    swaps = [[100 + i, int(tick), L, get_sqrt_ratio_at_tick(int(tick)), 10**15 if step < 0 else -10**15, -10**15 if step < 0 else 10**15, 0] for i, (tick, step) in enumerate(zip(ticks, np.diff(ticks, prepend=0)))]
+
+    provider = Provider.__new__(Provider)
+    provider.backtest = True
+    provider.sim = False
+    provider.tick_spacing = 10
+    provider.token1_decimals = 18
+    provider.call_cache = None
+
+    provider.first_block = provider.block_number = 100
+    provider.last_block = 1099
+    provider.event_range = (100, 1099)
+
+    provider.swap_data, swap_offsets = provider._index_events(np.array(swaps, dtype=np.float64))
+    provider.mint_data, mint_offsets = provider._index_events(np.zeros((0, 7)))
+    provider.burn_data, burn_offsets = provider._index_events(np.zeros((0, 7)))
+
+    provider.event_data = {"Swap": provider.swap_data, "Mint": provider.mint_data, "Burn": provider.burn_data}
+    provider.event_offsets = {"Swap": swap_offsets, "Mint": mint_offsets, "Burn": burn_offsets}
+
+    provider.snapshot = snapshot
+    provider.exact_events = (swaps, [], [])
+    provider.replayer = PoolReplayer(snapshot, *provider.exact_events)
+
+    return provider
+
+
+class TestSweep(unittest.TestCase):
+
+    def test_parameter_grid(self):
+
+        grid = sweep.parameter_grid({"max_std": [5, 10], "close_after_blocks": [100, 200, 300]})
+
+        self.assertEqual(len(grid), 6)
+        self.assertIn({"max_std": 10, "close_after_blocks": 200}, grid)
+
+    def test_unknown_parameter(self):
+
+        with self.assertRaises(ValueError):
+            sweep.run_sweep({}, {"max_sdt": [5]})
+
+    def test_shard_ranges(self):
+
+        self.assertEqual(sweep.shard_ranges(100, 1099, 3, warmup_blocks=50), [(100, 100, 433), (384, 434, 767), (718, 768, 1099)])
+
+        # warm-up never reaches before the first block
+        self.assertEqual(sweep.shard_ranges(100, 199, 2, warmup_blocks=80), [(100, 100, 149), (100, 150, 199)])
+
+    def test_run_shard(self):
+
+        sweep._provider = backtest_provider()
+
+        params = {"close_after_blocks": 50, "bar_resolution": 5, "lookback_bars": 20, "max_std": 20}
+
+        result = sweep._run_shard((params, (100, 100, 1099), None))
+
+        self.assertGreater(result["positions"], 0)
+        self.assertAlmostEqual(result["pnl"], result["fees"] + result["value_position"] - result["value_hold"])
+
+        # no transactions are sent in backtests
+        self.assertEqual(result["net_pnl"], result["pnl"])
+
+        # the provider is rewound for every backtest -> same result again
+        self.assertEqual(sweep._run_shard((params, (100, 100, 1099), None)), result)
+
+        # nothing is opened if the volatility threshold is never met
+        self.assertEqual(sweep._run_shard(({**params, "max_std": -1}, (100, 100, 1099), None))["positions"], 0)
+
+    def test_run_shard_from_snapshot(self):
+
+        provider = sweep._provider = backtest_provider()
+
+        params = {"close_after_blocks": 50, "bar_resolution": 5, "lookback_bars": 20, "max_std": 20}
+
+        # pool state right before the warm-up of the shard
+        snapshot = PoolReplayer(provider.snapshot, *provider.exact_events).advance_to(499).to_snapshot()
+
+        result = sweep._run_shard((params, (500, 600, 1099), snapshot))
+
+        self.assertGreater(result["positions"], 0)
+
+        # no position is opened during the warm-up, the one opened in the last block is closed
+        self.assertLess(result["positions"], sweep._run_shard((params, (500, 500, 1099), snapshot))["positions"])
+        self.assertLessEqual(sweep._run_shard((params, (500, 1099, 1099), snapshot))["positions"], 1)
+
+    def test_stitch_results(self):
+
+        rows = [
+            {"max_std": 5, "from_block": 200, "to_block": 299, "positions": 2, "fees": 0.2, "value_position": 2.0, "value_hold": 2.1, "pnl": 0.1, "gas_cost": 0.0, "net_pnl": 0.1},
+            {"max_std": 5, "from_block": 100, "to_block": 199, "positions": 1, "fees": 0.1, "value_position": 1.0, "value_hold": 1.2, "pnl": -0.1, "gas_cost": 0.0, "net_pnl": -0.1},
+        ]
+
+        stitched = sweep.stitch_results(rows)
+
+        self.assertEqual((stitched["from_block"], stitched["to_block"]), (100, 299))
+        self.assertEqual(stitched["positions"], 3)
+        self.assertAlmostEqual(stitched["pnl"], 0.0)
+
+    def test_walk_forward(self):
+
+        rows = [
+            {"max_std": 5, "from_block": 100, "to_block": 199, "positions": 1, "fees": 0.0, "value_position": 0.0, "value_hold": 0.0, "pnl": 1.0, "gas_cost": 0.0, "net_pnl": 1.0},
+            {"max_std": 10, "from_block": 100, "to_block": 199, "positions": 1, "fees": 0.0, "value_position": 0.0, "value_hold": 0.0, "pnl": 2.0, "gas_cost": 0.0, "net_pnl": 2.0},
+            {"max_std": 5, "from_block": 200, "to_block": 299, "positions": 1, "fees": 0.0, "value_position": 0.0, "value_hold": 0.0, "pnl": 3.0, "gas_cost": 0.0, "net_pnl": 3.0},
+            {"max_std": 10, "from_block": 200, "to_block": 299, "positions": 1, "fees": 0.0, "value_position": 0.0, "value_hold": 0.0, "pnl": -1.0, "gas_cost": 0.0, "net_pnl": -1.0},
+            {"max_std": 5, "from_block": 300, "to_block": 399, "positions": 1, "fees": 0.0, "value_position": 0.0, "value_hold": 0.0, "pnl": 0.5, "gas_cost": 0.0, "net_pnl": 0.5},
+            {"max_std": 10, "from_block": 300, "to_block": 399, "positions": 1, "fees": 0.0, "value_position": 0.0, "value_hold": 0.0, "pnl": 4.0, "gas_cost": 0.0, "net_pnl": 4.0},
+        ]
+
+        # the best configuration of a shard is evaluated on the next one
+        evaluated = sweep.walk_forward(rows)
+
+        self.assertEqual([(row["from_block"], row["max_std"], row["pnl"]) for row in evaluated], [(200, 10, -1.0), (300, 5, 0.5)])
+
+    def test_ranking_net_of_gas(self):
+
+        # gross the first configuration is better, but it paid more gas for its positions
+        performances = {
+            5: [{"accumulated_fees": (0, 3 * 10**16), "value_position": 10**18, "value_hold": 10**18, "gas_cost": 2 * 10**16}],
+            10: [{"accumulated_fees": (0, 2 * 10**16), "value_position": 10**18, "value_hold": 10**18, "gas_cost": 5 * 10**15}],
+        }
+
+        rows = [{"max_std": max_std, "from_block": 100, "to_block": 199, **sweep.summarize_performance(performance, 18)} for max_std, performance in performances.items()]
+        rows += [{**row, "from_block": 200, "to_block": 299} for row in rows]
+
+        self.assertAlmostEqual(rows[0]["pnl"], 0.03)
+        self.assertAlmostEqual(rows[0]["gas_cost"], 0.02)
+        self.assertAlmostEqual(rows[0]["net_pnl"], 0.01)
+
+        self.assertEqual(sweep.walk_forward(rows)[0]["max_std"], 10)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "results.csv")
+            sweep.write_results(rows[:2], path)
+
+            with open(path) as f:
+                self.assertEqual([row["max_std"] for row in csv.DictReader(f)], ["10", "5"])
+
+    def test_write_results(self):
+
+        rows = [{"max_std": 5, "positions": 1, "fees": 0.1, "value_position": 1.0, "value_hold": 1.2, "pnl": -0.1, "gas_cost": 0.0, "net_pnl": -0.1}, {"max_std": 10, "positions": 2, "fees": 0.3, "value_position": 2.0, "value_hold": 2.0, "pnl": 0.3, "gas_cost": 0.0, "net_pnl": 0.3}]
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "results.csv")
+            sweep.write_results(rows, path)
+
+            with open(path) as f:
+                table = list(csv.DictReader(f))
+
+        self.assertEqual(list(table[0]), ["max_std"] + sweep.RESULT_COLUMNS)
+        self.assertEqual([row["max_std"] for row in table], ["10", "5"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import unittest
+import numpy as np
+
+from src.tick_index import TickIndex, EMPTY_RANGE
+from src.exact_math import next_initialized_tick_within_one_word
+
+class TestTickIndex(unittest.TestCase):
+
+    def setUp(self):
+
+        rng = np.random.default_rng(0)
+
+        # random positions on a tick spacing of 10
+        self.positions = [(int(lower) * 10, int(lower + width) * 10, int(liquidity)) for lower, width, liquidity in zip(rng.integers(-3000, 3000, 50), rng.integers(1, 500, 50), rng.integers(10**15, 10**18, 50))]
+
+        self.index = TickIndex(10)
+        for lower, upper, liquidity in self.positions:
+            self.index.update(lower, liquidity, False)
+            self.index.update(upper, liquidity, True)
+
+    def _liquidity_brute_force(self, tick):
+        return sum(liquidity for lower, upper, liquidity in self.positions if lower <= tick < upper)
+
+    def test_sorted_states(self):
+
+        self.assertTrue(np.all(np.diff(self.index.ticks) > 0))
+
+        lower, upper, liquidity = self.positions[0]
+        self.assertIn(lower, self.index)
+        self.assertGreaterEqual(self.index.get(lower)[0], liquidity)
+        self.assertIsNone(self.index.get(lower + 5))
+
+    def test_liquidity_at(self):
+
+        current_tick = 1234
+        current_liquidity = self._liquidity_brute_force(current_tick)
+
+        ticks = np.arange(-40000, 40000, 777)
+        liquidities = self.index.liquidity_at(ticks, current_tick, current_liquidity)
+
+        self.assertEqual(list(liquidities), [self._liquidity_brute_force(int(tick)) for tick in ticks])
+
+    def test_next_initialized_tick(self):
+
+        ticks = list(self.index.ticks)
+
+        for tick in [-40000, -12345, 0, 999, int(ticks[3]), 40000]:
+            below = [t for t in ticks if t <= tick]
+            above = [t for t in ticks if t > tick]
+
+            self.assertEqual(self.index.next_initialized_tick(tick, True), below[-1] if below else None)
+            self.assertEqual(self.index.next_initialized_tick(tick, False), above[0] if above else None)
+
+            for lte in (True, False):
+                self.assertEqual(self.index.next_initialized_tick_within_one_word(tick, lte), next_initialized_tick_within_one_word(ticks, tick, 10, lte))
+
+    def test_ticks_between(self):
+
+        ticks = self.index.ticks
+
+        self.assertEqual(list(self.index.ticks_between(-5000, 5000)), [tick for tick in ticks if -5000 < tick <= 5000])
+
+    def test_update_removes_tick(self):
+
+        index = TickIndex(10)
+
+        self.assertTrue(index.update(-20, 100, False))
+        self.assertFalse(index.update(-20, 50, False))
+        self.assertEqual(index.get(-20), [150, 150, 0, 0])
+
+        self.assertTrue(index.update(-20, -150, False))
+        self.assertNotIn(-20, index)
+
+    def test_cross(self):
+
+        index = TickIndex(10, {50: [10, -10, 3, 4]})
+
+        self.assertEqual(index.cross(50, 10, 20), -10)
+        self.assertEqual(index.get(50), [10, -10, 7, 16])
+
+    def test_load_range(self):
+
+        index = TickIndex(10, loaded_range=EMPTY_RANGE)
+        self.assertFalse(index.covers(0, 0))
+
+        index.load({0: [5, 5, 0, 0, 0, 0, 0, True], 10: None}, -100, 100)
+        index.load({100: [5, -5, 0, 0], 0: None}, 0, 200)
+
+        self.assertEqual(index.loaded_range, (-100, 200))
+        self.assertTrue(index.covers(-50, 150))
+        self.assertFalse(index.covers(-50, 250))
+        self.assertEqual(list(index.ticks), [100])
+
+        # a range that does not touch the loaded one replaces it
+        index.load({}, 1000, 1200)
+        self.assertEqual(index.loaded_range, (1000, 1200))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import math
+import unittest
+import numpy as np
+
+from src.position import Position
+from src.position_book import PositionBook
+from src.tick_table import TickTable, get_tick_table
+from src.exact_math import get_sqrt_ratio_at_tick, MIN_TICK, MAX_TICK
+
+class TestTickTable(unittest.TestCase):
+
+    def test_matches_direct_computation(self):
+
+        table = TickTable(tick_spacing=10, window=100)
+
+        for tick in [0, 10, -10, 201000, -201000, MIN_TICK + 2, MAX_TICK - 2, 5, -7]:
+            self.assertEqual(table.sqrt_price(tick), np.power(1.0001, tick / 2))
+            self.assertEqual(table.price(tick), np.power(1.0001, tick))
+            self.assertEqual(table.sqrt_price_x96(tick), get_sqrt_ratio_at_tick(tick))
+
+            # same as uniwap_math up to the last bit
+            self.assertAlmostEqual(table.price(tick) / math.pow(1.0001, tick), 1, delta=1e-15)
+
+    def test_grows_on_demand(self):
+
+        table = TickTable(tick_spacing=10, window=100)
+        self.assertEqual(len(table), 0)
+
+        table.price(0)
+        self.assertEqual(len(table), 201)
+
+        # lookups inside the window do not grow the table
+        table.price(990)
+        self.assertEqual(len(table), 201)
+
+        table.price(1010)
+        self.assertEqual(len(table), 302)
+        self.assertEqual(table.price(-1000), np.power(1.0001, -1000))
+
+    def test_max_size(self):
+
+        table = TickTable(window=10, max_size=100)
+
+        table.price(0)
+        self.assertEqual(table.price(10000), np.power(1.0001, 10000))
+        self.assertEqual(len(table), 21)
+
+    def test_vector_lookups(self):
+
+        table = TickTable(tick_spacing=60)
+        ticks = np.array([[-600, 0], [60, 120000]])
+
+        np.testing.assert_array_equal(table.sqrt_prices_for(ticks), np.power(1.0001, ticks / 2))
+        np.testing.assert_array_equal(table.prices_for(ticks), np.power(1.0001, ticks.astype(np.float64)))
+        self.assertEqual(list(table.sqrt_prices_x96_for(ticks[0])), [get_sqrt_ratio_at_tick(-600), get_sqrt_ratio_at_tick(0)])
+
+        # unaligned ticks are computed directly
+        np.testing.assert_allclose(table.prices_for([30.0, 60.0]), [math.pow(1.0001, 30), math.pow(1.0001, 60)], rtol=1e-15)
+
+    def test_shared_table(self):
+
+        self.assertIs(get_tick_table(10), get_tick_table(10))
+        self.assertIsNot(get_tick_table(10), get_tick_table(60))
+
+    def test_positions_use_the_table_of_their_spacing(self):
+
+        position = Position(0, -600, 600, 10**18, 0, 0, tick_spacing=60)
+
+        self.assertIs(position.tick_table, get_tick_table(60))
+        self.assertIs(PositionBook.from_positions([position]).tick_table, get_tick_table(60))
+        self.assertIs(Position(0, -10, 10, 1, 0, 0).tick_table, get_tick_table(1))
+
+
+if __name__ == '__main__':
+    unittest.main()
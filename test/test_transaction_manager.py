@@ -0,0 +1,240 @@
+import time
+import unittest
+from types import SimpleNamespace
+
+from hexbytes import HexBytes
+from web3.exceptions import TransactionNotFound
+
+from src.fee_policy import FeePolicy
+from src.transaction_manager import TransactionManager, TransactionReverted
+
+
+class FakeFunction:
+
+    def __init__(self, name):
+        self.name = name
+        self.fn_name = name
+        self.args = ()
+
+    def estimate_gas(self, params):
+        return 40000
+
+    def build_transaction(self, params):
+        return {"data": self.name, "maxFeePerGas": 100, "maxPriorityFeePerGas": 10, **params}
+
+
+class FakeEth:
+
+    def __init__(self, nonce=7):
+
+        self.nonce = nonce
+        self.confirmed_nonce = nonce
+        self.transaction_count_calls = 0
+
+        self.sent = []
+        self.receipts = {}
+        self.fail_next_send = False
+        self.fail_next_receipt = False
+
+        self.account = SimpleNamespace(sign_transaction=lambda transaction, key: SimpleNamespace(raw_transaction=transaction))
+
+    def get_transaction_count(self, address, block="latest"):
+
+        if block == "pending":
+            self.transaction_count_calls += 1
+            return self.nonce
+
+        return self.confirmed_nonce
+
+    def send_raw_transaction(self, transaction):
+
+        if self.fail_next_send:
+            self.fail_next_send = False
+            raise ValueError("nonce too low")
+
+        transaction_hash = HexBytes(len(self.sent).to_bytes(32, "big"))
+        self.sent.append((transaction_hash, transaction))
+
+        return transaction_hash
+
+    def get_transaction_receipt(self, transaction_hash):
+
+        if self.fail_next_receipt:
+            self.fail_next_receipt = False
+            raise ConnectionError("connection reset")
+
+        if transaction_hash not in self.receipts:
+            raise TransactionNotFound(f"{transaction_hash} not found")
+
+        return self.receipts[transaction_hash]
+
+    def fee_history(self, block_count, newest_block, reward_percentiles):
+        return {"baseFeePerGas": [4, 5], "reward": [[1, 2, 3]]}
+
+    def mine(self, transaction_hash, status=1, logs=()):
+
+        nonce = dict(self.sent)[transaction_hash]["nonce"]
+        self.receipts[transaction_hash] = {"transactionHash": transaction_hash, "status": status, "gasUsed": 50000, "effectiveGasPrice": 20, "logs": list(logs)}
+        self.confirmed_nonce = max(self.confirmed_nonce, nonce + 1)
+
+
+class TestTransactionManager(unittest.TestCase):
+
+    def setUp(self):
+
+        self.eth = FakeEth()
+        self.manager = TransactionManager(SimpleNamespace(eth=self.eth), SimpleNamespace(address="0xabc", key=None), bump_after=0.2, poll_interval=0.01)
+
+    def test_pipelined_with_local_nonces(self):
+
+        approve = self.manager.submit(FakeFunction("approve"), {"gas": 100000})
+        swap = self.manager.submit(FakeFunction("swap"))
+        mint = self.manager.submit(FakeFunction("mint"))
+
+        # all sent before any of them is mined, the nonce is read once
+        self.assertEqual([transaction["nonce"] for _, transaction in self.eth.sent], [7, 8, 9])
+        self.assertEqual(self.eth.transaction_count_calls, 1)
+        self.assertEqual(self.eth.sent[0][1]["gas"], 100000)
+        self.assertFalse(approve.done())
+
+        for pending_transaction in (approve, swap, mint):
+            self.eth.mine(pending_transaction.hash)
+
+        receipts = self.manager.wait_all([approve, swap, mint], timeout=5)
+
+        self.assertEqual([transaction_hash for transaction_hash, _ in receipts], [approve.hash, swap.hash, mint.hash])
+        self.assertEqual(self.manager.pending, {})
+
+    def test_poll_error_is_retried(self):
+
+        # the first poll fails, e.g. the node timed out
+        self.eth.fail_next_receipt = True
+
+        pending_transaction = self.manager.submit(FakeFunction("mint"))
+        self.eth.mine(pending_transaction.hash)
+
+        transaction_hash, receipt = pending_transaction.wait(timeout=5)
+
+        self.assertEqual(transaction_hash, pending_transaction.hash)
+        self.assertFalse(self.eth.fail_next_receipt)
+        self.assertTrue(self.manager.thread.is_alive())
+
+    def test_stuck_transaction_is_bumped(self):
+
+        pending_transaction = self.manager.submit(FakeFunction("mint"))
+        first_hash = pending_transaction.hash
+
+        deadline = time.monotonic() + 5
+        while len(pending_transaction.hashes) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        replacement_hash, replacement = self.eth.sent[1]
+
+        self.assertNotEqual(replacement_hash, first_hash)
+        self.assertEqual(replacement["nonce"], 7)
+        self.assertEqual(replacement["maxFeePerGas"], 113)
+        self.assertEqual(replacement["maxPriorityFeePerGas"], 12)
+
+        # the replacement is mined
+        self.eth.mine(replacement_hash)
+
+        transaction_hash, receipt = pending_transaction.wait(timeout=5)
+
+        self.assertEqual(transaction_hash, replacement_hash)
+        self.assertEqual(receipt["status"], 1)
+
+    def test_failed_send_rereads_nonce(self):
+
+        self.eth.fail_next_send = True
+
+        with self.assertRaises(ValueError):
+            self.manager.submit(FakeFunction("approve"))
+
+        self.eth.nonce = 8
+        pending_transaction = self.manager.submit(FakeFunction("approve"))
+
+        self.assertEqual(pending_transaction.nonce, 8)
+        self.assertEqual(self.eth.transaction_count_calls, 2)
+
+    def test_nonce_used_by_another_transaction(self):
+
+        pending_transaction = self.manager.submit(FakeFunction("approve"))
+
+        # a transaction sent from somewhere else was mined with the same nonce
+        self.eth.confirmed_nonce = 8
+
+        with self.assertRaises(RuntimeError):
+            pending_transaction.wait(timeout=5)
+
+    def test_revert_fails_fast(self):
+
+        approve = self.manager.submit(FakeFunction("approve"))
+        mint = self.manager.submit(FakeFunction("mint"))
+
+        self.eth.mine(approve.hash, status=0)
+
+        # the mint depending on the approval is not waited for
+        with self.assertRaises(TransactionReverted) as context:
+            self.manager.wait_all([approve, mint], timeout=5)
+
+        self.assertEqual(context.exception.transaction_hash, approve.hash)
+        self.assertFalse(mint.done())
+
+        # the gas of the reverted transaction is still spent
+        self.assertEqual(self.manager.gas_spent, 50000 * 20)
+
+    def test_wait_all_timeout(self):
+
+        approve = self.manager.submit(FakeFunction("approve"))
+
+        with self.assertRaises(TimeoutError):
+            self.manager.wait_all([approve], timeout=0.05)
+
+    def test_fee_policy(self):
+
+        self.manager.fee_policy = FeePolicy(SimpleNamespace(eth=self.eth), min_priority_fee=0)
+
+        approve = self.manager.submit(FakeFunction("approve"), {"gas": 100000})
+        swap = self.manager.submit(FakeFunction("swap"), {"gas": 500000}, urgency="high")
+
+        approve_transaction, swap_transaction = self.eth.sent[0][1], self.eth.sent[1][1]
+
+        # estimated while nothing is pending, the swap may depend on the approval
+        self.assertEqual(approve_transaction["gas"], 48000)
+        self.assertEqual(swap_transaction["gas"], 500000)
+
+        self.assertEqual(approve_transaction["maxPriorityFeePerGas"], 2)
+        self.assertEqual(swap_transaction["maxPriorityFeePerGas"], 3)
+        self.assertEqual(swap_transaction["maxFeePerGas"], 2 * 5 + 3)
+
+        for pending_transaction in (approve, swap):
+            self.eth.mine(pending_transaction.hash)
+
+        self.manager.wait_all([approve, swap], timeout=5)
+
+        self.assertEqual(self.manager.gas_spent, 2 * 50000 * 20)
+
+    def test_queued_gas_limit_is_learned(self):
+
+        self.manager.fee_policy = FeePolicy(SimpleNamespace(eth=self.eth), min_priority_fee=0)
+
+        approve = self.manager.submit(FakeFunction("approve"))
+        queued_approve = self.manager.submit(FakeFunction("approve"))
+        swap = self.manager.submit(FakeFunction("exactInputSingle"))
+
+        # the queued approval uses the estimate of the first one, the swap the default
+        self.assertEqual([transaction["gas"] for _, transaction in self.eth.sent], [48000, 48000, 500000])
+
+        for pending_transaction in (approve, queued_approve, swap):
+            self.eth.mine(pending_transaction.hash)
+
+        self.manager.wait_all([approve, queued_approve, swap], timeout=5)
+
+        # learned from the gas the swap used
+        self.manager.submit(FakeFunction("approve"))
+        self.manager.submit(FakeFunction("exactInputSingle"))
+        self.assertEqual(self.eth.sent[-1][1]["gas"], 60000)
+
+
+if __name__ == '__main__':
+    unittest.main()
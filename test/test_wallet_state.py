@@ -0,0 +1,134 @@
+import unittest
+from types import SimpleNamespace
+
+from web3 import Web3
+from hexbytes import HexBytes
+
+from src.wallet_state import WalletState, TRANSFER_TOPIC, DEPOSIT_TOPIC
+from src.allowance_manager import AllowanceManager
+from src.transaction_manager import TransactionManager
+
+from test.test_transaction_manager import FakeEth, FakeFunction
+
+OWNER = Web3.to_checksum_address("0x" + "aa" * 20)
+TOKEN0 = Web3.to_checksum_address("0x" + "01" * 20)
+WETH = Web3.to_checksum_address("0x" + "02" * 20)
+ROUTER = Web3.to_checksum_address("0x" + "0c" * 20)
+NFT = Web3.to_checksum_address("0x" + "0d" * 20)
+OTHER = Web3.to_checksum_address("0x" + "ee" * 20)
+
+
+class FakeToken:
+
+    def __init__(self, address, balance, allowances):
+
+        self.address = address
+        self.functions = SimpleNamespace(
+            balanceOf=lambda owner: ("balanceOf", balance),
+            allowance=lambda owner, spender: ("allowance", allowances[spender]),
+            approve=lambda spender, value: FakeFunction("approve"),
+        )
+
+
+class FakeMulticall:
+
+    def __init__(self, eth_balance):
+
+        self.calls = 0
+        self.contract = SimpleNamespace(functions=SimpleNamespace(getEthBalance=lambda owner: ("getEthBalance", eth_balance)))
+
+    def aggregate(self, calls, block_identifier="latest"):
+
+        self.calls += 1
+        return [value for _, value in calls]
+
+
+def topic(address):
+    return HexBytes(bytes(12) + bytes.fromhex(address[2:]))
+
+def log(address, topics, value):
+    return {"address": address, "topics": topics, "data": HexBytes(value.to_bytes(32, "big"))}
+
+
+class TestWalletState(unittest.TestCase):
+
+    def setUp(self):
+
+        self.eth = FakeEth(nonce=3)
+        self.transactions = TransactionManager(SimpleNamespace(eth=self.eth), SimpleNamespace(address=OWNER, key=None), poll_interval=0.01)
+        self.allowances = AllowanceManager(self.transactions, OWNER)
+
+        self.multicall = FakeMulticall(eth_balance=10**18)
+        self.tokens = [FakeToken(TOKEN0, 500, {ROUTER: 0, NFT: 1000}), FakeToken(WETH, 7, {ROUTER: 0, NFT: 0})]
+
+        self.wallet = WalletState(self.multicall, OWNER, self.tokens, [ROUTER, NFT], self.transactions, self.allowances, weth=WETH)
+
+    def test_snapshot_in_one_request(self):
+
+        snapshot = self.wallet.snapshot()
+        self.wallet.snapshot()
+
+        self.assertEqual(self.multicall.calls, 1)
+
+        self.assertEqual(snapshot["eth"], 10**18)
+        self.assertEqual(snapshot["balances"], {TOKEN0: 500, WETH: 7})
+        self.assertEqual(snapshot["allowances"][(TOKEN0, NFT)], 1000)
+        self.assertEqual(snapshot["nonce"], 3)
+
+        # the allowance manager knows the allowances -> no call and no approval
+        self.assertIsNone(self.allowances.ensure(self.tokens[0], NFT, 400))
+        self.assertEqual(self.eth.sent, [])
+
+    def test_update_from_receipts(self):
+
+        self.wallet.snapshot()
+
+        wrap = self.transactions.submit(FakeFunction("deposit"), {"value": 100})
+        mint = self.transactions.submit(FakeFunction("mint"))
+
+        self.eth.mine(wrap.hash, logs=[log(WETH, [HexBytes(DEPOSIT_TOPIC), topic(OWNER)], 100)])
+        self.eth.mine(mint.hash, logs=[
+            log(TOKEN0, [HexBytes(TRANSFER_TOPIC), topic(OWNER), topic(NFT)], 200),
+            log(WETH, [HexBytes(TRANSFER_TOPIC), topic(OWNER), topic(NFT)], 50),
+            # transfer of somebody else
+            log(TOKEN0, [HexBytes(TRANSFER_TOPIC), topic(OTHER), topic(NFT)], 1),
+        ])
+
+        self.transactions.wait_all([wrap, mint], timeout=5)
+
+        snapshot = self.wallet.snapshot()
+
+        self.assertEqual(self.multicall.calls, 1)
+        self.assertEqual(snapshot["balances"], {TOKEN0: 300, WETH: 57})
+        self.assertEqual(snapshot["eth"], 10**18 - 100 - 2 * 50000 * 20)
+        self.assertEqual(snapshot["nonce"], 5)
+
+    def test_refreshed_after_max_age(self):
+
+        self.wallet.max_age = -1
+
+        self.wallet.snapshot()
+        self.wallet.snapshot()
+
+        self.assertEqual(self.multicall.calls, 2)
+
+    def test_failed_calls(self):
+
+        # the allowance call of the router failed -> not known, read when it is needed
+        self.tokens[0] = FakeToken(TOKEN0, 500, {ROUTER: None, NFT: 1000})
+
+        snapshot = self.wallet.snapshot()
+
+        self.assertIsNone(snapshot["allowances"][(TOKEN0, ROUTER)])
+        self.assertEqual(snapshot["allowances"][(TOKEN0, NFT)], 1000)
+        self.assertNotIn((TOKEN0, ROUTER), self.allowances.allowances)
+
+        # without a balance the wallet state is not usable
+        self.tokens[1] = FakeToken(WETH, None, {ROUTER: 0, NFT: 0})
+
+        with self.assertRaises(RuntimeError):
+            self.wallet.refresh()
+
+
+if __name__ == '__main__':
+    unittest.main()